@@ -0,0 +1,214 @@
+import json
+import math
+from typing import Any, Iterator
+
+import numcodecs
+import numpy as np
+from botocore.exceptions import ClientError
+
+from core.chunkcache import ChunkCache
+from core.metadata import ZarrMetadata, parse_zarray
+
+
+BLOSC_SHUFFLE = {"noshuffle": 0, "shuffle": 1, "bitshuffle": 2}
+
+
+class UnsupportedZarrArray(Exception):
+    """Raised when a zarr array uses a feature the server can not decode"""
+
+
+def _v3_codec(codec: dict[str, Any]) -> numcodecs.abc.Codec:
+    name = codec["name"]
+    configuration = dict(codec.get("configuration") or {})
+
+    if name == "blosc":
+        configuration["shuffle"] = BLOSC_SHUFFLE.get(configuration.get("shuffle"), configuration.get("shuffle", 1))
+        configuration.pop("typesize", None)
+        return numcodecs.Blosc(**configuration)
+    if name in ("gzip", "zstd"):
+        return numcodecs.get_codec({"id": name, **configuration})
+
+    raise UnsupportedZarrArray(f"Unsupported zarr v3 codec {name}")
+
+
+class ZarrArray:
+    """Reads the chunks of a zarr (v2 or v3) array directly from S3
+
+    Only what is needed to read traces server side is supported: regular
+    chunk grids, the numcodecs compressors and the 'bytes' codec. Sharded
+    v3 arrays raise UnsupportedZarrArray.
+
+    If a cache is given, chunks are read through it.
+    """
+
+    def __init__(self, s3: Any, bucket: str, metadata: ZarrMetadata, cache: ChunkCache | None = None) -> None:
+        """Open the array described by the metadata, reading chunks through cache if given"""
+        self.s3 = s3
+        self.bucket = bucket
+        self.metadata = metadata
+        self.cache = cache
+        self.shape = list(metadata.shape)
+        self.chunks = list(metadata.chunks)
+        document = metadata.document
+
+        if metadata.version == "2":
+            self.dtype = np.dtype(document.get("dtype", metadata.dtype))
+            self.order = document.get("order", "C")
+            self.fill_value = document.get("fill_value")
+            self.separator = document.get("dimension_separator", ".")
+            self.key_prefix = ""
+            self.checksum = False
+            self.codecs = [numcodecs.get_codec(f) for f in reversed(document.get("filters") or [])]
+            if document.get("compressor"):
+                self.codecs.insert(0, numcodecs.get_codec(document["compressor"]))
+        else:
+            self.order = "C"
+            self.fill_value = document.get("fill_value")
+            self.checksum = False
+            encoding = document.get("chunk_key_encoding") or {"name": "default"}
+            self.separator = (encoding.get("configuration") or {}).get("separator", "/" if encoding["name"] == "default" else ".")
+            self.key_prefix = "c/" if encoding["name"] == "default" else ""
+
+            endian = "little"
+            self.codecs = []
+            for codec in document.get("codecs") or [{"name": "bytes"}]:
+                if codec["name"] == "bytes":
+                    endian = (codec.get("configuration") or {}).get("endian", "little")
+                elif codec["name"] == "crc32c":
+                    self.checksum = True
+                elif codec["name"] == "transpose":
+                    order = list((codec.get("configuration") or {}).get("order", []))
+                    if order == list(reversed(range(len(self.shape)))):
+                        self.order = "F"
+                    elif order != list(range(len(self.shape))):
+                        raise UnsupportedZarrArray("Only C and F order transposes are supported")
+                elif codec["name"] == "sharding_indexed":
+                    raise UnsupportedZarrArray("Sharded zarr arrays are not supported")
+                else:
+                    self.codecs.insert(0, _v3_codec(codec))
+
+            self.dtype = np.dtype(metadata.dtype).newbyteorder("<" if endian == "little" else ">")
+
+    @classmethod
+    def create(cls, s3: Any, bucket: str, key: str, shape: list[int], chunks: list[int], dtype: np.dtype) -> "ZarrArray":
+        """Create an uncompressed zarr v2 array under key"""
+        document = {
+            "zarr_format": 2,
+            "shape": shape,
+            "chunks": chunks,
+            "dtype": np.dtype(dtype).str,
+            "compressor": None,
+            "fill_value": None,
+            "filters": None,
+            "order": "C",
+        }
+        s3.put_object(Bucket=bucket, Key=f"{key}/.zarray", Body=json.dumps(document))
+        return cls(s3, bucket, parse_zarray(document, f"{key}/.zarray"))
+
+    def chunk_key(self, index: tuple[int, ...]) -> str:
+        """The S3 key of the chunk at index"""
+        return f"{self.metadata.array_key}/{self.key_prefix}{self.separator.join(str(i) for i in index)}"
+
+    def _get(self, key: str) -> bytes | None:
+        """The encoded chunk, None if it does not exist"""
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+                return None
+            raise
+
+    def read_chunk(self, index: tuple[int, ...], out: np.ndarray | None = None) -> np.ndarray:
+        """Read a (full size) chunk, missing chunks are filled with the fill value
+
+        If out (a C contiguous array of the chunk shape) is given, the chunk is
+        decoded straight into it where the codecs allow it.
+        """
+        key = self.chunk_key(index)
+        if self.cache is not None:
+            data = self.cache.get((self.bucket, key, self.metadata.etag or ""), lambda: self._get(key))
+        else:
+            data = self._get(key)
+
+        if data is None:
+            fill = np.nan if self.fill_value in ("NaN", None) and self.dtype.kind == "f" else (self.fill_value or 0)
+            if out is not None:
+                out[...] = fill
+                return out
+            return np.full(self.chunks, fill, dtype=self.dtype)
+
+        if self.checksum:
+            data = data[:-4]
+
+        if out is not None and len(self.codecs) == 1 and self.order == "C" and out.dtype == self.dtype:
+            self.codecs[0].decode(data, out=out)
+            return out
+
+        for codec in self.codecs:
+            data = codec.decode(data)
+
+        chunk = np.frombuffer(data, dtype=self.dtype).reshape(self.chunks, order=self.order)
+        if out is not None:
+            out[...] = chunk
+            return out
+        return chunk
+
+    def write_chunk(self, index: tuple[int, ...], data: np.ndarray) -> None:
+        """Write an (uncompressed, C order) chunk, partial edge chunks are padded"""
+        if list(data.shape) != self.chunks:
+            padded = np.zeros(self.chunks, dtype=self.dtype)
+            padded[tuple(slice(0, s) for s in data.shape)] = data
+            data = padded
+
+        self.s3.put_object(Bucket=self.bucket, Key=self.chunk_key(index), Body=np.ascontiguousarray(data, dtype=self.dtype).tobytes())
+
+    def read(self, start: int, stop: int, step: int = 1, out: np.ndarray | None = None) -> np.ndarray:
+        """Read the rows start:stop:step (along the first axis) of the array
+
+        The rows are written into out if it is given (e.g. to convert the
+        byte order on the fly). Chunks that fill a contiguous part of the
+        output are decoded straight into it.
+        """
+        start, stop = max(start, 0), min(stop, self.shape[0])
+        rows = len(range(start, stop, step))
+        if out is None:
+            out = np.empty([rows, *self.shape[1:]], dtype=self.dtype)
+        if not rows:
+            return out
+
+        grid = [math.ceil(s / c) for s, c in zip(self.shape[1:], self.chunks[1:])]
+        row = self.chunks[0]
+        # The chunk rows can only be decoded in place if a chunk spans all other axes
+        whole_rows = step == 1 and self.chunks[1:] == self.shape[1:] and out.flags.c_contiguous
+
+        for i in range(start // row, (stop - 1) // row + 1):
+            lo, hi = max(start, i * row), min(stop, (i + 1) * row)
+            # Align to the step grid
+            lo = start + math.ceil((lo - start) / step) * step
+            if lo >= hi:
+                continue
+
+            target_rows = slice((lo - start) // step, (hi - 1 - start) // step + 1)
+            if whole_rows and lo == i * row and hi == (i + 1) * row:
+                self.read_chunk((i, *[0] * len(grid)), out=out[target_rows])
+                continue
+
+            for rest in np.ndindex(*grid):
+                chunk = self.read_chunk((i, *rest))
+                target = [target_rows]
+                source = [slice(lo - i * row, hi - i * row, step)]
+                for j, c, s in zip(rest, self.chunks[1:], self.shape[1:]):
+                    target.append(slice(j * c, min((j + 1) * c, s)))
+                    source.append(slice(0, min(c, s - j * c)))
+                out[tuple(target)] = chunk[tuple(source)]
+
+        return out
+
+    def iter_rows(self, start: int = 0, stop: int | None = None) -> Iterator[np.ndarray]:
+        """Iterate over the rows start:stop (along the first axis), one row of chunks at a time"""
+        stop = self.shape[0] if stop is None else min(stop, self.shape[0])
+        row = self.chunks[0]
+        while start < stop:
+            end = min(stop, (start // row + 1) * row)
+            yield self.read(start, end)
+            start = end
@@ -1,29 +1,67 @@
+import datetime
+import json
+from typing import Any, AsyncIterator, Iterable, TypeVar
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.db.models import JSONField, Model
 from kante.channel import build_channel
 from pydantic import BaseModel
 
+from core import outbox
+
+M = TypeVar("M", bound=Model)
+
 
 class TraceSignal(BaseModel):
     """A model representing a base signal."""
     create: int | None = None
+    create_many: list[int] | None = None
     update: int | None = None
+    update_many: list[int] | None = None
     delete: int | None = None
+    delete_many: list[int] | None = None
+    snapshot: dict[str, Any] | None = None
+    snapshots: list[dict[str, Any]] | None = None
     
     
 class RoiSignal(BaseModel):
     """A model representing a ROI signal."""
     create: int | None = None
+    create_many: list[int] | None = None
     update: int | None = None
+    update_many: list[int] | None = None
     delete: int | None = None
+    delete_many: list[int] | None = None
+    snapshot: dict[str, Any] | None = None
+    snapshots: list[dict[str, Any]] | None = None
     
     
 class FileSignal(BaseModel):
     """A model representing a file signal."""
     create: int | None = None
+    create_many: list[int] | None = None
     update: int | None = None
+    update_many: list[int] | None = None
     delete: int | None = None
+    delete_many: list[int] | None = None
+    snapshot: dict[str, Any] | None = None
+    snapshots: list[dict[str, Any]] | None = None
 
 
 
+class DatasetSignal(BaseModel):
+    """A model representing a dataset signal."""
+    create: int | None = None
+    create_many: list[int] | None = None
+    update: int | None = None
+    update_many: list[int] | None = None
+    delete: int | None = None
+    delete_many: list[int] | None = None
+    snapshot: dict[str, Any] | None = None
+    snapshots: list[dict[str, Any]] | None = None
+
+
 trace_channel = build_channel(
     TraceSignal
 )
@@ -34,4 +72,142 @@ roi_channel = build_channel(
 
 file_channel = build_channel(
     FileSignal
-)
\ No newline at end of file
+)
+
+dataset_channel = build_channel(
+    DatasetSignal
+)
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """Keeps the microseconds of times, which DjangoJSONEncoder drops (e.g. needed by the created_at cursors)"""
+
+    def default(self, o: Any) -> Any:
+        """Encode datetimes and times as ISO strings"""
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def snapshot(instance: Model) -> dict[str, Any]:
+    """The columns of a row (without its JSON fields), JSON serializable, for fat change events
+
+    The snapshot is taken once by the sender, so subscribers can resolve
+    the changed row without reading it again.
+    """
+    values = {field.attname: field.value_from_object(instance) for field in instance._meta.concrete_fields if not isinstance(field, JSONField)}
+    return json.loads(json.dumps(values, cls=SnapshotEncoder))
+
+
+def restore(model: type[M], snapshot: dict[str, Any]) -> M:
+    """The row of a snapshot, the fields that are not in the snapshot are deferred (and read from the database on access)"""
+    fields = [field for field in model._meta.concrete_fields if field.attname in snapshot]
+    return model.from_db(
+        router.db_for_read(model),
+        [field.attname for field in fields],
+        [field.to_python(snapshot[field.attname]) for field in fields],
+    )
+
+
+async def aresolve_changes(model: type[M], changes: list[tuple[str, int, dict[str, Any] | None]]) -> AsyncIterator[tuple[str, int, M | None]]:
+    """The changed rows of a batch of (action, id, snapshot) changes
+
+    Rows are built from their snapshot, the ones without are read with one
+    query. Deleted rows (and rows that are gone by now) have no instance.
+    """
+    missing = [id for action, id, snapshot in changes if action != "delete" and snapshot is None]
+    fetched = await model.objects.ain_bulk(missing) if missing else {}
+
+    for action, id, snapshot in changes:
+        if action == "delete":
+            yield action, id, None
+        elif snapshot is not None:
+            yield action, id, restore(model, snapshot)
+        elif id in fetched:
+            yield action, id, fetched[id]
+
+
+def organization_traces_group(organization_id: int) -> str:
+    """The group that follows the traces of an organization"""
+    return f"organization_traces_{organization_id}"
+
+
+def dataset_traces_group(dataset_id: int) -> str:
+    """The group that follows the traces of a dataset"""
+    return f"dataset_images_{dataset_id}"
+
+
+def trace_groups(organization_id: int, dataset_id: int | None) -> list[str]:
+    """The groups that follow a trace: its organization and its dataset"""
+    groups = [organization_traces_group(organization_id)]
+    if dataset_id is not None:
+        groups.append(dataset_traces_group(dataset_id))
+    return groups
+
+
+def broadcast_traces(action: str, traces: Iterable[tuple[int, int, int | None]], snapshots: dict[int, dict[str, Any]] | None = None) -> None:
+    """Publish the changed traces, as (id, organization_id, dataset_id), to the groups that follow them
+
+    Every group gets one message with only its own traces, so subscribers
+    never receive changes of other organizations or datasets. Inside a
+    transaction the changes are batched and published on commit (see
+    core.outbox).
+    """
+    snapshots = snapshots or {}
+    outbox.publish(
+        trace_channel,
+        action,
+        [(id, trace_groups(organization_id, dataset_id), snapshots.get(id)) for id, organization_id, dataset_id in traces],
+    )
+
+
+def organization_files_group(organization_id: int) -> str:
+    """The group that follows the files of an organization"""
+    return f"organization_files_{organization_id}"
+
+
+def dataset_files_group(dataset_id: int) -> str:
+    """The group that follows the files of a dataset"""
+    return f"dataset_files_{dataset_id}"
+
+
+def file_groups(organization_id: int | None, dataset_id: int | None) -> list[str]:
+    """The groups that follow a file: the organization and the dataset it is in"""
+    groups = []
+    if organization_id is not None:
+        groups.append(organization_files_group(organization_id))
+    if dataset_id is not None:
+        groups.append(dataset_files_group(dataset_id))
+    return groups
+
+
+def broadcast_files(action: str, files: Iterable[tuple[int, int | None, int | None]], snapshots: dict[int, dict[str, Any]] | None = None) -> None:
+    """Publish the changed files, as (id, organization_id, dataset_id), to the groups that follow them
+
+    Files belong to the organization of their dataset, files without a
+    dataset are not followed by any group.
+    """
+    snapshots = snapshots or {}
+    outbox.publish(
+        file_channel,
+        action,
+        [(id, file_groups(organization_id, dataset_id), snapshots.get(id)) for id, organization_id, dataset_id in files if dataset_id is not None],
+    )
+
+
+def dataset_children_group(parent_id: int) -> str:
+    """The group that follows the child datasets of a dataset"""
+    return f"dataset_children_{parent_id}"
+
+
+def broadcast_datasets(action: str, datasets: Iterable[tuple[int, int | None]], snapshots: dict[int, dict[str, Any]] | None = None) -> None:
+    """Publish the changed datasets, as (id, parent_id), to the group of their parent
+
+    Top level datasets are not followed by any group.
+    """
+    snapshots = snapshots or {}
+    outbox.publish(
+        dataset_channel,
+        action,
+        [(id, [dataset_children_group(parent_id)], snapshots.get(id)) for id, parent_id in datasets if parent_id is not None],
+    )
@@ -0,0 +1,256 @@
+import atexit
+import hashlib
+import mmap
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+
+from core import metrics
+
+memory_hits = metrics.counter("chunk_cache_memory_hits", "Chunk reads answered from the memory tier")
+disk_hits = metrics.counter("chunk_cache_disk_hits", "Chunk reads answered from the disk tier")
+misses = metrics.counter("chunk_cache_misses", "Chunk reads that had to fetch the chunk from S3")
+memory_evictions = metrics.counter("chunk_cache_memory_evictions", "Chunks moved from the memory to the disk tier")
+disk_evictions = metrics.counter("chunk_cache_disk_evictions", "Chunks dropped from the disk tier")
+bytes_served = metrics.counter("chunk_cache_bytes_served", "Bytes of chunks served through the cache")
+missing_hits = metrics.counter("chunk_cache_missing_hits", "Reads of chunks that were recently found to not exist")
+
+# (bucket, chunk key, etag of the array metadata)
+ChunkKey = tuple[str, str, str]
+
+# At most this many missing chunks are remembered
+MAX_MISSING = 65536
+
+
+class ChunkCache:
+    """A two tier LRU cache of (encoded) zarr chunks
+
+    Chunks are kept in memory until the memory budget is exceeded, the
+    least recently used ones are then moved to files on disk, which are
+    served memory mapped until the disk budget is exceeded. Concurrent reads
+    of the same missing chunk fetch it only once.
+
+    Chunks that do not exist (sparse arrays) are remembered for
+    missing_timeout seconds, so they are not fetched again on every read.
+
+    Entries are keyed by the etag of the array metadata, so rewriting an
+    array (which rewrites its metadata) invalidates its chunks.
+    """
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, disk_path: str | None, missing_timeout: float = 60) -> None:
+        """Keep chunks in memory (up to memory_bytes) and on disk (up to disk_bytes), and missing chunks for missing_timeout seconds"""
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes if disk_path else 0
+        # Every process gets its own directory, the index of the disk tier is process local
+        self.disk_path = Path(disk_path) / str(os.getpid()) if disk_path else None
+        self.missing_timeout = missing_timeout
+
+        self._memory: OrderedDict[ChunkKey, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict[ChunkKey, int] = OrderedDict()
+        self._disk_size = 0
+        self._disk_ready = False
+        self._missing: OrderedDict[ChunkKey, float] = OrderedDict()
+        self._flights: dict[ChunkKey, threading.Lock] = {}
+        self._waiting: dict[ChunkKey, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: ChunkKey, fetch: Callable[[], bytes | None]) -> bytes | memoryview | None:
+        """Get the chunk, calling fetch (once, even for concurrent readers) if it is not cached
+
+        fetch returns None if the chunk does not exist, get then returns None too.
+        """
+        value = self._lookup(key)
+
+        if value is None:
+            if self._is_missing(key):
+                return None
+
+            with self._lock:
+                flight = self._flights.setdefault(key, threading.Lock())
+                self._waiting[key] = self._waiting.get(key, 0) + 1
+
+            try:
+                with flight:
+                    # Another reader might have fetched the chunk while we waited
+                    value = self._lookup(key)
+                    if value is None and not self._is_missing(key):
+                        misses.inc()
+                        value = fetch()
+                        if value is None:
+                            self._remember_missing(key)
+                        else:
+                            self._put(key, value)
+            finally:
+                with self._lock:
+                    # The flight is dropped once no reader uses it anymore
+                    self._waiting[key] -= 1
+                    if not self._waiting[key]:
+                        del self._waiting[key]
+                        del self._flights[key]
+
+            if value is None:
+                return None
+
+        bytes_served.inc(len(value))
+        return value
+
+    def clear(self) -> None:
+        """Forget all cached and missing chunks"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            self._missing.clear()
+            disk, self._disk = self._disk, OrderedDict()
+            self._disk_size = 0
+
+        for key in disk:
+            self._remove_file(key)
+
+    def _lookup(self, key: ChunkKey) -> bytes | memoryview | None:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                memory_hits.inc()
+                return value
+
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+
+        value = self._read_file(key)
+        if value is None:
+            # The file is gone (e.g. evicted concurrently)
+            return None
+
+        disk_hits.inc()
+        return value
+
+    def _is_missing(self, key: ChunkKey) -> bool:
+        with self._lock:
+            expires = self._missing.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._missing[key]
+                return False
+
+        missing_hits.inc()
+        return True
+
+    def _remember_missing(self, key: ChunkKey) -> None:
+        with self._lock:
+            self._missing[key] = time.monotonic() + self.missing_timeout
+            self._missing.move_to_end(key)
+            while len(self._missing) > MAX_MISSING:
+                self._missing.popitem(last=False)
+
+    def _put(self, key: ChunkKey, value: bytes) -> None:
+        if len(value) > self.memory_bytes:
+            self._write_file(key, value)
+            return
+
+        evicted = []
+        with self._lock:
+            if key not in self._memory:
+                self._memory[key] = value
+                self._memory_size += len(value)
+
+            while self._memory_size > self.memory_bytes:
+                old_key, old_value = self._memory.popitem(last=False)
+                self._memory_size -= len(old_value)
+                evicted.append((old_key, old_value))
+
+        for old_key, old_value in evicted:
+            memory_evictions.inc()
+            self._write_file(old_key, old_value)
+
+    def _path(self, key: ChunkKey) -> Path:
+        assert self.disk_path is not None
+        return self.disk_path / hashlib.sha256("\0".join(key).encode()).hexdigest()
+
+    def _prepare_disk(self) -> None:
+        """Create the directory of the disk tier on first use, dropping what a previous process with the same pid left"""
+        with self._lock:
+            if self._disk_ready:
+                return
+            assert self.disk_path is not None
+            shutil.rmtree(self.disk_path, ignore_errors=True)
+            self.disk_path.mkdir(parents=True, exist_ok=True)
+            self._disk_ready = True
+
+    def close(self) -> None:
+        """Drop all entries and remove the directory of the disk tier"""
+        self.clear()
+        with self._lock:
+            if self._disk_ready:
+                shutil.rmtree(self.disk_path, ignore_errors=True)
+                self._disk_ready = False
+
+    def _write_file(self, key: ChunkKey, value: bytes) -> None:
+        if len(value) > self.disk_bytes:
+            return
+
+        self._prepare_disk()
+        path = self._path(key)
+        temporary = path.with_suffix(f".{threading.get_ident()}.tmp")
+        temporary.write_bytes(value)
+        os.replace(temporary, path)
+
+        evicted = []
+        with self._lock:
+            if key in self._disk:
+                self._disk_size -= self._disk.pop(key)
+            self._disk[key] = len(value)
+            self._disk_size += len(value)
+
+            while self._disk_size > self.disk_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            disk_evictions.inc()
+            self._remove_file(old_key)
+
+    def _read_file(self, key: ChunkKey) -> bytes | memoryview | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+
+    def _remove_file(self, key: ChunkKey) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+_chunk_cache: ChunkCache | None = None
+_chunk_cache_lock = threading.Lock()
+
+
+def get_chunk_cache() -> ChunkCache:
+    """The process wide chunk cache, created on first use"""
+    global _chunk_cache
+    with _chunk_cache_lock:
+        if _chunk_cache is None or _chunk_cache.disk_path is not None and _chunk_cache.disk_path.name != str(os.getpid()):
+            # A forked worker gets a cache (and disk directory) of its own
+            _chunk_cache = ChunkCache(
+                memory_bytes=settings.CHUNK_CACHE_MEMORY_BYTES,
+                disk_bytes=settings.CHUNK_CACHE_DISK_BYTES,
+                disk_path=settings.CHUNK_CACHE_DISK_PATH,
+                missing_timeout=settings.CHUNK_CACHE_MISSING_TIMEOUT,
+            )
+            atexit.register(_chunk_cache.close)
+        return _chunk_cache
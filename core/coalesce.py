@@ -0,0 +1,112 @@
+import asyncio
+from typing import Any, AsyncIterator
+
+from django.conf import settings
+from kante.channel import Channel
+from kante.context import WsContext
+from pydantic import BaseModel
+
+from core.outbox import ACTIONS, merge
+
+# A change as seen by a subscriber is (action, id, snapshot)
+Change = tuple[str, int, dict[str, Any] | None]
+
+
+def changes_of(signal: BaseModel) -> list[Change]:
+    """The changes of a (single or batched) change event"""
+    changes = []
+    for action in ACTIONS:
+        id = getattr(signal, action)
+        if id is not None:
+            changes.append((action, id, signal.snapshot))
+
+        ids = getattr(signal, f"{action}_many")
+        if ids:
+            snapshots = signal.snapshots if signal.snapshots is not None and len(signal.snapshots) == len(ids) else [None] * len(ids)
+            changes.extend((action, id, snapshot) for id, snapshot in zip(ids, snapshots))
+    return changes
+
+
+class ChangeStream:
+    """The signals of a channel, read into a bounded queue
+
+    The queue belongs to one subscription. If its consumer is slow and the
+    queue is full, the reader stops taking messages from the channel layer,
+    which then applies its own capacity, so the backlog never grows without
+    limit.
+    """
+
+    def __init__(self, channel: Channel, context: WsContext, groups: list[str], maxsize: int) -> None:
+        """Read the messages of the groups into a queue of at most maxsize entries"""
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.reader = asyncio.ensure_future(self._read(channel, context, groups))
+        self.pending: asyncio.Future | None = None
+
+    async def _read(self, channel: Channel, context: WsContext, groups: list[str]) -> None:
+        async for signal in channel.listen(context, groups):
+            await self.queue.put(signal)
+
+    async def next(self, timeout: float | None = None) -> BaseModel | None:
+        """The next signal, None if none arrived within the timeout"""
+        if self.pending is None:
+            self.pending = asyncio.ensure_future(self.queue.get())
+
+        done, _ = await asyncio.wait({self.pending, self.reader}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if self.pending in done:
+            signal, self.pending = self.pending.result(), None
+            return signal
+        if self.reader in done:
+            # Raises if the reader failed
+            self.reader.result()
+            raise StopAsyncIteration
+        return None
+
+    def close(self) -> None:
+        """Stop reading"""
+        self.reader.cancel()
+        if self.pending is not None:
+            self.pending.cancel()
+
+
+async def listen_changes(channel: Channel, context: WsContext, groups: list[str], coalesce_ms: int | None = None) -> AsyncIterator[list[Change]]:
+    """Yield the changes of the channel in batches
+
+    Without a window, every event is one batch. With coalesce_ms, the
+    changes that arrive within the window after the first one are merged
+    into one batch: repeated updates of a row become one update, and a row
+    that is created and deleted within the window is dropped.
+    """
+    if coalesce_ms is not None and coalesce_ms < 0:
+        raise ValueError("coalesceMs must not be negative")
+
+    stream = ChangeStream(channel, context, groups, settings.SUBSCRIPTION_QUEUE_SIZE)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                signal = await stream.next()
+            except StopAsyncIteration:
+                return
+
+            if not coalesce_ms:
+                yield changes_of(signal)
+                continue
+
+            merged: dict[int, list[Any]] = {}
+            deadline = loop.time() + coalesce_ms / 1000
+            while signal is not None:
+                for action, id, snapshot in changes_of(signal):
+                    merge(merged, action, id, [], snapshot)
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    signal = await stream.next(timeout=remaining)
+                except StopAsyncIteration:
+                    break
+
+            if merged:
+                yield [(action, id, snapshot) for id, (action, _, snapshot) in merged.items()]
+    finally:
+        stream.close()
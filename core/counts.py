@@ -0,0 +1,57 @@
+import json
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+
+from core import metrics
+
+estimated_counts = metrics.counter("approximate_counts_estimated", "Counts answered from planner estimates")
+exact_counts = metrics.counter("approximate_counts_exact", "Approximate counts that fell back to an exact count")
+
+
+def is_unfiltered(queryset: QuerySet) -> bool:
+    """Whether the queryset selects every row of its table"""
+    query = queryset.query
+    return not query.where and not query.distinct and query.low_mark == 0 and query.high_mark is None
+
+
+def estimate_count(queryset: QuerySet) -> int | None:
+    """The number of rows the Postgres planner expects the queryset to return
+
+    Unfiltered querysets use the row count statistics of the table
+    (reltuples), filtered ones the row estimate of the plan. Returns None on
+    other databases or if the table was never analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    if is_unfiltered(queryset):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 (or 0) until the table is vacuumed or analyzed
+        return int(row[0]) if row and row[0] > 0 else None
+
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def approximate_count(queryset: QuerySet, threshold: int | None = None) -> int:
+    """A fast, approximate number of rows of the queryset
+
+    Uses the planner estimate, which does not scan the rows. Estimates
+    below the threshold (``settings.APPROXIMATE_COUNT_THRESHOLD``) are
+    replaced by an exact count, which is cheap for small selections and
+    where estimates are least accurate.
+    """
+    threshold = settings.APPROXIMATE_COUNT_THRESHOLD if threshold is None else threshold
+
+    estimate = estimate_count(queryset)
+    if estimate is None or estimate < threshold:
+        exact_counts.inc()
+        return queryset.count()
+
+    estimated_counts.inc()
+    return estimate
@@ -0,0 +1,144 @@
+import dataclasses
+import datetime
+import json
+import threading
+from typing import Any
+
+from django.conf import settings
+
+from core import metrics
+
+credential_hits = metrics.counter("sts_credential_cache_hits", "Credential requests answered from the cache")
+credential_misses = metrics.counter("sts_credential_cache_misses", "Credential requests that called sts.assume_role")
+
+
+@dataclasses.dataclass(frozen=True)
+class CredentialScope:
+    """What a set of temporary credentials is issued for"""
+
+    organization: str | None
+    user: str | None
+    bucket: str
+    prefix: str = ""
+
+    @property
+    def policy(self) -> dict[str, Any]:
+        """The session policy of the credentials"""
+        return {
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Sid": "AllowAllS3ActionsInUserFolder",
+                    "Effect": "Allow",
+                    "Principal": "*",
+                    "Action": ["s3:*"],
+                    "Resource": "arn:aws:s3:::*",
+                },
+            ],
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class TemporaryCredentials:
+    """Temporary credentials of an assumed role"""
+
+    access_key: str
+    secret_key: str
+    session_token: str
+    expiration: datetime.datetime
+
+
+class CredentialCache:
+    """Caches temporary credentials per scope and duration while enough of their lifetime is left
+
+    An entry is reused until margin seconds before it expires, and only while
+    more than min_remaining (a fraction) of the requested duration is left,
+    so that long requests (e.g. uploads) never get nearly expired credentials.
+
+    Concurrent requests for the same scope are deduplicated: only one of
+    them calls STS, the others wait for and reuse its credentials.
+    """
+
+    def __init__(self, margin: float, min_remaining: float = 0.5) -> None:
+        """Reuse credentials until margin seconds before they expire and while min_remaining of their duration is left"""
+        self.margin = datetime.timedelta(seconds=margin)
+        self.min_remaining = min_remaining
+        self._entries: dict[tuple[CredentialScope, str, int], TemporaryCredentials] = {}
+        self._flights: dict[tuple[CredentialScope, str, int], threading.Lock] = {}
+        self._waiting: dict[tuple[CredentialScope, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def _valid(self, key: tuple[CredentialScope, str, int]) -> TemporaryCredentials | None:
+        credentials = self._entries.get(key)
+        remaining = max(self.margin, datetime.timedelta(seconds=key[2] * self.min_remaining))
+        if credentials is None or credentials.expiration - remaining <= datetime.datetime.now(datetime.timezone.utc):
+            return None
+        return credentials
+
+    def get(self, sts: Any, scope: CredentialScope, duration: int) -> TemporaryCredentials:
+        """Credentials for the scope that stay valid for most of duration, assuming the role at most once at a time"""
+        policy = json.dumps(scope.policy, separators=(",", ":"), sort_keys=True)
+        # Credentials of another duration would expire earlier or later than requested
+        key = (scope, policy, duration)
+
+        credentials = self._valid(key)
+        if credentials is not None:
+            credential_hits.inc()
+            return credentials
+
+        with self._lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+
+        try:
+            with flight:
+                # Another request might have assumed the role while we waited
+                credentials = self._valid(key)
+                if credentials is not None:
+                    credential_hits.inc()
+                    return credentials
+
+                credential_misses.inc()
+                response = sts.assume_role(
+                    RoleArn="arn:xxx:xxx:xxx:xxxx",
+                    RoleSessionName="sdfsdfsdf",
+                    Policy=policy,
+                    DurationSeconds=duration,
+                )
+                credentials = TemporaryCredentials(
+                    access_key=response["Credentials"]["AccessKeyId"],
+                    secret_key=response["Credentials"]["SecretAccessKey"],
+                    session_token=response["Credentials"]["SessionToken"],
+                    expiration=response["Credentials"]["Expiration"],
+                )
+
+                with self._lock:
+                    self._prune()
+                    self._entries[key] = credentials
+        finally:
+            with self._lock:
+                # The flight is dropped once no request uses it anymore
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                    del self._flights[key]
+
+        return credentials
+
+    def clear(self) -> None:
+        """Forget all cached credentials"""
+        with self._lock:
+            self._entries.clear()
+
+    def _prune(self) -> None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for key in [key for key, credentials in self._entries.items() if credentials.expiration - self.margin <= now]:
+            del self._entries[key]
+
+
+credential_cache = CredentialCache(margin=settings.STS_CREDENTIAL_MARGIN, min_remaining=settings.STS_CREDENTIAL_MIN_REMAINING)
+
+
+def get_temporary_credentials(sts: Any, scope: CredentialScope, duration: int = 40000) -> TemporaryCredentials:
+    """Get temporary credentials for the scope, reusing still valid ones"""
+    return credential_cache.get(sts, scope, duration)
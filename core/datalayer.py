@@ -1,52 +1,151 @@
 from contextvars import ContextVar
 from functools import cached_property
+import threading
+from typing import TYPE_CHECKING, Any, Callable
 import boto3
+from botocore.config import Config
 from django.conf import settings
 import dataclasses
 from strawberry.extensions import SchemaExtension
+from strawberry.dataloader import DataLoader
+from asgiref.sync import sync_to_async
+
+if TYPE_CHECKING:
+    from core.chunkcache import ChunkCache
+
 datalayer: ContextVar = ContextVar("datalayer", default=None)
 
 
+def client_config(**kwargs: Any) -> Config:
+    """The botocore config shared by all clients (pooling, keep-alive and timeouts)"""
+    return Config(
+        max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.AWS_S3_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_S3_READ_TIMEOUT,
+        tcp_keepalive=settings.AWS_S3_TCP_KEEPALIVE,
+        retries={"max_attempts": settings.AWS_S3_MAX_ATTEMPTS, "mode": "standard"},
+        **kwargs,
+    )
+
+
+def create_s3_client() -> Any:
+    """ Create a boto3 client for S3 without s3v4 signature"""
+    return boto3.session.Session().client(
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        region_name=settings.AWS_S3_REGION_NAME,  # region does not matter when using MinIO
+        config=client_config(),
+    )
+
+
+def create_s3v4_client() -> Any:
+    """ Create a boto3 client for S3 with s3v4 signature"""
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        region_name=settings.AWS_S3_REGION_NAME,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        aws_session_token=None,
+        config=client_config(signature_version="s3v4"),
+        verify=False,
+    )
+
+
+def create_sts_client() -> Any:
+    """ Create a boto3 client for STS with s3v4 signature"""
+    return boto3.session.Session().client(
+        "sts",
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        region_name=settings.AWS_S3_REGION_NAME,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        aws_session_token=None,
+        config=client_config(signature_version="s3v4"),
+        verify=False,
+    )
+
+
+class ClientRegistry:
+    """Process wide registry of boto3 clients
+
+    Clients are created once (lazily) and then shared between all
+    operations, threads and event loops. boto3 clients are thread safe
+    and own their connection pool, so warm connections are reused
+    across requests instead of being thrown away with every operation.
+    """
+
+    def __init__(self, factories: dict[str, Callable[[], Any]]) -> None:
+        """Create the clients lazily, with the factory of their name"""
+        self.factories = factories
+        self._clients: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """The shared client of the name, created on first use"""
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self.factories[name]()
+                    self._clients[name] = client
+        return client
+
+    def reset(self) -> None:
+        """Drop all clients (e.g. after the settings changed or in tests)"""
+        with self._lock:
+            self._clients.clear()
+
+
+clients = ClientRegistry(
+    {
+        "s3": create_s3_client,
+        "s3v4": create_s3v4_client,
+        "sts": create_sts_client,
+    }
+)
+
+
 class Datalayer:
 
-    @cached_property
+    @property
     def s3(self) -> boto3.Session:
-        """ Get a boto3 session for S3 without s3v4 signature"""
-        return boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            region_name=settings.AWS_S3_REGION_NAME,  # region does not matter when using MinIO
-        )
+        """ Get the shared boto3 client for S3 without s3v4 signature"""
+        return clients.get("s3")
 
-    @cached_property
+    @property
     def s3v4(self) -> boto3.Session:
-        """ Get a boto3 session for S3 with s3v4 signature"""
-        return boto3.client(
-            "s3",
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            region_name=settings.AWS_S3_REGION_NAME,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            aws_session_token=None,
-            config=boto3.session.Config(signature_version="s3v4"),
-            verify=False,
-        )
+        """ Get the shared boto3 client for S3 with s3v4 signature"""
+        return clients.get("s3v4")
     
-    @cached_property
+    @property
     def sts(self) -> boto3.Session:
-        """ Get a boto3 session for STS with s3v4 signature"""
-        return boto3.client(
-            "sts",
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            region_name=settings.AWS_S3_REGION_NAME,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            aws_session_token=None,
-            config=boto3.session.Config(signature_version="s3v4"),
-            verify=False,
-        )
+        """ Get the shared boto3 client for STS with s3v4 signature"""
+        return clients.get("sts")
+
+    @property
+    def chunk_cache(self) -> "ChunkCache":
+        """ The process wide cache of zarr chunks read by the server"""
+        from core.chunkcache import get_chunk_cache
+
+        return get_chunk_cache()
+
+    @cached_property
+    def presigned_urls(self) -> DataLoader:
+        """ A loader of presigned urls, keyed by (bucket, key, host)
+
+        All urls that are requested while resolving an operation are
+        looked up and signed in one batch.
+        """
+        from core.presign import presign_urls
+
+        async def load(requests: list[tuple[str, str, str | None]]) -> list[str]:
+            return await sync_to_async(presign_urls)(requests)
+
+        return DataLoader(load_fn=load)
 
 
 
@@ -55,7 +154,7 @@ class Datalayer:
 
 
 def get_current_datalayer() -> Datalayer:
-    return Datalayer()
+    return datalayer.get() or Datalayer()
     
 
 
@@ -68,5 +167,3 @@ class DatalayerExtension(SchemaExtension):
         
         yield
         datalayer.reset(t1)
-
-        print("GraphQL operation end")
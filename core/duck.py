@@ -1,51 +1,147 @@
 from contextvars import ContextVar
-from functools import cached_property
-import boto3
-from django.conf import settings
-import dataclasses
-from strawberry.extensions import SchemaExtension
+import queue
+import threading
+from typing import Callable
 import duckdb
-
 from django.conf import settings
+from strawberry.extensions import SchemaExtension
 
+from core import metrics
 
 
 current_duckdb: ContextVar = ContextVar("duckdb", default=None)
 
+pool_checkouts = metrics.counter("duckdb_pool_checkouts", "Connections checked out of the duckdb pool")
+pool_waits = metrics.counter("duckdb_pool_waits", "Checkouts that had to wait for a free connection")
 
-class DuckLayer:
-
-    @cached_property
-    def connection(self) -> boto3.Session:
-        """ Get a boto3 session for S3 without s3v4 signature"""
 
+def connect() -> duckdb.DuckDBPyConnection:
+    """ Open a duckdb connection configured for the datalayer"""
+    connection = duckdb.connect(
+        config={
+            "memory_limit": settings.DUCKDB_MEMORY_LIMIT,
+            "threads": settings.DUCKDB_THREADS,
+        }
+    )
 
-        secret_query = f"""
+    connection.execute(f"SET http_keep_alive = {str(settings.DUCKDB_HTTP_KEEP_ALIVE).lower()};")
+    connection.execute(f"SET http_timeout = {int(settings.DUCKDB_HTTP_TIMEOUT)};")
+    connection.execute(f"SET http_retries = {int(settings.DUCKDB_HTTP_RETRIES)};")
+    connection.execute(
+        f"""
         CREATE SECRET secret1 (
             TYPE S3,
             KEY_ID '{settings.AWS_ACCESS_KEY_ID}',
             SECRET '{settings.AWS_SECRET_ACCESS_KEY}',
             REGION '{settings.AWS_S3_REGION_NAME}',
-            ENDPOINT 'minio:9000',
-            USE_SSL false,
+            ENDPOINT '{settings.DUCKDB_S3_ENDPOINT}',
+            USE_SSL {str(settings.DUCKDB_S3_USE_SSL).lower()},
             URL_STYLE 'path'
         );
         """
+    )
+    return connection
+
+
+class DuckPool:
+    """A bounded pool of configured duckdb connections
+
+    Connections are expensive to set up (extensions, settings, secrets),
+    so they are created once and then checked out and back in by the
+    operations that need them.
+    """
+
+    def __init__(self, size: int, connect: Callable[[], duckdb.DuckDBPyConnection] = connect, timeout: float | None = None) -> None:
+        """Pool at most size connections created by connect, checkouts wait up to timeout"""
+        self.size = size
+        self.connect = connect
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[duckdb.DuckDBPyConnection] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        """Create all connections of the pool upfront"""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(self._connect_or_release())
+
+    def checkout(self) -> duckdb.DuckDBPyConnection:
+        """Take an idle connection, create one or wait for one to be returned"""
+        pool_checkouts.inc()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            return self._connect_or_release()
+
+        pool_waits.inc()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No duckdb connection became available within {self.timeout} seconds")
+
+    def checkin(self, connection: duckdb.DuckDBPyConnection) -> None:
+        """Return a connection to the pool"""
+        self._idle.put(connection)
+
+    def _connect_or_release(self) -> duckdb.DuckDBPyConnection:
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+
+duck_pool = DuckPool(size=settings.DUCKDB_POOL_SIZE, timeout=settings.DUCKDB_CHECKOUT_TIMEOUT)
 
-        print(secret_query)
-                                
-                         
-                         
-        
-        x = duckdb.connect()
-        x.execute(secret_query)
-        return x
-    
+
+class DuckLayer:
+    """ The duckdb access of a single operation
+
+    Lazily checks a connection out of the pool and hands out a cursor on
+    it, so that the state of the operation (e.g. temporary tables) is
+    isolated from other operations.
+    """
+
+    def __init__(self, pool: DuckPool = duck_pool) -> None:
+        """Check out a connection of the pool on first use"""
+        self.pool = pool
+        self._pooled: duckdb.DuckDBPyConnection | None = None
+        self._cursor: duckdb.DuckDBPyConnection | None = None
+
+    @property
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        """ Get the cursor of this operation"""
+        if self._cursor is None:
+            self._pooled = self.pool.checkout()
+            self._cursor = self._pooled.cursor()
+        return self._cursor
+
+    def close(self) -> None:
+        """ Close the cursor and return the connection to the pool"""
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        if self._pooled is not None:
+            self.pool.checkin(self._pooled)
+            self._pooled = None
 
     def with_table(self, table ,table_name: str = "table1"):
         
 
-        self.connection.execute(f"CREATE TABLE {table_name} (a INTEGER, b VARCHAR);")
+        self.connection.execute(f"CREATE TEMP TABLE {table_name} (a INTEGER, b VARCHAR);")
         return self
     
 
@@ -55,18 +151,18 @@ class DuckLayer:
 
 
 def get_current_duck() -> DuckLayer:
-    return DuckLayer()
+    return current_duckdb.get() or DuckLayer()
     
 
 
 class DuckExtension(SchemaExtension):
 
     def on_operation(self):
-        t1 = current_duckdb.set(
-            DuckLayer()
-        )
-        
-        yield
-        current_duckdb.reset(t1)
-
-        print("GraphQL operation end")
+        layer = DuckLayer()
+        t1 = current_duckdb.set(layer)
+
+        try:
+            yield
+        finally:
+            current_duckdb.reset(t1)
+            layer.close()
@@ -10,6 +10,7 @@ class TraceKindChoices(TextChoices):
     VOLTAGE = "VOLTAGE", "Voltage (Value represent Intensity)"
     CURRENT = "CURRENT", "Current (Value represent Intensity)"
     UNKNOWN = "UNKNOWN", "Unknown"
+    REGULAR = "REGULAR", "Regular time axis (computed from t0, dt and n, no store)"
 
 
 class RecodingKindChoices(TextChoices):
@@ -172,6 +173,14 @@ class RecordingKind(str, Enum):
     INA = "INA"
     UNKNOWN = "UNKNOWN"
     
+@strawberry.enum
+class TraceKind(str, Enum):
+    TIME = "TIME"
+    VOLTAGE = "VOLTAGE"
+    CURRENT = "CURRENT"
+    UNKNOWN = "UNKNOWN"
+    REGULAR = "REGULAR"
+
 @strawberry.enum
 class StimulusKind(str, Enum):
     VOLTAGE = "VOLTAGE"
@@ -0,0 +1,241 @@
+import dataclasses
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from core import metrics
+from core.arrays import ZarrArray
+from core.chunkcache import ChunkCache
+from core.metadata import parse_zarray
+
+logger = logging.getLogger(__name__)
+
+pyramid_builds = metrics.counter("trace_pyramid_builds", "Min/max pyramids that were (re)built")
+
+
+@dataclasses.dataclass
+class PyramidLevel:
+    """A level of a min/max pyramid
+
+    The level is stored as an uncompressed zarr v2 array of shape
+    (bins, 2), holding the minimum and maximum of every bin.
+    """
+
+    key: str
+    bin_size: int  # the number of samples per bin
+    bins: int
+    chunk: int  # the number of bins per chunk
+    dtype: str
+
+    def open(self, s3: Any, bucket: str, cache: ChunkCache | None = None, etag: str | None = None) -> ZarrArray:
+        """Open the level, etag identifies the version of the pyramid (for the cache)"""
+        document = {
+            "zarr_format": 2,
+            "shape": [self.bins, 2],
+            "chunks": [self.chunk, 2],
+            "dtype": self.dtype,
+            "compressor": None,
+            "fill_value": None,
+            "filters": None,
+            "order": "C",
+        }
+        return ZarrArray(s3, bucket, parse_zarray(document, f"{self.key}/.zarray", etag), cache)
+
+
+@dataclasses.dataclass
+class Envelope:
+    """The min/max envelope of a range of a trace"""
+
+    start: int  # the first sample covered by the first bin
+    stop: int  # the sample after the last bin
+    bin_size: int
+    level: int  # the pyramid level the envelope was read from, 0 is the raw data
+    min: list[float | None]
+    max: list[float | None]
+
+
+def reduce_bins(mins: np.ndarray, maxs: np.ndarray, factor: int) -> tuple[np.ndarray, np.ndarray]:
+    """Combine every factor consecutive bins into one, the last bin may be partial
+
+    NaNs are ignored unless a bin only contains NaNs.
+    """
+    full = len(mins) // factor * factor
+    out_min = np.fmin.reduce(mins[:full].reshape(-1, factor), axis=1)
+    out_max = np.fmax.reduce(maxs[:full].reshape(-1, factor), axis=1)
+
+    if full < len(mins):
+        out_min = np.append(out_min, np.fmin.reduce(mins[full:]))
+        out_max = np.append(out_max, np.fmax.reduce(maxs[full:]))
+
+    return out_min, out_max
+
+
+def sample_bounds(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The minimum and maximum of every sample (row) over all other axes"""
+    values = rows.reshape(len(rows), -1)
+    return np.fmin.reduce(values, axis=1), np.fmax.reduce(values, axis=1)
+
+
+class PyramidBuilder:
+    """Builds a min/max pyramid from the rows of an array, streamed in order
+
+    The rows are reduced into the first level (factor samples per bin) as
+    they are fed, only the first level is kept in memory.
+    """
+
+    def __init__(self, dtype: np.dtype, factor: int) -> None:
+        """Build the levels of samples of dtype, every level factor times coarser than the one below"""
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.factor = factor
+        self._mins: list[np.ndarray] = []
+        self._maxs: list[np.ndarray] = []
+        self._carry_min = np.empty(0, dtype=self.dtype)
+        self._carry_max = np.empty(0, dtype=self.dtype)
+
+    def feed(self, rows: np.ndarray) -> None:
+        """Add the next rows (along the first axis) of the array"""
+        row_min, row_max = sample_bounds(rows)
+        row_min, row_max = np.concatenate([self._carry_min, row_min]), np.concatenate([self._carry_max, row_max])
+
+        full = len(row_min) // self.factor * self.factor
+        if full:
+            level_min, level_max = reduce_bins(row_min[:full], row_max[:full], self.factor)
+            self._mins.append(level_min)
+            self._maxs.append(level_max)
+        self._carry_min, self._carry_max = row_min[full:], row_max[full:]
+
+    def bins(self) -> tuple[np.ndarray, np.ndarray]:
+        """The bins of the rows fed so far, the last bin may be partial"""
+        mins, maxs = [np.empty(0, dtype=self.dtype), *self._mins], [np.empty(0, dtype=self.dtype), *self._maxs]
+        if len(self._carry_min):
+            mins.append(np.fmin.reduce(self._carry_min, keepdims=True))
+            maxs.append(np.fmax.reduce(self._carry_max, keepdims=True))
+        return np.concatenate(mins), np.concatenate(maxs)
+
+    def write(self, s3: Any, bucket: str, key: str, min_bins: int, chunk: int) -> list[PyramidLevel]:
+        """Write the levels under key, until a level has at most min_bins bins"""
+        level_min, level_max = self.bins()
+        levels = []
+        bin_size = self.factor
+
+        while True:
+            level = PyramidLevel(
+                key=f"{key}/{len(levels) + 1}",
+                bin_size=bin_size,
+                bins=len(level_min),
+                chunk=chunk,
+                dtype=self.dtype.str,
+            )
+            target = ZarrArray.create(s3, bucket, level.key, [level.bins, 2], [level.chunk, 2], self.dtype)
+            bounds = np.stack([level_min, level_max], axis=1)
+            for i, start in enumerate(range(0, level.bins, chunk)):
+                target.write_chunk((i, 0), bounds[start : start + chunk])
+            levels.append(level)
+
+            if level.bins <= min_bins:
+                break
+
+            level_min, level_max = reduce_bins(level_min, level_max, self.factor)
+            bin_size *= self.factor
+
+        pyramid_builds.inc()
+        return levels
+
+
+def build_pyramid(array: ZarrArray, key: str, factor: int, min_bins: int, chunk: int) -> list[PyramidLevel]:
+    """Build the min/max pyramid of an array and store it under key
+
+    The array is streamed one row of chunks at a time into the first level
+    (factor samples per bin), every further level combines factor bins of
+    the previous one, until a level has at most min_bins bins. Arrays that
+    are not longer than min_bins get no pyramid, they are cheap to read.
+    """
+    if array.shape[0] <= min_bins:
+        return []
+
+    builder = PyramidBuilder(array.dtype, factor)
+    for rows in array.iter_rows():
+        builder.feed(rows)
+
+    return builder.write(array.s3, array.bucket, key, min_bins, chunk)
+
+
+def _to_list(values: np.ndarray) -> list[float | None]:
+    if values.dtype.kind == "f":
+        return [None if math.isnan(v) else v for v in values.tolist()]
+    return values.tolist()
+
+
+def read_envelope(array: ZarrArray, levels: list[PyramidLevel], start: int, stop: int, max_points: int) -> Envelope:
+    """Read the min/max envelope of the samples start:stop in at most max_points bins
+
+    The coarsest pyramid level that still has at least max_points bins in
+    the range is read and combined down to max_points bins. When no level
+    is fine enough (short ranges, or no pyramid yet), the raw data is
+    streamed one chunk row at a time and reduced into max_points bins.
+    """
+    length = array.shape[0]
+    start, stop = max(0, min(start, length)), max(0, min(stop, length))
+    max_points = max(1, max_points)
+
+    for index in range(len(levels), 0, -1):
+        level = levels[index - 1]
+        first, last = start // level.bin_size, math.ceil(stop / level.bin_size)
+        if last - first >= max_points:
+            bounds = level.open(array.s3, array.bucket, array.cache, array.metadata.etag).read(first, last)
+            mins, maxs = bounds[:, 0], bounds[:, 1]
+            offset, bin_size = first * level.bin_size, level.bin_size
+            break
+    else:
+        index = 0
+        offset, bin_size = start, max(1, math.ceil((stop - start) / max_points))
+        builder = PyramidBuilder(array.dtype, bin_size)
+        for rows in array.iter_rows(start, stop):
+            builder.feed(rows)
+        mins, maxs = builder.bins()
+
+    group = max(1, math.ceil(len(mins) / max_points))
+    if group > 1:
+        mins, maxs = reduce_bins(mins, maxs, group)
+
+    return Envelope(
+        start=offset,
+        stop=min(offset + len(mins) * bin_size * group, stop),
+        bin_size=bin_size * group,
+        level=index,
+        min=_to_list(mins),
+        max=_to_list(maxs),
+    )
+
+
+pyramid_executor = ThreadPoolExecutor(max_workers=settings.TRACE_PYRAMID_WORKERS, thread_name_prefix="pyramid")
+
+
+def _build_store_indexes(store_id: str) -> None:
+    from core.datalayer import Datalayer
+    from core.models import ZarrStore
+
+    datalayer = Datalayer()
+    try:
+        # A duplicate becomes an alias of the older store, which already has its indexes
+        ZarrStore.objects.get(id=store_id).deduplicate(datalayer).build_indexes(datalayer)
+    except Exception:
+        logger.exception("Could not build the indexes of zarr store %s", store_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_indexes(store_ids: Iterable[str]) -> None:
+    """Deduplicate the stores and build their pyramids and range indexes in the background, once the transaction commits"""
+    store_ids = list(store_ids)
+
+    def submit() -> None:
+        for store_id in store_ids:
+            pyramid_executor.submit(_build_store_indexes, store_id)
+
+    transaction.on_commit(submit)
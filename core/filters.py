@@ -18,6 +18,10 @@ class IDFilterMixin:
             return queryset
         return queryset.filter(id__in=self.ids)
 
+    def match_ids(self, values):
+        """Whether the row is one of the ids"""
+        return str(values["id"]) in {str(id) for id in self.ids}
+
 
 @strawberry.input
 class CreatedAtFilterMixin:
@@ -34,6 +38,14 @@ class CreatedAtFilterMixin:
             return queryset
         return queryset.filter(created_at__gt=self.created_after)
 
+    def match_created_before(self, values):
+        """Whether the row was created before created_before, None if unknown"""
+        return values["created_at"] < self.created_before if "created_at" in values else None
+
+    def match_created_after(self, values):
+        """Whether the row was created after created_after, None if unknown"""
+        return values["created_at"] > self.created_after if "created_at" in values else None
+
 
 @strawberry.input
 class SearchFilterMixin:
@@ -44,6 +56,10 @@ class SearchFilterMixin:
             return queryset
         return queryset.filter(name__contains=self.search)
 
+    def match_search(self, values):
+        """Whether the name of the row contains search, None if unknown"""
+        return self.search in values["name"] if "name" in values else None
+
 
 @strawberry_django.order(models.Trace)
 class TraceOrder:
@@ -185,22 +201,20 @@ class ContinousScanViewFilter(ViewFilter):
 
 
 @strawberry_django.filter(models.Trace)
-class TraceFilter:
+class TraceFilter(IDFilterMixin, SearchFilterMixin, CreatedAtFilterMixin):
     name: Optional[FilterLookup[str]]
     ids: list[strawberry.ID] | None
     dataset: DatasetFilter | None
     not_derived: bool | None = None
     search: str | None
+    kind: auto
+    tags: list[str] | None = None
 
-    def filter_search(self, queryset, info):
-        if self.search is None:
-            return queryset
-        return queryset.filter(name__contains=self.search)
-
-    def filter_ids(self, queryset, info):
-        if self.ids is None:
+    def filter_tags(self, queryset, info):
+        """Only keep rows with one of the tags"""
+        if self.tags is None:
             return queryset
-        return queryset.filter(id__in=self.ids)
+        return queryset.filter(tags__slug__in=self.tags).distinct()
 
     def filter_not_derived(self, queryset, info):
         print("Filtering not derived")
@@ -209,6 +223,13 @@ class TraceFilter:
         return queryset.filter(derived_views=None)
 
 
+@strawberry_django.order(models.ROI)
+class ROIOrder:
+    """The order of ROIs"""
+
+    created_at: auto
+
+
 @strawberry_django.filter(models.ROI)
 class ROIFilter(IDFilterMixin, SearchFilterMixin, CreatedAtFilterMixin):
     id: auto
@@ -226,6 +247,11 @@ class ROIFilter(IDFilterMixin, SearchFilterMixin, CreatedAtFilterMixin):
             return queryset
         return queryset.filter(image__name__contains=self.search)
 
+    def match_search(self, values):
+        """ROIs are searched by their trace, only the database can tell"""
+        # Searches the related trace, only the database knows it
+        return None
+
 
 @strawberry_django.filter(models.Block)
 class BlockFilter(IDFilterMixin, SearchFilterMixin, CreatedAtFilterMixin):
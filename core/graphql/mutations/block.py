@@ -3,8 +3,11 @@
 from kante.types import Info
 from core.datalayer import get_current_datalayer
 import strawberry
-from core import types, models, scalars, enums
-from core.base_models.input.graphql.biophysics import BiophysicsInput
+from django.conf import settings
+from django.db import transaction
+from core.provenance import bulk_create_with_provenance
+from core import types, models, scalars, enums, channels
+from core.graphql.mutations.trace import RegularTimeAxisInput, build_regular_time_trace
 import datetime
 
 
@@ -23,7 +26,8 @@ class AnalogSignalChannelInput:
 
 @strawberry.input()
 class AnalogSignalInput:
-    time_trace: scalars.TraceLike
+    time_trace: scalars.TraceLike | None = None
+    time_axis: RegularTimeAxisInput | None = strawberry.field(default=None, description="A regular time axis instead of a time trace. Without both, the axis is derived from t_start, sampling_rate and the length of the channels")
     name: str | None = None
     description: str | None = None
     sampling_rate: float
@@ -70,132 +74,169 @@ class CreateBlockInput:
     segments: list[BlockSegmentInput] = strawberry.field(default_factory=list)
 
 
+def get_block_store_ids(input: CreateBlockInput) -> set[str]:
+    """Collect the ids of all stores referenced by the block"""
+    ids = set()
+    for segment in input.segments:
+        for analog_signal in segment.analog_signals:
+            if analog_signal.time_trace:
+                ids.add(analog_signal.time_trace)
+            ids.update(channel.trace for channel in analog_signal.channels)
+
+        for irregularly_sampled_signal in segment.irregularly_sampled_signals:
+            ids.add(irregularly_sampled_signal.times)
+            ids.add(irregularly_sampled_signal.trace)
+
+        for spike_train in segment.spike_trains:
+            ids.add(spike_train.times)
+
+    return ids
+
+
+def hex_color(color: list[int] | None) -> str | None:
+    """Convert an rgb(a) color to the hex notation of the models"""
+    if not color:
+        return None
+    return "#" + "".join(f"{int(c):02x}" for c in color[:3])
+
+
 def create_block(
     info: Info,
     input: CreateBlockInput,
 ) -> types.Block:
-    
+    """Create a block with all its segments, signals and traces
+
+    All referenced stores are probed at once and all rows are built before
+    anything is written. They are then inserted with one bulk query per
+    table (in dependency order) inside a single transaction, so a failure
+    leaves no rows behind. Subscribers get one notification for all created
+    traces once the transaction commits.
+    """
+    user = info.context.request.user
+    organization = info.context.request.organization
+
     datalayer = get_current_datalayer()
 
+    # Probe all referenced stores at once instead of one after another
+    stores = models.ZarrStore.objects.get_filled(get_block_store_ids(input), datalayer, organization)
+    origin = models.File.objects.get(id=input.file) if input.file else None
 
-    
-    block = models.Block.objects.create(
-        dataset=models.Dataset.objects.get_or_create(
-            organization=info.context.request.organization,
-            creator=info.context.request.user,
-            membership=info.context.request.membership,
-            name="Default Dataset",
-            )[0],
+    def build_trace(store: str) -> models.Trace:
+        return models.Trace(creator=user, organization=organization, name=input.name, store=stores[str(store)])
+
+    def build_time_trace(analog_signal: AnalogSignalInput) -> models.Trace:
+        if analog_signal.time_trace:
+            return build_trace(analog_signal.time_trace)
+        if analog_signal.time_axis:
+            axis = analog_signal.time_axis
+            return build_regular_time_trace(info, input.name, axis.t0, axis.dt, axis.n)
+        if not analog_signal.channels:
+            raise Exception("An analog signal without channels needs a time trace or a time axis")
+        return build_regular_time_trace(
+            info,
+            input.name,
+            analog_signal.t_start,
+            1 / analog_signal.sampling_rate,
+            stores[str(analog_signal.channels[0].trace)].shape[0],
+        )
+
+    # Build every row (without saving), parents are assigned before they get ids
+    traces: list[models.Trace] = []
+    segments: list[models.BlockSegment] = []
+    analog_signals: list[models.AnalogSignal] = []
+    analog_signal_channels: list[models.AnalogSignalChannel] = []
+    irregularly_sampled_signals: list[models.IrregularlySampledSignal] = []
+    spike_trains: list[models.SpikeTrain] = []
+
+    block = models.Block(
         name=input.name,
         recording_time=input.recording_time or datetime.datetime.now(),
-        origin=models.File.objects.get(id=input.file) if input.file else None,
-        organization=info.context.request.organization,
-        creator=info.context.request.user,
+        origin=origin,
+        organization=organization,
+        creator=user,
     )
 
-
     for segment in input.segments:
-        segment_model = models.BlockSegment.objects.create(
-            session=block,
-        )
+        segment_model = models.BlockSegment(session=block)
+        segments.append(segment_model)
 
         for analog_signal in segment.analog_signals:
-            
-            
-            ttrace = models.ZarrStore.objects.get(id=analog_signal.time_trace)
-            ttrace.fill_info(datalayer)
-            
-            
-            ttrace = models.Trace.objects.create(
-                creator=info.context.request.user,
-                organization=info.context.request.organization,
-                name=input.name,
-                store=ttrace,
-            )
-            
-            analog_signal_model = models.AnalogSignal.objects.create(
+            time_trace = build_time_trace(analog_signal)
+            traces.append(time_trace)
+
+            analog_signal_model = models.AnalogSignal(
                 recording_segment=segment_model,
                 sampling_rate=analog_signal.sampling_rate,
                 t_start=analog_signal.t_start,
-                time_trace=ttrace,
-                name=analog_signal.name,
+                time_trace=time_trace,
+                name=analog_signal.name or "",
                 unit=analog_signal.unit,
                 description=analog_signal.description,
             )
-            
+            analog_signals.append(analog_signal_model)
+
             for channel in analog_signal.channels:
-                trace = models.ZarrStore.objects.get(id=channel.trace)
-                trace.fill_info(datalayer)
-                
-                trace = models.Trace.objects.create(
-                    creator=info.context.request.user,
-                    organization=info.context.request.organization,
-                    name=input.name,
-                    store=trace,
+                trace = build_trace(channel.trace)
+                traces.append(trace)
+                analog_signal_channels.append(
+                    models.AnalogSignalChannel(
+                        signal=analog_signal_model,
+                        trace=trace,
+                        name=channel.name,
+                        unit=channel.unit,
+                        index=channel.index,
+                        description=channel.description,
+                        color=hex_color(channel.color),
+                    )
                 )
-                
-                models.AnalogSignalChannel.objects.create(
-                    signal=analog_signal_model,
+
+        for irregularly_sampled_signal in segment.irregularly_sampled_signals:
+            time_trace = build_trace(irregularly_sampled_signal.times)
+            trace = build_trace(irregularly_sampled_signal.trace)
+            traces.extend([time_trace, trace])
+            irregularly_sampled_signals.append(
+                models.IrregularlySampledSignal(
+                    recording_segment=segment_model,
+                    time_trace=time_trace,
                     trace=trace,
-                    name=channel.name,
-                    unit=channel.unit,
-                    index=channel.index,
-                    description=channel.description,
-                    color=channel.color,
+                    name=irregularly_sampled_signal.name or "",
                 )
-            
-           
-        
-        for irregularly_sampled_signal in segment.irregularly_sampled_signals:
-            time_trace = models.ZarrStore.objects.get(id=irregularly_sampled_signal.times)
-            time_trace.fill_info(datalayer)
-            
-            time_trace = models.Trace.objects.create(
-                creator=info.context.request.user,
-                organization=info.context.request.organization,
-                name=input.name,
-                store=time_trace,
-            )
-            trace = models.ZarrStore.objects.get(id=irregularly_sampled_signal.trace)
-            trace.fill_info(datalayer)
-            
-            trace = models.Trace.objects.create(
-                creator=info.context.request.user,
-                organization=info.context.request.organization,
-                name=input.name,
-                store=trace,
-            )
-            
-            models.IrregularlySampledSignal.objects.create(
-                recording_segment=segment_model,
-                time_trace=time_trace,
-                trace=trace,
-                name=irregularly_sampled_signal.name,
-                unit=irregularly_sampled_signal.unit,
-                description=irregularly_sampled_signal.description,
             )
-        
+
         for spike_train in segment.spike_trains:
-            time_trace = models.ZarrStore.objects.get(id=spike_train.times)
-            time_trace.fill_info(datalayer)
-            
-            time_trace = models.Trace.objects.create(
-                creator=info.context.request.user,
-                organization=info.context.request.organization,
-                name=input.name,
-                store=time_trace,
-            )
-            models.SpikeTrain.objects.create(
-                recording_segment=segment_model,
-                time_trace=time_trace,
-                t_start=spike_train.t_start,
-                t_stop=spike_train.t_stop,
-                waveforms=models.Trace.objects.get(id=spike_train.waveforms) if spike_train.waveforms else None,
-                name=spike_train.name,
-                description=spike_train.description,
-                left_sweep=spike_train.left_sweep,
+            trace = build_trace(spike_train.times)
+            traces.append(trace)
+            spike_trains.append(
+                models.SpikeTrain(
+                    recording_segment=segment_model,
+                    trace=trace,
+                    name=spike_train.name or "",
+                )
             )
 
+    batch_size = settings.BULK_CREATE_BATCH_SIZE
+
+    with transaction.atomic():
+        block.dataset = models.Dataset.objects.get_or_create(
+            organization=organization,
+            creator=user,
+            membership=info.context.request.membership,
+            name="Default Dataset",
+        )[0]
+        block.save()
+
+        # Foreign keys are resolved from the (now saved) parents when the children are inserted
+        models.BlockSegment.objects.bulk_create(segments, batch_size=batch_size)
+        bulk_create_with_provenance(traces, models.Trace, user, batch_size=batch_size)
+        bulk_create_with_provenance(analog_signals, models.AnalogSignal, user, batch_size=batch_size)
+        models.AnalogSignalChannel.objects.bulk_create(analog_signal_channels, batch_size=batch_size)
+        bulk_create_with_provenance(irregularly_sampled_signals, models.IrregularlySampledSignal, user, batch_size=batch_size)
+        bulk_create_with_provenance(spike_trains, models.SpikeTrain, user, batch_size=batch_size)
+
+        # bulk_create sends no post_save signals, published on commit
+        snapshots = {trace.id: channels.snapshot(trace) for trace in traces} if len(traces) <= settings.CHANNEL_MAX_SNAPSHOTS else None
+        channels.broadcast_traces("create", [(trace.id, trace.organization_id, trace.dataset_id) for trace in traces], snapshots)
+
     return block
 
 @strawberry.input
@@ -1,6 +1,9 @@
 from kante.types import Info
 import strawberry
-from core import types, models, inputs
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from core import types, models, inputs, channels
+from core.provenance import is_historic, record_history
 from typing import cast
 
 
@@ -81,52 +84,102 @@ def revert_dataset(
     return historic.instance
 
 
+def move_to_dataset(info: Info, queryset: QuerySet, ids: list[strawberry.ID], dataset: models.Dataset | None) -> list[int]:
+    """Set the dataset of the rows with the given ids in one UPDATE
+
+    The queryset already restricts the rows to those the caller may touch
+    (e.g. of its organization), so the check happens in the same query. If
+    not all ids matched, nothing is changed. Models with provenance get
+    their history rows with one INSERT ... SELECT. Returns the ids of the moved rows.
+    """
+    model = queryset.model
+    field = "parent" if model is models.Dataset else "dataset"
+    ids = list({int(id) for id in ids})
+
+    with transaction.atomic():
+        updated = queryset.filter(id__in=ids).update(**{field: dataset})
+        if updated != len(ids):
+            # Rolls back the update
+            raise Exception(f"Some of the {model._meta.verbose_name_plural} do not exist or are not accessible")
+
+        if is_historic(model):
+            record_history(model.objects.filter(id__in=ids), info.context.request.user)
+
+    return ids
+
+
+def get_dataset(info: Info, id: strawberry.ID) -> models.Dataset:
+    """The dataset with the id in the organization of the request"""
+    return models.Dataset.objects.get(id=id, organization=info.context.request.organization)
+
+
+def accessible_files(info: Info) -> QuerySet:
+    """Files have no organization, they belong to the organization of their dataset (or to their creator)"""
+    return models.File.objects.filter(Q(dataset__organization=info.context.request.organization) | Q(dataset__isnull=True, creator=info.context.request.user))
+
+
+def move_traces(info: Info, queryset: QuerySet, ids: list[strawberry.ID], dataset: models.Dataset | None) -> None:
+    """Move the traces like move_to_dataset, and tell the groups of their old and new dataset once the transaction commits"""
+    with transaction.atomic():
+        previous = list(queryset.filter(id__in=ids).values_list("id", "organization_id", "dataset_id"))
+        move_to_dataset(info, queryset, ids, dataset)
+        channels.broadcast_traces("update", previous + [(id, organization_id, dataset.id if dataset else None) for id, organization_id, _ in previous])
+
+
+def move_files(info: Info, queryset: QuerySet, ids: list[strawberry.ID], dataset: models.Dataset | None) -> None:
+    """Move the files like move_to_dataset, and tell the groups of their old and new dataset once the transaction commits"""
+    with transaction.atomic():
+        previous = list(queryset.filter(id__in=ids).values_list("id", "dataset__organization_id", "dataset_id"))
+        move_to_dataset(info, queryset, ids, dataset)
+        channels.broadcast_files("update", previous + [(id, dataset.organization_id if dataset else None, dataset.id if dataset else None) for id, _, _ in previous])
+
+
+def move_datasets(info: Info, queryset: QuerySet, ids: list[strawberry.ID], parent: models.Dataset | None) -> None:
+    """Move the datasets like move_to_dataset, and tell the groups of their old and new parent once the transaction commits"""
+    with transaction.atomic():
+        previous = list(queryset.filter(id__in=ids).values_list("id", "parent_id"))
+        move_to_dataset(info, queryset, ids, parent)
+        channels.broadcast_datasets("update", previous + [(id, parent.id if parent else None) for id, _ in previous])
+
+
+def get_ancestor_ids(dataset: models.Dataset) -> set[int]:
+    """The ids of the dataset and of all datasets above it"""
+    ids = {dataset.id}
+    parent_id = dataset.parent_id
+    while parent_id is not None and parent_id not in ids:
+        ids.add(parent_id)
+        parent_id = models.Dataset.objects.filter(id=parent_id).values_list("parent_id", flat=True).first()
+    return ids
+
+
 def put_datasets_in_dataset(
     info: Info,
     input: inputs.AssociateInput,
 ) -> types.Dataset:
-    parent = models.Dataset.objects.get(
-        id=input.other,
-    )
+    parent = get_dataset(info, input.other)
+    with transaction.atomic():
+        if get_ancestor_ids(parent) & {int(id) for id in input.selfs}:
+            raise Exception("A dataset cannot be put into itself or into one of its descendants")
 
-    for i in input.selfs:
-        dataset = models.Dataset.objects.get(
-            id=i,
-        )
-        dataset.parent = parent
-        dataset.save()
-
-    return dataset
+        move_datasets(info, models.Dataset.objects.filter(organization=info.context.request.organization), input.selfs, parent)
+    return parent
 
 
 def release_datasets_from_dataset(
     info: Info,
     input: inputs.DesociateInput,
 ) -> types.Dataset:
-    for i in input.selfs:
-        dataset = models.Dataset.objects.get(
-            id=i,
-        )
-        dataset.parent = None
-        dataset.save()
-    return dataset
+    parent = get_dataset(info, input.other)
+    move_datasets(info, models.Dataset.objects.filter(parent=parent), input.selfs, None)
+    return parent
 
 
 def put_images_in_dataset(
     info: Info,
     input: inputs.AssociateInput,
 ) -> types.Dataset:
-    parent = models.Dataset.objects.get(
-        id=input.other,
-    )
-
-    for i in input.selfs:
-        image = models.Images.objects.get(
-            id=i,
-        )
-        image.dataset = parent
-        image.save()
-
+    parent = get_dataset(info, input.other)
+    move_traces(info, models.Trace.objects.filter(organization=info.context.request.organization), input.selfs, parent)
     return parent
 
 
@@ -134,30 +187,17 @@ def release_images_from_dataset(
     info: Info,
     input: inputs.DesociateInput,
 ) -> types.Dataset:
-    for i in input.selfs:
-        dataset = models.Image.objects.get(
-            id=i,
-        )
-        dataset.parent = None
-        dataset.save()
-    return dataset
+    parent = get_dataset(info, input.other)
+    move_traces(info, models.Trace.objects.filter(dataset=parent), input.selfs, None)
+    return parent
 
 
 def put_files_in_dataset(
     info: Info,
     input: inputs.AssociateInput,
 ) -> types.Dataset:
-    parent = models.Dataset.objects.get(
-        id=input.other,
-    )
-
-    for i in input.selfs:
-        image = models.File.objects.get(
-            id=i,
-        )
-        image.dataset = parent
-        image.save()
-
+    parent = get_dataset(info, input.other)
+    move_files(info, accessible_files(info), input.selfs, parent)
     return parent
 
 
@@ -165,10 +205,6 @@ def release_files_from_dataset(
     info: Info,
     input: inputs.DesociateInput,
 ) -> types.Dataset:
-    for i in input.selfs:
-        dataset = models.File.objects.get(
-            id=i,
-        )
-        dataset.parent = None
-        dataset.save()
-    return dataset
+    parent = get_dataset(info, input.other)
+    move_files(info, models.File.objects.filter(dataset=parent), input.selfs, None)
+    return parent
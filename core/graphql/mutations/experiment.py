@@ -3,6 +3,7 @@ from core.datalayer import get_current_datalayer
 import strawberry
 from core import types, models, scalars, enums
 from core.base_models.input.graphql.biophysics import BiophysicsInput
+from core.graphql.mutations.trace import RegularTimeAxisInput, create_regular_time_trace
 
 
 
@@ -27,6 +28,7 @@ class RecordingViewInput:
 class CreateExperimentInput:
     name: str 
     time_trace: strawberry.ID | None = None
+    time_axis: RegularTimeAxisInput | None = strawberry.field(default=None, description="A regular time axis instead of a time trace")
     stimulus_views: list[StimulusViewInput]
     recording_views: list[RecordingViewInput]
     description: str | None = None
@@ -44,7 +46,7 @@ def create_experiment(
         name=input.name,
         creator=info.context.request.user,
         description=input.description,
-        time_trace=models.Trace.objects.get(id=input.time_trace),
+        time_trace=create_regular_time_trace(info, input.name, input.time_axis.t0, input.time_axis.dt, input.time_axis.n) if input.time_axis else models.Trace.objects.get(id=input.time_trace),
         
     )
     
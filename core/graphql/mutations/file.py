@@ -3,7 +3,7 @@ import strawberry
 
 from core import types, models, scalars
 from core.datalayer import get_current_datalayer
-import json
+from core.credentials import CredentialScope, get_temporary_credentials
 from django.conf import settings
 
 
@@ -45,40 +45,26 @@ def pin_file(
 
 def request_file_upload(info: Info, input: RequestFileUploadInput) -> types.Credentials:
     """Request upload credentials for a given key"""
-    print("Desired Datalayer")
-
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Sid": "AllowAllS3ActionsInUserFolder",
-                "Effect": "Allow",
-                "Principal": "*",
-                "Action": ["s3:*"],
-                "Resource": "arn:aws:s3:::*",
-            },
-        ],
-    }
 
     datalayer = get_current_datalayer()
 
-    response = datalayer.sts.assume_role(
-        RoleArn="arn:xxx:xxx:xxx:xxxx",
-        RoleSessionName="sdfsdfsdf",
-        Policy=json.dumps(policy, separators=(",", ":")),
-        DurationSeconds=40000,
+    credentials = get_temporary_credentials(
+        datalayer.sts,
+        CredentialScope(
+            organization=str(info.context.request.organization.id),
+            user=str(info.context.request.user.id),
+            bucket=settings.FILE_BUCKET,
+        ),
     )
 
-    print(response)
-
     path = f"s3://{settings.FILE_BUCKET}/{input.key}"
 
     store = models.BigFileStore.objects.create(path=path, key=input.key, bucket=settings.FILE_BUCKET)
 
     aws = {
-        "access_key": response["Credentials"]["AccessKeyId"],
-        "secret_key": response["Credentials"]["SecretAccessKey"],
-        "session_token": response["Credentials"]["SessionToken"],
+        "access_key": credentials.access_key,
+        "secret_key": credentials.secret_key,
+        "session_token": credentials.session_token,
         "status": "success",
         "key": input.key,
         "bucket": settings.FILE_BUCKET,
@@ -148,32 +134,22 @@ def request_file_access(info: Info, input: RequestFileAccessInput) -> types.Acce
 
     store = models.BigFileStore.objects.get(id=input.store)
 
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Sid": "AllowAllS3ActionsInUserFolder",
-                "Effect": "Allow",
-                "Principal": "*",
-                "Action": ["s3:*"],
-                "Resource": "arn:aws:s3:::*",
-            },
-        ],
-    }
-
     datalayer = get_current_datalayer()
 
-    response = datalayer.sts.assume_role(
-        RoleArn="arn:xxx:xxx:xxx:xxxx",
-        RoleSessionName="sdfsdfsdf",
-        Policy=json.dumps(policy, separators=(",", ":")),
-        DurationSeconds=input.duration or 40000,
+    credentials = get_temporary_credentials(
+        datalayer.sts,
+        CredentialScope(
+            organization=str(info.context.request.organization.id),
+            user=str(info.context.request.user.id),
+            bucket=store.bucket,
+        ),
+        duration=input.duration or 40000,
     )
 
     aws = {
-        "access_key": response["Credentials"]["AccessKeyId"],
-        "secret_key": response["Credentials"]["SecretAccessKey"],
-        "session_token": response["Credentials"]["SessionToken"],
+        "access_key": credentials.access_key,
+        "secret_key": credentials.secret_key,
+        "session_token": credentials.session_token,
         "key": store.key,
         "bucket": store.bucket,
         "path": store.path,
@@ -1,8 +1,13 @@
 from kante.types import Info
 from core.datalayer import get_current_datalayer
 import strawberry
-from core import types, models, scalars, enums
+from django.conf import settings
+from django.db import transaction
+from core.provenance import bulk_create_with_provenance
+from core import types, models, scalars, enums, channels
 from core.base_models.input.graphql.biophysics import BiophysicsInput
+from core.graphql.mutations.trace import RegularTimeAxisInput, build_regular_time_trace
+from core.timeaxis import RegularTimeAxis
 
 
 @strawberry.input()
@@ -30,62 +35,118 @@ class CreateSimulationInput:
     recordings: list[RecordingInput]
     stimuli: list[StimulusInput]
     time_trace: scalars.TraceLike | None = None
+    time_axis: RegularTimeAxisInput | None = strawberry.field(default=None, description="A regular time axis instead of a time trace. Without both, the axis is derived from dt and duration")
     duration: scalars.Milliseconds
     dt: scalars.Milliseconds | None = None
 
 
-def create_simulation(
-    info: Info,
-    input: CreateSimulationInput,
-) -> types.Simulation:
-    model = models.NeuronModel.objects.get(
-        id=input.model,
-    )
+def build_time_trace(info: Info, input: CreateSimulationInput, stores: dict[str, models.ZarrStore]) -> models.Trace:
+    """Build (without saving) the time trace of a simulation"""
+    if input.time_trace:
+        return models.Trace(
+            creator=info.context.request.user,
+            organization=info.context.request.organization,
+            name=input.name,
+            store=stores[str(input.time_trace)],
+        )
+    if input.time_axis:
+        return build_regular_time_trace(info, input.name, input.time_axis.t0, input.time_axis.dt, input.time_axis.n)
 
-    datalayer = get_current_datalayer()
+    # Sampled at 0, dt, ..., duration
+    axis = RegularTimeAxis.spanning(input.duration, input.dt or 1.0)
+    return build_regular_time_trace(info, input.name, axis.t0, axis.dt, axis.n)
 
-    time_store = models.ZarrStore.objects.get(id=input.time_trace)
-    time_store.fill_info(datalayer)
 
-    time_trace = models.Trace.objects.create(
-        creator=info.context.request.user,
-        organization=info.context.request.organization,
-        name=input.name,
-        store=time_store,
-    )
+def create_simulations(
+    info: Info,
+    inputs: list[CreateSimulationInput],
+) -> list[types.Simulation]:
+    """Create many simulations (e.g. of a parameter sweep) at once
+
+    Everything is validated before anything is written: the models must
+    exist and all referenced stores are probed concurrently. Traces,
+    simulations, recordings and stimuli are then inserted with one bulk
+    query per table in a single transaction. The simulations are returned
+    in the order of the inputs.
+    """
+    if not inputs:
+        return []
+
+    user = info.context.request.user
+    organization = info.context.request.organization
+
+    model_ids = {str(input.model) for input in inputs}
+    neuron_models = {str(model.id): model for model in models.NeuronModel.objects.filter(id__in=model_ids)}
+    missing = model_ids - neuron_models.keys()
+    if missing:
+        raise models.NeuronModel.DoesNotExist(f"NeuronModels {', '.join(sorted(missing))} do not exist")
 
-    sims = models.Simulation.objects.create(
-        model=model,
-        duration=input.duration,
-        name=input.name,
-        time_trace=time_trace,
-        dt=input.dt or 1.0,
-    )
+    datalayer = get_current_datalayer()
 
-    for recording in input.recordings:
-        store = models.ZarrStore.objects.get(id=recording.trace)
-        store.fill_info(datalayer)
+    # Probe all referenced stores at once instead of one after another
+    stores = models.ZarrStore.objects.get_filled(
+        [
+            *(input.time_trace for input in inputs if input.time_trace),
+            *(recording.trace for input in inputs for recording in input.recordings),
+            *(stimulus.trace for input in inputs for stimulus in input.stimuli),
+        ],
+        datalayer,
+        organization,
+    )
 
-        trace = models.Trace.objects.create(
-            creator=info.context.request.user,
-            organization=info.context.request.organization,
-            name=input.name,
-            store=store,
+    def build_trace(input: CreateSimulationInput, store: str) -> models.Trace:
+        return models.Trace(creator=user, organization=organization, name=input.name, store=stores[str(store)])
+
+    time_traces = [build_time_trace(info, input, stores) for input in inputs]
+    recording_traces = [[build_trace(input, recording.trace) for recording in input.recordings] for input in inputs]
+    stimulus_traces = [[build_trace(input, stimulus.trace) for stimulus in input.stimuli] for input in inputs]
+    traces = [*time_traces, *(trace for group in recording_traces for trace in group), *(trace for group in stimulus_traces for trace in group)]
+
+    batch_size = settings.BULK_CREATE_BATCH_SIZE
+
+    with transaction.atomic():
+        bulk_create_with_provenance(traces, models.Trace, user, batch_size=batch_size)
+
+        simulations = models.Simulation.objects.bulk_create(
+            [
+                models.Simulation(
+                    model=neuron_models[str(input.model)],
+                    duration=input.duration,
+                    name=input.name,
+                    time_trace=time_trace,
+                    dt=input.dt or 1.0,
+                )
+                for input, time_trace in zip(inputs, time_traces)
+            ],
+            batch_size=batch_size,
         )
 
-        recording = models.Recording.objects.create(trace=trace, kind=recording.kind, cell=recording.cell, location=recording.location, position=recording.position, simulation=sims)
+        models.Recording.objects.bulk_create(
+            [
+                models.Recording(trace=trace, kind=recording.kind, cell=recording.cell, location=recording.location, position=recording.position, simulation=simulation)
+                for input, simulation, group in zip(inputs, simulations, recording_traces)
+                for recording, trace in zip(input.recordings, group)
+            ],
+            batch_size=batch_size,
+        )
+        models.Stimulus.objects.bulk_create(
+            [
+                models.Stimulus(trace=trace, kind=stimulus.kind, cell=stimulus.cell, location=stimulus.location, position=stimulus.position, simulation=simulation)
+                for input, simulation, group in zip(inputs, simulations, stimulus_traces)
+                for stimulus, trace in zip(input.stimuli, group)
+            ],
+            batch_size=batch_size,
+        )
 
-    for stimulus in input.stimuli:
-        store = models.ZarrStore.objects.get(id=stimulus.trace)
-        store.fill_info(datalayer)
+        # bulk_create sends no post_save signals, published on commit
+        snapshots = {trace.id: channels.snapshot(trace) for trace in traces} if len(traces) <= settings.CHANNEL_MAX_SNAPSHOTS else None
+        channels.broadcast_traces("create", [(trace.id, trace.organization_id, trace.dataset_id) for trace in traces], snapshots)
 
-        trace = models.Trace.objects.create(
-            creator=info.context.request.user,
-            organization=info.context.request.organization,
-            name=input.name,
-            store=store,
-        )
+    return simulations
 
-        stim = models.Stimulus.objects.create(trace=trace, kind=stimulus.kind, cell=stimulus.cell, location=stimulus.location, position=stimulus.position, simulation=sims)
 
-    return sims
+def create_simulation(
+    info: Info,
+    input: CreateSimulationInput,
+) -> types.Simulation:
+    return create_simulations(info, [input])[0]
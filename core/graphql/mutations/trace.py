@@ -1,9 +1,9 @@
 from kante.types import Info
 import strawberry
 
-from core import types, models, scalars
+from core import types, models, scalars, enums
 from core.datalayer import get_current_datalayer
-import json
+from core.credentials import CredentialScope, get_temporary_credentials
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from core.managers import auto_create_views
@@ -75,42 +75,49 @@ def delete_trace(
 class RequestUploadInput:
     key: str
     datalayer: str
+    content_hash: str | None = strawberry.field(
+        default=None,
+        description="The content hash of an existing store (as computed by the server). If a store with this hash exists in the organization, it is returned (with status 'exists') and nothing needs to be uploaded. The hash is only used for the lookup, never stored",
+    )
 
 
 def request_upload(info: Info, input: RequestUploadInput) -> types.Credentials:
     """Request upload credentials for a given key"""
 
+    if input.content_hash:
+        existing = models.ZarrStore.objects.find_duplicate(input.content_hash, info.context.request.organization)
+        if existing:
+            return types.Credentials(
+                access_key="",
+                secret_key="",
+                session_token="",
+                status="exists",
+                key=existing.key,
+                bucket=existing.bucket,
+                datalayer=input.datalayer,
+                store=existing.id,
+            )
+
     datalayer = get_current_datalayer()
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Sid": "AllowAllS3ActionsInUserFolder",
-                "Effect": "Allow",
-                "Principal": "*",
-                "Action": ["s3:*"],
-                "Resource": "arn:aws:s3:::*",
-            },
-        ],
-    }
 
-    response = datalayer.sts.assume_role(
-        RoleArn="arn:xxx:xxx:xxx:xxxx",
-        RoleSessionName="sdfsdfsdf",
-        Policy=json.dumps(policy, separators=(",", ":")),
-        DurationSeconds=40000,
+    credentials = get_temporary_credentials(
+        datalayer.sts,
+        CredentialScope(
+            organization=str(info.context.request.organization.id),
+            user=str(info.context.request.user.id),
+            bucket=settings.ZARR_BUCKET,
+        ),
     )
 
-    print(response)
-
     path = f"s3://{settings.ZARR_BUCKET}/{input.key}"
 
+    # The content hash is computed by the server once the store is filled
     store = models.ZarrStore.objects.create(path=path, key=input.key, bucket=settings.ZARR_BUCKET)
 
     aws = {
-        "access_key": response["Credentials"]["AccessKeyId"],
-        "secret_key": response["Credentials"]["SecretAccessKey"],
-        "session_token": response["Credentials"]["SessionToken"],
+        "access_key": credentials.access_key,
+        "secret_key": credentials.secret_key,
+        "session_token": credentials.session_token,
         "status": "success",
         "key": input.key,
         "bucket": settings.ZARR_BUCKET,
@@ -132,32 +139,20 @@ def request_access(info: Info, input: RequestAccessInput) -> types.AccessCredent
 
     store = models.ZarrStore.objects.get(id=input.store)
 
-    sts = get_current_datalayer().sts
-
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Sid": "AllowAllS3ActionsInUserFolder",
-                "Effect": "Allow",
-                "Principal": "*",
-                "Action": ["s3:*"],
-                "Resource": "arn:aws:s3:::*",
-            },
-        ],
-    }
-
-    response = sts.assume_role(
-        RoleArn="arn:xxx:xxx:xxx:xxxx",
-        RoleSessionName="sdfsdfsdf",
-        Policy=json.dumps(policy, separators=(",", ":")),
-        DurationSeconds=input.duration or 40000,
+    credentials = get_temporary_credentials(
+        get_current_datalayer().sts,
+        CredentialScope(
+            organization=str(info.context.request.organization.id),
+            user=str(info.context.request.user.id),
+            bucket=store.bucket,
+        ),
+        duration=input.duration or 40000,
     )
 
     aws = {
-        "access_key": response["Credentials"]["AccessKeyId"],
-        "secret_key": response["Credentials"]["SecretAccessKey"],
-        "session_token": response["Credentials"]["SessionToken"],
+        "access_key": credentials.access_key,
+        "secret_key": credentials.secret_key,
+        "session_token": credentials.session_token,
         "key": store.key,
         "bucket": store.bucket,
         "path": store.path,
@@ -180,8 +175,7 @@ def from_trace_like(
 ) -> types.Trace:
     datalayer = get_current_datalayer()
 
-    store = models.ZarrStore.objects.get(id=input.array)
-    store.fill_info(datalayer)
+    store = models.ZarrStore.objects.get_filled([input.array], datalayer, info.context.request.organization)[str(input.array)]
 
     dataset = input.dataset or get_trace_dataset(info)
 
@@ -201,5 +195,37 @@ def from_trace_like(
     return image
 
 
+@strawberry.input(description="A regular time axis t0 + i * dt (for i < n), stored as these three numbers instead of an array")
+class RegularTimeAxisInput:
+    """A regular time axis given by t0, dt and n"""
+
+    dt: float = strawberry.field(description="The interval between two time points")
+    n: int = strawberry.field(description="The number of time points")
+    t0: float = strawberry.field(default=0.0, description="The first time point")
+
+
+def build_regular_time_trace(info: Info, name: str, t0: float, dt: float, n: int) -> models.Trace:
+    """Build (without saving) a trace of kind REGULAR, which has no store"""
+    if dt == 0 or n < 0:
+        raise Exception("A regular time axis needs a non zero dt and a non negative n")
+
+    return models.Trace(
+        creator=info.context.request.user,
+        organization=info.context.request.organization,
+        name=name,
+        kind=enums.TraceKindChoices.REGULAR,
+        t0=t0,
+        dt=dt,
+        n=n,
+    )
+
+
+def create_regular_time_trace(info: Info, name: str, t0: float, dt: float, n: int) -> models.Trace:
+    """Create a trace of kind REGULAR, which has no store"""
+    trace = build_regular_time_trace(info, name, t0, dt, n)
+    trace.save()
+    return trace
+
+
 def get_trace_dataset(info: Info) -> models.Dataset:
     return models.Dataset.objects.get_or_create(organization=info.context.request.organization, user=info.context.request.user, name="Default Dataset")[0]
@@ -1 +1,2 @@
-from .trace import *
\ No newline at end of file
+from .trace import *
+from .pages import *
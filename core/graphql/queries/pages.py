@@ -0,0 +1,49 @@
+import strawberry
+from strawberry_django.filters import apply as apply_filters
+from kante.types import Info
+from core import filters, models, types
+from core.pagination import CursorPage, CursorPaginationInput, is_descending
+from core.utils import paginate_querysets
+
+
+def traces_page(
+    info: Info,
+    filters: filters.TraceFilter | None = strawberry.UNSET,
+    order: filters.TraceOrder | None = strawberry.UNSET,
+    pagination: CursorPaginationInput | None = None,
+) -> CursorPage[types.Trace]:
+    """The traces of the organization, paginated by cursor"""
+    pagination = pagination or CursorPaginationInput()
+    queryset = apply_filters(filters, models.Trace.objects.filter(organization=info.context.request.organization), info)
+    items, next_cursor = paginate_querysets(queryset, after=pagination.after, limit=pagination.first, descending=is_descending(order))
+    return CursorPage(items=items, next_cursor=next_cursor, queryset=queryset)
+
+
+def rois_page(
+    info: Info,
+    filters: filters.ROIFilter | None = strawberry.UNSET,
+    order: filters.ROIOrder | None = strawberry.UNSET,
+    pagination: CursorPaginationInput | None = None,
+) -> CursorPage[types.ROI]:
+    """The rois (on traces of the organization), paginated by cursor
+
+    The created_at of a ROI changes on every update, so ROIs are keyed on
+    their id (in creation order) instead.
+    """
+    pagination = pagination or CursorPaginationInput()
+    queryset = apply_filters(filters, models.ROI.objects.filter(trace__organization=info.context.request.organization), info)
+    items, next_cursor = paginate_querysets(queryset, after=pagination.after, limit=pagination.first, descending=is_descending(order), timestamp=None)
+    return CursorPage(items=items, next_cursor=next_cursor, queryset=queryset)
+
+
+def simulations_page(
+    info: Info,
+    filters: filters.SimulationFilter | None = strawberry.UNSET,
+    order: filters.SimulationOrder | None = strawberry.UNSET,
+    pagination: CursorPaginationInput | None = None,
+) -> CursorPage[types.Simulation]:
+    """The simulations (with a time trace in the organization), paginated by cursor"""
+    pagination = pagination or CursorPaginationInput()
+    queryset = apply_filters(filters, models.Simulation.objects.filter(time_trace__organization=info.context.request.organization), info)
+    items, next_cursor = paginate_querysets(queryset, after=pagination.after, limit=pagination.first, descending=is_descending(order))
+    return CursorPage(items=items, next_cursor=next_cursor, queryset=queryset)
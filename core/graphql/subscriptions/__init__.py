@@ -1,3 +1,4 @@
 from .rois import *
 from .traces import *
-from .files import *
\ No newline at end of file
+from .files import *
+from .datasets import *
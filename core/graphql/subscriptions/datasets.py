@@ -0,0 +1,33 @@
+from typing import AsyncGenerator
+
+import strawberry
+from kante.types import Info
+from core import models, types, channels, coalesce
+
+
+@strawberry.type
+class DatasetEvent:
+    """A change of a dataset in the subscribed dataset"""
+
+    create: types.Dataset | None = None
+    delete: strawberry.ID | None = None
+    update: types.Dataset | None = None
+
+
+async def datasets(
+    self,
+    info: Info,
+    parent: strawberry.ID,
+    coalesce_ms: int | None = None,
+) -> AsyncGenerator[DatasetEvent, None]:
+    """Subscribe to the changes of the datasets in a dataset (including datasets moved in or out)"""
+
+    parent_model = await models.Dataset.objects.aget(id=parent, organization=info.context.request.organization)
+    schannels = [channels.dataset_children_group(parent_model.id)]
+
+    async for changes in coalesce.listen_changes(channels.dataset_channel, info.context, schannels, coalesce_ms):
+        async for action, id, dataset in channels.aresolve_changes(models.Dataset, changes):
+            if action == "delete":
+                yield DatasetEvent(delete=id)
+            else:
+                yield DatasetEvent(**{action: dataset})
@@ -3,7 +3,7 @@ from typing import AsyncGenerator
 import strawberry
 import strawberry_django
 from kante.types import Info
-from core import models, scalars, types, channels
+from core import models, scalars, types, channels, coalesce
 
 
 @strawberry.type
@@ -18,30 +18,19 @@ async def files(
     self,
     info: Info,
     dataset: strawberry.ID | None = None,
+    coalesce_ms: int | None = None,
 ) -> AsyncGenerator[FileEvent, None]:
     """Join and subscribe to message sent to the given rooms."""
 
     if dataset is None:
-        schannels = ["files"]
+        schannels = [channels.organization_files_group(info.context.request.organization.id)]
     else:
-        schannels = ["dataset_files_" + str(dataset)]
-
-
-
-    async for message in channels.file_channel.listen(info.context, schannels):
-        print("Received message", message)
-        if message["type"] == "create":
-            roi = await models.File.objects.aget(
-                id=message["id"]
-            )
-            yield FileEvent(create=roi)
-
-        elif message["type"] == "delete":
-            yield FileEvent(delete=message["id"])
-
-        elif message["type"] == "update":
-            roi = await models.File.objects.aget(
-                id=message["id"]
-            )
-            yield FileEvent(update=roi)
-
+        dataset_model = await models.Dataset.objects.aget(id=dataset, organization=info.context.request.organization)
+        schannels = [channels.dataset_files_group(dataset_model.id)]
+
+    async for changes in coalesce.listen_changes(channels.file_channel, info.context, schannels, coalesce_ms):
+        async for action, id, file in channels.aresolve_changes(models.File, changes):
+            if action == "delete":
+                yield FileEvent(delete=id)
+            else:
+                yield FileEvent(**{action: file})
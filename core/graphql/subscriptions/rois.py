@@ -3,7 +3,8 @@ from typing import AsyncGenerator
 import strawberry
 import strawberry_django
 from kante.types import Info
-from core import models, scalars, types, channels
+from core import models, scalars, types, channels, coalesce, matching
+from core.filters import ROIFilter
 
 
 @strawberry.type
@@ -17,30 +18,18 @@ async def rois(
     self,
     info: Info,
     trace: strawberry.ID,
+    coalesce_ms: int | None = None,
+    filters: ROIFilter | None = None,
 ) -> AsyncGenerator[RoiEvent, None]:
     """Join and subscribe to message sent to the given rooms."""
 
+    trace_model = await models.Trace.objects.aget(id=trace, organization=info.context.request.organization)
+    schannels = ["rois_trace" + str(trace_model.id)]
 
-
-    if trace is None:
-        schannels = ["rois"]
-    else:
-        schannels = ["rois_trace" + str(trace)]
-
-    async for message in channels.trace_channel.listen(info.context, schannels):
-        print("Received message", message)
-        if message.create:
-            roi = await models.ROI.objects.aget(
-                id=message.create
-            )
-            yield RoiEvent(create=roi)
-
-        elif message.delete:
-            yield RoiEvent(delete=message.delete)
-
-        elif message.update:
-            roi = await models.ROI.objects.aget(
-                id=message.update
-            )
-            yield RoiEvent(update=roi)
-
+    async for changes in coalesce.listen_changes(channels.roi_channel, info.context, schannels, coalesce_ms):
+        resolved = [change async for change in channels.aresolve_changes(models.ROI, changes)]
+        async for action, id, roi in matching.afilter_changes(filters, models.ROI, resolved, info):
+            if action == "delete":
+                yield RoiEvent(delete=id)
+            else:
+                yield RoiEvent(**{action: roi})
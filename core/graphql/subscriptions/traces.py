@@ -3,7 +3,8 @@ from typing import AsyncGenerator
 import strawberry
 import strawberry_django
 from kante.types import Info
-from core import models, scalars, types, channels
+from core import models, scalars, types, channels, coalesce, matching
+from core.filters import TraceFilter
 
 @strawberry.type
 class TraceEvent:
@@ -17,28 +18,21 @@ async def traces(
     self,
     info: Info,
     dataset: strawberry.ID | None = None,
+    coalesce_ms: int | None = None,
+    filters: TraceFilter | None = None,
 ) -> AsyncGenerator[TraceEvent, None]:
     """Join and subscribe to message sent tso the given rooms."""
 
     if dataset is None:
-        schannels = ["images"]
+        schannels = [channels.organization_traces_group(info.context.request.organization.id)]
     else:
-        schannels = ["dataset_images_" + str(dataset)]
-
-    async for message in channels.trace_channel.listen(info.context, schannels):
-        print("Received message", message)
-        if message.create:
-            roi = await models.Trace.objects.aget(
-                id=message.create
-            )
-            yield TraceEvent(create=roi)
-
-        elif message.delete:
-            yield TraceEvent(delete=message.delete)
-
-        elif message.update:
-            roi = await models.Trace.objects.aget(
-                id=message.update
-            )
-            yield TraceEvent(update=roi)
-
+        dataset_model = await models.Dataset.objects.aget(id=dataset, organization=info.context.request.organization)
+        schannels = [channels.dataset_traces_group(dataset_model.id)]
+
+    async for changes in coalesce.listen_changes(channels.trace_channel, info.context, schannels, coalesce_ms):
+        resolved = [change async for change in channels.aresolve_changes(models.Trace, changes)]
+        async for action, id, trace in matching.afilter_changes(filters, models.Trace, resolved, info):
+            if action == "delete":
+                yield TraceEvent(delete=id)
+            else:
+                yield TraceEvent(**{action: trace})
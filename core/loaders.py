@@ -0,0 +1,104 @@
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Hashable
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Min, Model
+from strawberry.dataloader import DataLoader
+from strawberry.extensions import SchemaExtension
+from taggit.models import TaggedItem
+
+loaders: ContextVar = ContextVar("loaders", default=None)
+
+
+class Loaders:
+    """Request scoped DataLoaders for per row resolvers
+
+    Every loader is created on first use and kept for the operation, so all
+    rows resolved in one operation share it and a field costs one IN query
+    instead of one query per row. New per row resolvers add a method that
+    calls ``get`` with a unique key and a (sync) batch function, which maps
+    a list of keys to a list of values in the same order.
+    """
+
+    def __init__(self) -> None:
+        """Start without loaders"""
+        self._loaders: dict[Hashable, DataLoader] = {}
+
+    def get(self, key: Hashable, load: Callable[[list[Any]], list[Any]]) -> DataLoader:
+        """The loader of key, created with load on first use"""
+        loader = self._loaders.get(key)
+        if loader is None:
+
+            async def load_fn(keys: list[Any]) -> list[Any]:
+                return await sync_to_async(load)(list(keys))
+
+            loader = self._loaders[key] = DataLoader(load_fn=load_fn)
+        return loader
+
+    def pinned(self, model: type[Model], user_id: int) -> DataLoader:
+        """Whether the user pinned the rows (by id), for models with a pinned_by field"""
+        field = model._meta.get_field("pinned_by")
+        through = field.remote_field.through
+        source, target = field.m2m_column_name(), field.m2m_reverse_name()
+
+        def load(ids: list[int]) -> list[bool]:
+            pinned = set(through.objects.filter(**{f"{source}__in": ids, target: user_id}).values_list(source, flat=True))
+            return [id in pinned for id in ids]
+
+        return self.get(("pinned", model, user_id), load)
+
+    def tags(self, model: type[Model]) -> DataLoader:
+        """The tag slugs of the rows (by id), for models with a TaggableManager"""
+
+        def load(ids: list[int]) -> list[list[str]]:
+            content_type = ContentType.objects.get_for_model(model)
+            tags = defaultdict(list)
+            for object_id, slug in TaggedItem.objects.filter(content_type=content_type, object_id__in=ids).values_list("object_id", "tag__slug"):
+                tags[object_id].append(slug)
+            return [tags[id] for id in ids]
+
+        return self.get(("tags", model), load)
+
+    def collections(self) -> DataLoader:
+        """The model collections of the neuron models (by id), each with the json model of its first model"""
+        from core.models import ModelCollection
+
+        def load(ids: list[int]) -> list[list[tuple[ModelCollection, dict]]]:
+            through = ModelCollection.models.through
+            memberships = list(through.objects.filter(neuronmodel_id__in=ids).values_list("neuronmodel_id", "modelcollection_id"))
+            collections = ModelCollection.objects.in_bulk({collection_id for _, collection_id in memberships})
+
+            # The first model of a collection is the one with the lowest id
+            firsts = dict(
+                through.objects.filter(modelcollection_id__in=collections.keys())
+                .values("modelcollection_id")
+                .annotate(first=Min("neuronmodel_id"))
+                .values_list("modelcollection_id", "first")
+            )
+            json_models = dict(ModelCollection.models.field.related_model.objects.filter(id__in=set(firsts.values())).values_list("id", "json_model"))
+
+            result = defaultdict(list)
+            for model_id, collection_id in sorted(memberships, key=lambda membership: membership[1]):
+                result[model_id].append((collections[collection_id], json_models[firsts[collection_id]]))
+            return [result[id] for id in ids]
+
+        return self.get(("collections",), load)
+
+
+def get_current_loaders() -> Loaders:
+    """The loaders of the current operation (fresh ones outside of an operation)"""
+    return loaders.get() or Loaders()
+
+
+class LoadersExtension(SchemaExtension):
+    """Attaches fresh Loaders to every operation"""
+
+    def on_operation(self):
+        """Attach fresh loaders to the operation"""
+        token = loaders.set(Loaders())
+        try:
+            yield
+        finally:
+            loaders.reset(token)
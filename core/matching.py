@@ -0,0 +1,149 @@
+import enum
+import re
+from typing import Any, AsyncIterator, TypeVar
+
+import strawberry
+import strawberry_django
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Model
+from kante import Info
+from strawberry_django.filters import FilterLookup
+
+M = TypeVar("M", bound=Model)
+
+# Decides nothing about membership
+IGNORED = {"DISTINCT"}
+
+
+def is_set(value: Any) -> bool:
+    """Whether a filter value is given"""
+    return value is not None and value is not strawberry.UNSET
+
+
+def normalize(value: Any) -> Any:
+    """The value of an enum, other values as they are"""
+    return value.value if isinstance(value, enum.Enum) else value
+
+
+def same(left: Any, right: Any) -> bool:
+    """Equality of a column and a filter value (IDs are strings in GraphQL)"""
+    left, right = normalize(left), normalize(right)
+    if isinstance(left, int) and isinstance(right, str):
+        return str(left) == right
+    return left == right
+
+
+def lookup_matches(lookup: FilterLookup, value: Any) -> bool | None:
+    """Whether the value passes all the lookups that are set, None for lookups that are not evaluated in memory"""
+    for name in ("exact", "i_exact", "contains", "i_contains", "in_list", "gt", "gte", "lt", "lte", "starts_with", "i_starts_with", "ends_with", "i_ends_with", "range", "is_null", "regex", "i_regex"):
+        expected = getattr(lookup, name, None)
+        if not is_set(expected):
+            continue
+
+        if name == "is_null":
+            result = (value is None) == expected
+        elif value is None:
+            result = False
+        elif name == "exact":
+            result = same(value, expected)
+        elif name == "in_list":
+            result = any(same(value, item) for item in expected)
+        elif name in ("gt", "gte", "lt", "lte"):
+            result = {"gt": value > expected, "gte": value >= expected, "lt": value < expected, "lte": value <= expected}[name]
+        elif name == "range":
+            result = expected[0] <= value <= expected[1]
+        elif isinstance(value, str):
+            folded = name.startswith("i_")
+            text, pattern = (value.lower(), str(expected).lower()) if folded else (value, str(expected))
+            result = {
+                "exact": text == pattern,
+                "contains": pattern in text,
+                "starts_with": text.startswith(pattern),
+                "ends_with": text.endswith(pattern),
+                "regex": re.search(pattern, text) is not None,
+            }[name.removeprefix("i_")]
+        else:
+            return None
+
+        if not result:
+            return False
+    return True
+
+
+def filter_matches(filter: Any, model: type[Model], values: dict[str, Any]) -> bool | None:
+    """Whether a row (the loaded columns by attname) matches a strawberry_django filter
+
+    Fields with a custom ``filter_<name>`` method are evaluated by the
+    ``match_<name>`` method of the filter, plain fields by equality or
+    their FilterLookup. Returns None if a field can not be decided in
+    memory (e.g. it spans a relation or its column is not loaded).
+    """
+    undecided = False
+    for field in filter.__strawberry_definition__.fields:
+        name = field.python_name
+        value = getattr(filter, name, None)
+        if not is_set(value) or name in IGNORED:
+            continue
+
+        if name == "OR":
+            # Alternatives to the whole filter, left to the database
+            undecided = True
+            continue
+        elif name in ("AND", "NOT"):
+            result = filter_matches(value, model, values)
+            if name == "NOT" and result is not None:
+                result = not result
+        elif hasattr(filter, f"match_{name}"):
+            result = getattr(filter, f"match_{name}")(values)
+        elif hasattr(filter, f"filter_{name}"):
+            result = None
+        else:
+            result = column_matches(model, name, value, values)
+
+        if result is False:
+            return False
+        if result is None:
+            undecided = True
+    return None if undecided else True
+
+
+def column_matches(model: type[Model], name: str, value: Any, values: dict[str, Any]) -> bool | None:
+    """Whether the column name of the row values matches value, None if it can not be told from the values"""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    attname = getattr(field, "attname", None)
+    if attname is None or attname not in values:
+        return None
+
+    if isinstance(value, FilterLookup):
+        return lookup_matches(value, values[attname])
+    if hasattr(value, "__strawberry_definition__"):
+        # A filter of the related model
+        return None
+    return same(values[attname], value)
+
+
+async def afilter_changes(filter: Any, model: type[M], changes: list[tuple[str, int, M | None]], info: Info) -> AsyncIterator[tuple[str, int, M | None]]:
+    """The resolved changes whose rows match the filter
+
+    Rows are matched in memory where possible, the undecided ones with one
+    query for the batch. Deletes are always passed on, the deleted row
+    can not be matched anymore.
+    """
+    if filter is None:
+        for change in changes:
+            yield change
+        return
+
+    decided = {id: filter_matches(filter, model, instance.__dict__) for action, id, instance in changes if instance is not None}
+    undecided = [id for id, result in decided.items() if result is None]
+    if undecided:
+        matching = await sync_to_async(lambda: set(strawberry_django.filters.apply(filter, model.objects.filter(id__in=undecided), info).values_list("id", flat=True)))()
+        decided.update({id: id in matching for id in undecided})
+
+    for action, id, instance in changes:
+        if action == "delete" or decided.get(id):
+            yield action, id, instance
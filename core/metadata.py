@@ -0,0 +1,310 @@
+import dataclasses
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+
+class ZarrMetadataNotFound(Exception):
+    """Raised when no zarr array metadata could be found in a store"""
+
+
+@dataclasses.dataclass
+class ZarrMetadata:
+    """The parsed metadata of a zarr array"""
+
+    shape: list[int]
+    chunks: list[int]
+    dtype: str
+    version: str
+    key: str  # the key of the document the metadata was read from
+    document: dict[str, Any] = dataclasses.field(default_factory=dict)
+    etag: str | None = None
+    array_key: str | None = None  # the key prefix of the array (where its chunks live)
+
+    def __post_init__(self) -> None:
+        """Default the array key to the directory of the metadata document"""
+        if self.array_key is None:
+            self.array_key = self.key.rsplit("/", 1)[0]
+
+
+def parse_zarray(document: dict[str, Any], key: str, etag: str | None = None) -> ZarrMetadata:
+    """Parse a zarr v2 '.zarray' document"""
+    return ZarrMetadata(
+        shape=document.get("shape"),
+        chunks=document.get("chunks"),
+        dtype=document.get("dtype"),
+        version="2",
+        key=key,
+        document=document,
+        etag=etag,
+    )
+
+
+def parse_zarr_json(document: dict[str, Any], key: str, etag: str | None = None) -> ZarrMetadata | None:
+    """Parse a zarr v3 'zarr.json' document
+
+    Returns None if the document describes a group and has no consolidated
+    metadata for the 'data' array.
+    """
+    if document.get("node_type") == "group":
+        consolidated = (document.get("consolidated_metadata") or {}).get("metadata") or {}
+        if "data" in consolidated:
+            metadata = parse_zarr_json(consolidated["data"], key, etag)
+            if metadata is not None:
+                metadata.array_key = f"{key.rsplit('/', 1)[0]}/data"
+            return metadata
+        return None
+
+    return ZarrMetadata(
+        shape=document["shape"],
+        chunks=document.get("chunk_grid", {}).get("configuration", {}).get("chunk_shape", []),
+        dtype=document["data_type"],
+        version="3",
+        key=key,
+        document=document,
+        etag=etag,
+    )
+
+
+def parse_zmetadata(document: dict[str, Any], key: str, etag: str | None = None) -> ZarrMetadata | None:
+    """Parse a consolidated zarr v2 '.zmetadata' document"""
+    zarray = (document.get("metadata") or {}).get("data/.zarray")
+    if zarray is None:
+        return None
+    metadata = parse_zarray(zarray, key, etag)
+    metadata.array_key = f"{key.rsplit('/', 1)[0]}/data"
+    return metadata
+
+
+def _get_json(s3: Any, bucket: str, key: str) -> tuple[dict[str, Any], str | None] | None:
+    """Get and decode a json document, returns None if the key does not exist"""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+            return None
+        raise
+
+    return json.loads(response["Body"].read().decode("utf-8")), response.get("ETag")
+
+
+# The metadata documents that are probed directly, in order. Each one is a
+# single GET, independent of the number of chunks in the store.
+PROBES: list[tuple[str, Callable[..., ZarrMetadata | None]]] = [
+    ("data/.zarray", parse_zarray),
+    ("zarr.json", parse_zarr_json),
+    ("data/zarr.json", parse_zarr_json),
+    (".zmetadata", parse_zmetadata),
+]
+
+
+def list_zarr_metadata(s3: Any, bucket: str, prefix: str) -> ZarrMetadata | None:
+    """Find the array metadata by listing the store (paginated)
+
+    This is O(number of objects) and is only used as a fallback for stores
+    with an unusual layout.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".zarray"):
+                array_name = obj["Key"].split("/")[-2]
+                assert array_name == "data", "If using zarr v2, the array name must be 'data'"
+
+                found = _get_json(s3, bucket, obj["Key"])
+                if found:
+                    return parse_zarray(found[0], obj["Key"], found[1])
+
+            if obj["Key"].endswith("zarr.json"):
+                found = _get_json(s3, bucket, obj["Key"])
+                if found:
+                    metadata = parse_zarr_json(found[0], obj["Key"], found[1])
+                    if metadata:
+                        return metadata
+
+    return None
+
+
+def probe_zarr_metadata(s3: Any, bucket: str, prefix: str) -> ZarrMetadata:
+    """Read the metadata of the zarr array stored under prefix
+
+    The well known metadata keys are fetched directly. Only when none of
+    them exist is the store listed (page by page) to find the metadata.
+    """
+    prefix = prefix.rstrip("/")
+
+    for suffix, parse in PROBES:
+        key = f"{prefix}/{suffix}"
+        found = _get_json(s3, bucket, key)
+        if found is None:
+            continue
+
+        metadata = parse(found[0], key, found[1])
+        if metadata is not None:
+            return metadata
+
+    metadata = list_zarr_metadata(s3, bucket, prefix)
+    if metadata is None:
+        raise ZarrMetadataNotFound(f"Could not find zarr array metadata in s3://{bucket}/{prefix}")
+
+    return metadata
+
+
+# Objects that older versions derived from the array (pyramid and range index)
+# inside its store, they are not part of its content
+DERIVED_PREFIXES = ("pyramid/", "stats/")
+
+
+def compute_content_hash(s3: Any, bucket: str, prefix: str) -> str:
+    """A hash of the content of the store, computed from the ETags of its objects
+
+    Lists the store (one request per thousand objects), no object is read.
+    Stores with byte identical objects under the same relative keys get the
+    same hash, independent of where they are stored.
+    """
+    prefix = prefix.rstrip("/")
+    paginator = s3.get_paginator("list_objects_v2")
+
+    entries = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        for obj in page.get("Contents", []):
+            key = obj["Key"][len(prefix) + 1 :]
+            if not key.startswith(DERIVED_PREFIXES):
+                entries.append(f"{key}\0{obj['ETag']}\0{obj['Size']}\n")
+
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+    return f"etags-sha256:{digest.hexdigest()}"
+
+
+def delete_objects(s3: Any, bucket: str, prefix: str) -> None:
+    """Delete every object under the prefix, a thousand objects per request"""
+    prefix = prefix.rstrip("/")
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if keys:
+            s3.delete_objects(Bucket=bucket, Delete={"Objects": keys, "Quiet": True})
+
+
+cache_hits = metrics.counter("zarr_metadata_cache_hits", "Metadata lookups answered from the cache")
+cache_revalidations = metrics.counter("zarr_metadata_cache_revalidations", "Stale cache entries that were still valid (same ETag)")
+cache_misses = metrics.counter("zarr_metadata_cache_misses", "Metadata lookups that had to probe the store")
+
+
+class ZarrMetadataCache:
+    """A two tier cache of parsed zarr metadata
+
+    Entries are kept in a process local LRU and in the configured django
+    cache (shared between workers). An entry is trusted for
+    ``settings.ZARR_METADATA_REVALIDATE`` seconds, after that it is
+    revalidated against the ETag of its metadata document.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """Keep at most maxsize entries in the process local tier"""
+        self.maxsize = maxsize
+        self._local: OrderedDict[str, tuple[ZarrMetadata, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cache_key(self, path: str) -> str:
+        """The key of the path in the shared Django cache"""
+        return f"zarr_metadata:{path}"
+
+    def get(self, path: str) -> tuple[ZarrMetadata, float] | None:
+        """The metadata of the path and when it was last checked, None if it is not cached"""
+        with self._lock:
+            entry = self._local.get(path)
+            if entry is not None:
+                self._local.move_to_end(path)
+                return entry
+
+        shared = cache.get(self.cache_key(path))
+        if shared is None:
+            return None
+
+        entry = ZarrMetadata(**shared["metadata"]), shared["checked_at"]
+        self._set_local(path, entry)
+        return entry
+
+    def set(self, path: str, metadata: ZarrMetadata) -> None:
+        """Cache the metadata of the path in both tiers, checked now"""
+        checked_at = time.time()
+        self._set_local(path, (metadata, checked_at))
+        cache.set(
+            self.cache_key(path),
+            {"metadata": dataclasses.asdict(metadata), "checked_at": checked_at},
+            timeout=settings.ZARR_METADATA_CACHE_TIMEOUT,
+        )
+
+    def delete(self, path: str) -> None:
+        """Forget the metadata of the path in both tiers"""
+        with self._lock:
+            self._local.pop(path, None)
+        cache.delete(self.cache_key(path))
+
+    def clear(self) -> None:
+        """Clear the process local tier"""
+        with self._lock:
+            self._local.clear()
+
+    def _set_local(self, path: str, entry: tuple[ZarrMetadata, float]) -> None:
+        with self._lock:
+            self._local[path] = entry
+            self._local.move_to_end(path)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+
+metadata_cache = ZarrMetadataCache(maxsize=settings.ZARR_METADATA_CACHE_SIZE)
+
+
+def _is_unchanged(s3: Any, bucket: str, metadata: ZarrMetadata) -> bool:
+    """Check whether the metadata document still has the cached ETag"""
+    if metadata.etag is None:
+        return False
+
+    try:
+        response = s3.head_object(Bucket=bucket, Key=metadata.key)
+    except ClientError:
+        return False
+
+    return response.get("ETag") == metadata.etag
+
+
+def get_zarr_metadata(s3: Any, bucket: str, prefix: str) -> ZarrMetadata:
+    """Get the metadata of the zarr array under prefix, using the cache
+
+    Fresh entries are returned without touching S3, stale entries cost a
+    single HEAD request and only a miss probes the store.
+    """
+    path = f"{bucket}/{prefix.rstrip('/')}"
+
+    entry = metadata_cache.get(path)
+    if entry is not None:
+        metadata, checked_at = entry
+        if time.time() - checked_at < settings.ZARR_METADATA_REVALIDATE:
+            cache_hits.inc()
+            return metadata
+
+        if _is_unchanged(s3, bucket, metadata):
+            cache_revalidations.inc()
+            metadata_cache.set(path, metadata)
+            return metadata
+
+    cache_misses.inc()
+    metadata = probe_zarr_metadata(s3, bucket, prefix)
+    metadata_cache.set(path, metadata)
+    return metadata
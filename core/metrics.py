@@ -0,0 +1,39 @@
+import threading
+
+
+class Counter:
+    """A monotonically increasing, thread safe counter"""
+
+    def __init__(self, name: str, description: str = "") -> None:
+        """Create a counter starting at zero"""
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        """Increment the counter by amount"""
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        """The current value of the counter"""
+        return self._value
+
+
+_counters: dict[str, Counter] = {}
+_lock = threading.Lock()
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Get or create the process wide counter with the given name"""
+    with _lock:
+        if name not in _counters:
+            _counters[name] = Counter(name, description)
+        return _counters[name]
+
+
+def snapshot() -> dict[str, int]:
+    """The current value of all counters"""
+    return {name: c.value for name, c in sorted(_counters.items())}
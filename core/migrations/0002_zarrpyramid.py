@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZarrPyramid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factor', models.IntegerField(help_text='The number of bins of a level that are combined into one bin of the next level')),
+                ('levels', models.JSONField(default=list, help_text='The levels of the pyramid, finest first')),
+                ('source_etag', models.CharField(blank=True, help_text='The ETag of the array metadata the pyramid was built from', max_length=1000, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pyramid', to='core.zarrstore')),
+            ],
+        ),
+    ]
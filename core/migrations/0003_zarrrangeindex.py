@@ -0,0 +1,22 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_zarrpyramid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZarrRangeIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.JSONField(help_text='Where and how the tree of the index is stored')),
+                ('source_etag', models.CharField(blank=True, help_text='The ETag of the array metadata the index was built from', max_length=1000, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='range_index', to='core.zarrstore')),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+import core.enums
+import django_choices_field.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_zarrrangeindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trace',
+            name='t0',
+            field=models.FloatField(blank=True, help_text='The first time point of a regular time axis (kind REGULAR)', null=True),
+        ),
+        migrations.AddField(
+            model_name='trace',
+            name='dt',
+            field=models.FloatField(blank=True, help_text='The interval between the time points of a regular time axis (kind REGULAR)', null=True),
+        ),
+        migrations.AddField(
+            model_name='trace',
+            name='n',
+            field=models.IntegerField(blank=True, help_text='The number of time points of a regular time axis (kind REGULAR)', null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaltrace',
+            name='t0',
+            field=models.FloatField(blank=True, help_text='The first time point of a regular time axis (kind REGULAR)', null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaltrace',
+            name='dt',
+            field=models.FloatField(blank=True, help_text='The interval between the time points of a regular time axis (kind REGULAR)', null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaltrace',
+            name='n',
+            field=models.IntegerField(blank=True, help_text='The number of time points of a regular time axis (kind REGULAR)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='trace',
+            name='kind',
+            field=django_choices_field.fields.TextChoicesField(choices=[('TIME', 'Mask (Value represent Labels)'), ('VOLTAGE', 'Voltage (Value represent Intensity)'), ('CURRENT', 'Current (Value represent Intensity)'), ('UNKNOWN', 'Unknown'), ('REGULAR', 'Regular time axis (computed from t0, dt and n, no store)')], choices_enum=core.enums.TraceKindChoices, default='UNKNOWN', help_text='The Representation can have vasrying kind, consult your API', max_length=7),
+        ),
+        migrations.AlterField(
+            model_name='historicaltrace',
+            name='kind',
+            field=django_choices_field.fields.TextChoicesField(choices=[('TIME', 'Mask (Value represent Labels)'), ('VOLTAGE', 'Voltage (Value represent Intensity)'), ('CURRENT', 'Current (Value represent Intensity)'), ('UNKNOWN', 'Unknown'), ('REGULAR', 'Regular time axis (computed from t0, dt and n, no store)')], choices_enum=core.enums.TraceKindChoices, default='UNKNOWN', help_text='The Representation can have vasrying kind, consult your API', max_length=7),
+        ),
+    ]
@@ -0,0 +1,22 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_trace_regular_time_axis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zarrstore',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='The hash of the content of the store, computed by the server from the ETags of its objects (in the background)', max_length=1000, null=True),
+        ),
+        migrations.AddField(
+            model_name='zarrstore',
+            name='canonical',
+            field=models.ForeignKey(blank=True, help_text='The older store with the same content, if this store is an alias of it', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='aliases', to='core.zarrstore'),
+        ),
+    ]
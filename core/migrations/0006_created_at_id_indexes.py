@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_zarrstore_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trace',
+            index=models.Index(fields=['created_at', 'id'], name='trace_created_at_id'),
+        ),
+        migrations.AddIndex(
+            model_name='simulation',
+            index=models.Index(fields=['created_at', 'id'], name='simulation_created_at_id'),
+        ),
+    ]
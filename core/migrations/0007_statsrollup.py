@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentikate', '0002_membership'),
+        ('core', '0006_created_at_id_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='The label of the aggregated model (e.g. core.block)', max_length=100)),
+                ('timestamp_field', models.CharField(help_text='The datetime field the rows are bucketed by', max_length=100)),
+                ('granularity', models.CharField(help_text='The size of the bucket (hour, day, ...)', max_length=20)),
+                ('bucket', models.DateTimeField(help_text='The start of the bucket')),
+                ('count', models.IntegerField(help_text='The number of rows in the bucket')),
+                ('values', models.JSONField(default=dict, help_text='The aggregates (count, distinctCount, min, max, sum) of every rolled up field')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='authentikate.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('model', 'organization', 'timestamp_field', 'granularity', 'bucket'), name='unique_stats_rollup')],
+            },
+        ),
+    ]
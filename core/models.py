@@ -1,6 +1,8 @@
 import random
 import uuid
-from django.db import models
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.forms import FileField
 from taggit.managers import TaggableManager
@@ -9,15 +11,24 @@ from koherent.fields import ProvenanceField, HistoricForeignKey
 from django_choices_field import TextChoicesField
 from core.fields import S3Field
 from core.datalayer import Datalayer
+from core.metadata import compute_content_hash, delete_objects, get_zarr_metadata
+from core import metrics
+from core.arrays import ZarrArray
+from core.envelope import Envelope, PyramidBuilder, PyramidLevel, read_envelope, schedule_indexes
+from core.rangestats import RangeIndex, RangeIndexBuilder, RangeStats, read_range_stats
+from core.timeaxis import RegularTimeAxis
+from core.presign import presign_urls
 
 # Create your models here.
 import boto3
-import json
+import dataclasses
 from django.conf import settings
-from django.core.cache import cache
 from authentikate.models import Organization, Membership
 from polymorphic.models import PolymorphicModel
 
+duplicate_stores_aliased = metrics.counter("zarr_duplicate_stores_aliased", "Stores that were made aliases of an older store with the same content")
+alias_stores_collected = metrics.counter("zarr_alias_stores_collected", "Alias stores whose objects were removed from S3")
+
 
 class DatasetManager(models.Manager):
     def get_current_default_for_user(self, user):
@@ -107,57 +118,234 @@ class S3Store(models.Model):
     populated = models.BooleanField(default=False)
 
 
+class ZarrStoreManager(models.Manager):
+    """Looks up zarr stores in batches"""
+
+    def get_filled(self, ids: Iterable[str], datalayer: Datalayer, organization: Organization | None = None) -> dict[str, "ZarrStore"]:
+        """Get the stores with the given ids and fill their info in one batch
+
+        Returns a mapping of the (string) id to the populated store. Aliases
+        (see ZarrStore.deduplicate) are mapped to their canonical store. If an
+        organization is given, stores whose (server computed) content hash
+        matches an older store in the organization are mapped to that store
+        instead.
+        """
+        ids = {str(id) for id in ids}
+        stores = {str(store.id): store.canonical or store for store in self.filter(id__in=ids).select_related("canonical")}
+
+        missing = ids - stores.keys()
+        if missing:
+            raise self.model.DoesNotExist(f"ZarrStores {', '.join(sorted(missing))} do not exist")
+
+        self.model.fill_info_many(list(stores.values()), datalayer)
+
+        if organization is not None:
+            canonical = self.get_canonical(stores.values(), organization)
+            stores = {id: canonical.get(store.content_hash, store) for id, store in stores.items()}
+
+        return stores
+
+    def get_canonical(self, stores: Iterable["ZarrStore"], organization: Organization) -> dict[str, "ZarrStore"]:
+        """Map the content hashes of the stores to the oldest populated store with that content in the organization
+
+        A store belongs to an organization if one of its traces does.
+        """
+        hashes = {store.content_hash for store in stores if store.content_hash}
+        if not hashes:
+            return {}
+
+        canonical: dict[str, ZarrStore] = {}
+        for store in self.filter(content_hash__in=hashes, populated=True, canonical=None, trace__organization=organization).order_by("id").distinct():
+            canonical.setdefault(store.content_hash, store)
+        return canonical
+
+    def find_duplicate(self, content_hash: str, organization: Organization) -> "ZarrStore | None":
+        """The oldest populated store with this content in the organization, if any"""
+        return self.filter(content_hash=content_hash, populated=True, canonical=None, trace__organization=organization).order_by("id").first()
+
+    def collect_aliases(self, datalayer: Datalayer) -> list["ZarrStore"]:
+        """Remove the objects of aliases that no trace uses anymore from S3
+
+        This is never run automatically. The rows are kept, so the ids the
+        clients hold still resolve to the canonical stores. Returns the
+        collected aliases.
+        """
+        s3 = datalayer.s3v4
+        collected = []
+        for store in self.filter(canonical__isnull=False, trace__isnull=True).order_by("id"):
+            bucket_name, prefix = store.location
+            delete_objects(s3, bucket_name, prefix)
+            delete_objects(s3, bucket_name, store.derived_prefix)
+            alias_stores_collected.inc()
+            collected.append(store)
+        return collected
+
+
 class ZarrStore(S3Store):
     shape = models.JSONField(null=True, blank=True)
     chunks = models.JSONField(null=True, blank=True)
     dtype = models.CharField(max_length=1000, null=True, blank=True)
+    content_hash = models.CharField(
+        max_length=1000,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="The hash of the content of the store, computed by the server from the ETags of its objects (in the background)",
+    )
+    canonical = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="aliases",
+        help_text="The older store with the same content, if this store is an alias of it",
+    )
 
-    def fill_info(self, datalayer: Datalayer) -> None:
-        # Create a boto3 S3 client
-        s3 = datalayer.s3v4
+    objects = ZarrStoreManager()
 
-        # Extract the bucket and key from the S3 path
+    @property
+    def location(self) -> tuple[str, str]:
+        """The bucket and the key prefix of the array, extracted from the S3 path"""
         bucket_name, prefix = self.path.replace("s3://", "").split("/", 1)
+        return bucket_name, prefix
+
+    @property
+    def derived_prefix(self) -> str:
+        """The key prefix of the objects the server derives from the store (pyramid and range index)"""
+        return f"{settings.ZARR_DERIVED_PREFIX}/{self.id}"
+
+    def read_info(self, s3) -> None:
+        """Read the zarr metadata from s3 into this store (without saving)
+
+        Only touches the network, never the database, so it is safe to call
+        from a worker thread.
+        """
+        bucket_name, prefix = self.location
+
+        metadata = get_zarr_metadata(s3, bucket_name, prefix)
+
+        self.shape = metadata.shape
+        self.chunks = metadata.chunks
+        self.dtype = metadata.dtype
+        self.version = metadata.version
 
-        # List all files under the given prefix
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-
-        # Check if the '.zarray' file exists and retrieve its content
-        for obj in response.get("Contents", []):
-            if obj["Key"].endswith(".zarray"):
-                array_name = obj["Key"].split("/")[-2]
-                assert array_name == "data", "If using zarr v2, the array name must be 'data'"
-
-                # Get the content of the '.zarray' file
-                zarray_file = s3.get_object(Bucket=bucket_name, Key=obj["Key"])
-                zarray_content = zarray_file["Body"].read().decode("utf-8")
-                zarray_json = json.loads(zarray_content)
-
-                # Retrieve the 'shape' and 'chunks' attributes
-
-                self.shape = zarray_json.get("shape")
-                self.chunks = zarray_json.get("chunks")
-                self.dtype = zarray_json.get("dtype")
-                self.version = "2"
-                break
-
-            if obj["Key"].endswith("zarr.json"):
-                array_name = obj["Key"].split("/")[-2]
-
-                # Get the content of the '.zarray' file
-                zarray_file = s3.get_object(Bucket=bucket_name, Key=obj["Key"])
-                zarray_content = zarray_file["Body"].read().decode("utf-8")
-                zarray_json = json.loads(zarray_content)
-                if zarray_json["node_type"] == "array":
-                    self.shape = zarray_json["shape"]
-                    self.chunks = zarray_json.get("chunk_grid", {}).get("configuration", {}).get("chunk_shape", [])
-                    self.dtype = zarray_json["data_type"]
-                    self.version = "3"
-                    break
-
-        assert self.shape is not None, "Could not find shape in zarr store"
+        assert self.shape is not None, f"Could not find shape in zarr store {self.path}"
         self.populated = True
-        self.save()
+
+    def fill_info(self, datalayer: Datalayer) -> None:
+        self.read_info(datalayer.s3v4)
+        # The content hash is written by deduplicate only
+        self.save(update_fields=["shape", "chunks", "dtype", "populated"])
+        schedule_indexes([self.id])
+
+    def build_indexes(self, datalayer: Datalayer) -> None:
+        """Build the min/max pyramid and the range index of the store, unless they are up to date
+
+        Both are built in a single pass over the array and stored under the
+        derived prefix of the store (see derived_prefix), never inside the
+        store itself.
+        """
+        s3 = datalayer.s3v4
+        bucket_name, prefix = self.location
+        metadata = get_zarr_metadata(s3, bucket_name, prefix)
+
+        pyramid = ZarrPyramid.objects.filter(store=self).first()
+        range_index = ZarrRangeIndex.objects.filter(store=self).first()
+        if metadata.etag is not None and all(index is not None and index.source_etag == metadata.etag for index in (pyramid, range_index)):
+            return
+
+        array = ZarrArray(s3, bucket_name, metadata)
+        # Short arrays get no pyramid, they are cheap to read
+        pyramid_builder = PyramidBuilder(array.dtype, settings.TRACE_PYRAMID_FACTOR) if array.shape[0] > settings.TRACE_PYRAMID_MIN_BINS else None
+        index_builder = RangeIndexBuilder()
+
+        for rows in array.iter_rows():
+            if pyramid_builder is not None:
+                pyramid_builder.feed(rows)
+            index_builder.feed(rows)
+
+        levels = pyramid_builder.write(s3, bucket_name, f"{self.derived_prefix}/pyramid", settings.TRACE_PYRAMID_MIN_BINS, settings.TRACE_PYRAMID_CHUNK) if pyramid_builder is not None else []
+        index = index_builder.write(s3, bucket_name, f"{self.derived_prefix}/stats", array.chunks[0], settings.TRACE_RANGE_INDEX_CHUNK)
+
+        ZarrPyramid.objects.update_or_create(
+            store=self,
+            defaults={
+                "factor": settings.TRACE_PYRAMID_FACTOR,
+                "levels": [dataclasses.asdict(level) for level in levels],
+                "source_etag": metadata.etag,
+            },
+        )
+        ZarrRangeIndex.objects.update_or_create(
+            store=self,
+            defaults={
+                "index": dataclasses.asdict(index),
+                "source_etag": metadata.etag,
+            },
+        )
+
+    def deduplicate(self, datalayer: Datalayer) -> "ZarrStore":
+        """Hash the content of the store and make it an alias of an older copy in its organization
+
+        The hash is computed here (it lists the whole store), never from
+        what a client claims. If an older populated store of the same
+        organization has the same hash, this store becomes an alias of it
+        and its traces are moved to it. The alias row is kept (clients may
+        still hold its id) and its objects are only removed by
+        collect_aliases. Returns the store that holds the content.
+        """
+        if self.canonical_id is not None:
+            return self.canonical
+
+        s3 = datalayer.s3v4
+        bucket_name, prefix = self.location
+        if self.content_hash is None:
+            self.content_hash = compute_content_hash(s3, bucket_name, prefix)
+            ZarrStore.objects.filter(id=self.id).update(content_hash=self.content_hash)
+
+        organizations = list(Trace.objects.filter(store=self).values_list("organization", flat=True).distinct())
+        if len(organizations) != 1:
+            # Unused, or shared between organizations
+            return self
+
+        canonical = ZarrStore.objects.filter(
+            content_hash=self.content_hash, populated=True, canonical=None, id__lt=self.id, trace__organization=organizations[0]
+        ).order_by("id").first()
+        if canonical is None:
+            return self
+
+        from core import channels
+
+        with transaction.atomic():
+            self.canonical = canonical
+            self.save(update_fields=["canonical"])
+            traces = list(Trace.objects.filter(store=self).values_list("id", "organization_id", "dataset_id"))
+            Trace.objects.filter(store=self).update(store=canonical)
+            channels.broadcast_traces("update", traces)
+
+        duplicate_stores_aliased.inc()
+        return canonical
+
+    @classmethod
+    def fill_info_many(cls, stores: list["ZarrStore"], datalayer: Datalayer) -> None:
+        """Fill the info of many stores at once
+
+        The metadata of all stores is read concurrently on a thread pool
+        (bounded by ``settings.ZARR_PROBE_CONCURRENCY``), so the latency
+        depends on the concurrency limit rather than on the number of stores.
+        The stores are then updated with a single bulk query.
+        """
+        stores = list({store.id: store for store in stores}.values())
+        if not stores:
+            return
+
+        s3 = datalayer.s3v4
+        workers = max(1, min(settings.ZARR_PROBE_CONCURRENCY, len(stores)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zarr-probe") as pool:
+            # Consume the iterator so that errors of the workers are raised here
+            list(pool.map(lambda store: store.read_info(s3), stores))
+
+        cls.objects.bulk_update(stores, ["shape", "chunks", "dtype", "populated"])
+        schedule_indexes([store.id for store in stores])
 
     @property
     def c_size(self):
@@ -180,6 +368,41 @@ class ZarrStore(S3Store):
         return self.shape[4]
 
 
+class ZarrPyramid(models.Model):
+    """A multiscale min/max pyramid of a zarr store
+
+    The pyramid allows to read the envelope of a long trace at any
+    resolution without reading the raw data.
+    """
+
+    store = models.OneToOneField(ZarrStore, on_delete=models.CASCADE, related_name="pyramid")
+    factor = models.IntegerField(help_text="The number of bins of a level that are combined into one bin of the next level")
+    levels = models.JSONField(default=list, help_text="The levels of the pyramid, finest first")
+    source_etag = models.CharField(max_length=1000, null=True, blank=True, help_text="The ETag of the array metadata the pyramid was built from")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_levels(self) -> list[PyramidLevel]:
+        """The levels of the pyramid, from the finest to the coarsest"""
+        return [PyramidLevel(**level) for level in self.levels]
+
+
+class ZarrRangeIndex(models.Model):
+    """A segment tree of aggregates (min, max, sum, ...) over the chunks of a zarr store
+
+    The index allows to aggregate any range of a trace by reading only
+    the chunks at the boundaries of the range.
+    """
+
+    store = models.OneToOneField(ZarrStore, on_delete=models.CASCADE, related_name="range_index")
+    index = models.JSONField(help_text="Where and how the tree of the index is stored")
+    source_etag = models.CharField(max_length=1000, null=True, blank=True, help_text="The ETag of the array metadata the index was built from")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_index(self) -> RangeIndex:
+        """The range index of the store"""
+        return RangeIndex(**self.index)
+
+
 class ParquetStore(S3Store):
     pass
 
@@ -203,41 +426,12 @@ class BigFileStore(S3Store):
         datalayer: Datalayer,
         host: str | None = None,
     ) -> str:
-        s3 = datalayer.s3
-        url = s3.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={
-                "Bucket": self.bucket,
-                "Key": self.key,
-            },
-            ExpiresIn=3600,
-        )
-        return url.replace(settings.AWS_S3_ENDPOINT_URL, host or "")
+        return presign_urls([(self.bucket, self.key, host)])[0]
 
 
 class MediaStore(S3Store):
     def get_presigned_url(self, info, datalayer: Datalayer, host: str | None = None) -> str:
-        cache_key = f"presigned_url:{self.bucket}:{self.key}:{host}"
-        # Check if the URL is in the cache
-        url = cache.get(cache_key)
-
-        if not url:
-            # Generate a new presigned URL if not cached
-            s3 = datalayer.s3
-            url = s3.generate_presigned_url(
-                ClientMethod="get_object",
-                Params={
-                    "Bucket": self.bucket,
-                    "Key": self.key,
-                },
-                ExpiresIn=3600,
-            )
-            # Replace the endpoint URL
-            url = url.replace(settings.AWS_S3_ENDPOINT_URL, host or "")
-            # Cache the URL with a timeout of 3600 seconds (same as ExpiresIn)
-            cache.set(cache_key, url, timeout=3600)
-
-        return url
+        return presign_urls([(self.bucket, self.key, host)])[0]
 
     def put_file(self, datalayer: Datalayer, file: FileField):
         s3 = datalayer.s3
@@ -672,6 +866,9 @@ class Trace(models.Model):
         default=enums.TraceKindChoices.UNKNOWN.value,
         help_text="The Representation can have vasrying kind, consult your API",
     )
+    t0 = models.FloatField(null=True, blank=True, help_text="The first time point of a regular time axis (kind REGULAR)")
+    dt = models.FloatField(null=True, blank=True, help_text="The interval between the time points of a regular time axis (kind REGULAR)")
+    n = models.IntegerField(null=True, blank=True, help_text="The number of time points of a regular time axis (kind REGULAR)")
     created_at = models.DateTimeField(auto_now_add=True)
     creator = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
 
@@ -700,10 +897,57 @@ class Trace(models.Model):
 
     class Meta:
         permissions = [("inspect_image", "Can view image")]
+        indexes = [
+            # Keyset pagination (see core.pagination)
+            models.Index(fields=["created_at", "id"], name="trace_created_at_id"),
+        ]
 
     def __str__(self) -> str:
         return f"Representation {self.id}"
 
+    @property
+    def time_axis(self) -> RegularTimeAxis | None:
+        """The regular time axis of the trace, if it is not backed by a store"""
+        if self.kind != enums.TraceKindChoices.REGULAR:
+            return None
+        return RegularTimeAxis(t0=self.t0, dt=self.dt, n=self.n)
+
+    def get_envelope(self, datalayer: Datalayer, start: int = 0, stop: int | None = None, max_points: int = 1000) -> Envelope:
+        """The min/max envelope of the samples start:stop, in at most max_points bins
+
+        Uses the pyramid of the store if it is up to date, the raw data otherwise.
+        Regular time axes are computed.
+        """
+        if self.time_axis is not None:
+            return self.time_axis.envelope(start, self.n if stop is None else stop, max_points)
+
+        bucket_name, prefix = self.store.location
+        metadata = get_zarr_metadata(datalayer.s3v4, bucket_name, prefix)
+        array = ZarrArray(datalayer.s3v4, bucket_name, metadata, datalayer.chunk_cache)
+
+        pyramid = ZarrPyramid.objects.filter(store=self.store).first()
+        levels = pyramid.get_levels() if pyramid is not None and pyramid.source_etag == metadata.etag else []
+
+        return read_envelope(array, levels, start, array.shape[0] if stop is None else stop, max_points)
+
+    def get_range_stats(self, datalayer: Datalayer, start: int = 0, stop: int | None = None) -> RangeStats:
+        """Aggregate the samples start:stop
+
+        Uses the range index of the store if it is up to date, the raw data otherwise.
+        Regular time axes are computed.
+        """
+        if self.time_axis is not None:
+            return self.time_axis.range_stats(start, self.n if stop is None else stop)
+
+        bucket_name, prefix = self.store.location
+        metadata = get_zarr_metadata(datalayer.s3v4, bucket_name, prefix)
+        array = ZarrArray(datalayer.s3v4, bucket_name, metadata, datalayer.chunk_cache)
+
+        range_index = ZarrRangeIndex.objects.filter(store=self.store).first()
+        index = range_index.get_index() if range_index is not None and range_index.source_etag == metadata.etag else None
+
+        return read_range_stats(array, index, start, array.shape[0] if stop is None else stop)
+
 
 class Simulation(models.Model):
     """A RUN is a run of a neuron model on a dataset.
@@ -729,6 +973,12 @@ class Simulation(models.Model):
         null=True,
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination (see core.pagination)
+            models.Index(fields=["created_at", "id"], name="simulation_created_at_id"),
+        ]
+
 
 class Stimulus(models.Model):
     trace = models.ForeignKey(
@@ -889,4 +1139,26 @@ class ROI(models.Model):
         return f"Event by {self.creator} on {self.trace.name}"
 
 
+class StatsRollup(models.Model):
+    """The aggregates of one time bucket of a model, per organization
+
+    Rollups are maintained from the model signals (see core.rollups) and
+    answer the time series of the stats types without scanning the rows.
+    """
+
+    model = models.CharField(max_length=100, help_text="The label of the aggregated model (e.g. core.block)")
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="+")
+    timestamp_field = models.CharField(max_length=100, help_text="The datetime field the rows are bucketed by")
+    granularity = models.CharField(max_length=20, help_text="The size of the bucket (hour, day, ...)")
+    bucket = models.DateTimeField(help_text="The start of the bucket")
+    count = models.IntegerField(help_text="The number of rows in the bucket")
+    values = models.JSONField(default=dict, help_text="The aggregates (count, distinctCount, min, max, sum) of every rolled up field")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["model", "organization", "timestamp_field", "granularity", "bucket"], name="unique_stats_rollup"),
+        ]
+
+
 from core import signals
@@ -0,0 +1,119 @@
+import threading
+from collections import defaultdict
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import transaction
+from kante.channel import Channel
+
+from core import metrics
+
+ACTIONS = ("create", "update", "delete")
+
+published_messages = metrics.counter("outbox_published_messages", "Change messages published to channel groups")
+
+# A change is (id, groups, snapshot)
+Change = tuple[int, list[str], dict[str, Any] | None]
+
+
+def send(channel: Channel, action: str, changes: Iterable[Change]) -> None:
+    """Publish the changes with one message per group, that carries only the ids of the group
+
+    Snapshots are sent along if there is one for every id of the group,
+    and the group has at most CHANNEL_MAX_SNAPSHOTS ids.
+    """
+    ids_by_group: dict[str, dict[int, dict[str, Any] | None]] = defaultdict(dict)
+    for id, groups, snapshot in changes:
+        for group in groups:
+            ids_by_group[group][id] = snapshot
+
+    for group, ids in ids_by_group.items():
+        snapshots = list(ids.values()) if action != "delete" and len(ids) <= settings.CHANNEL_MAX_SNAPSHOTS and None not in ids.values() else None
+        if len(ids) == 1:
+            signal = channel.model(**{action: next(iter(ids))}, snapshot=snapshots[0] if snapshots else None)
+        else:
+            signal = channel.model(**{f"{action}_many": list(ids)}, snapshots=snapshots)
+        channel.broadcast(signal, [group])
+        published_messages.inc()
+
+
+def merge(changes: dict[int, list[Any]], action: str, id: int, groups: list[str], snapshot: dict[str, Any] | None = None) -> None:
+    """Merge a change of a row into the pending changes (id -> [action, groups, snapshot])
+
+    A row that is created and then updated stays a create with the latest
+    snapshot, a row that is created and then deleted is dropped.
+    """
+    previous = changes.get(id)
+    if previous is None:
+        changes[id] = [action, list(groups), snapshot]
+        return
+
+    previous_action, previous_groups, previous_snapshot = previous
+    if action == "delete" and previous_action == "create":
+        del changes[id]
+        return
+
+    groups = previous_groups + [group for group in groups if group not in previous_groups]
+    if action == "delete":
+        changes[id] = ["delete", groups, None]
+    else:
+        changes[id] = ["create" if previous_action == "create" else action, groups, snapshot]
+
+
+class Outbox:
+    """The changes of one transaction, published once it commits
+
+    Changes of the same row are merged (see merge), and every group gets
+    one message per channel and action.
+    """
+
+    def __init__(self) -> None:
+        """Start an empty outbox, flushed by its callback"""
+        self.changes: dict[Channel, dict[int, list[Any]]] = defaultdict(dict)
+        self.callback = self.flush
+
+    def add(self, channel: Channel, action: str, id: int, groups: list[str], snapshot: dict[str, Any] | None = None) -> None:
+        """Merge a change of the row id into the pending changes"""
+        merge(self.changes[channel], action, id, groups, snapshot)
+
+    def flush(self) -> None:
+        """Publish the pending changes, grouped by channel and action"""
+        for channel, changes in self.changes.items():
+            for action in ACTIONS:
+                selected = [(id, groups, snapshot) for id, (change_action, groups, snapshot) in changes.items() if change_action == action]
+                if selected:
+                    send(channel, action, selected)
+        self.changes.clear()
+
+    def is_pending(self, connection: Any) -> bool:
+        """Whether the flush is still registered (it is dropped when its transaction or savepoint rolls back)"""
+        return any(callback is self.callback for _, callback, *_ in connection.run_on_commit)
+
+
+_local = threading.local()
+
+
+def get_outbox(using: str | None = None) -> Outbox:
+    """The outbox of the current transaction (the caller is in an atomic block)"""
+    connection = transaction.get_connection(using)
+    outboxes = _local.__dict__.setdefault("outboxes", {})
+
+    outbox = outboxes.get(connection.alias)
+    if outbox is None or not outbox.is_pending(connection):
+        outbox = outboxes[connection.alias] = Outbox()
+        transaction.on_commit(outbox.callback, using=using)
+    return outbox
+
+
+def publish(channel: Channel, action: str, changes: Iterable[Change], using: str | None = None) -> None:
+    """Publish changes once the current transaction commits, batched with the other changes of the transaction
+
+    Outside of a transaction the changes are published right away.
+    """
+    if not transaction.get_connection(using).in_atomic_block:
+        send(channel, action, changes)
+        return
+
+    outbox = get_outbox(using)
+    for id, groups, snapshot in changes:
+        outbox.add(channel, action, id, groups, snapshot)
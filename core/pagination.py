@@ -1,4 +1,14 @@
+import base64
+import datetime
+from typing import Any, Generic, TypeVar
+
 import strawberry
+from django.db.models import Q, QuerySet
+from strawberry_django.ordering import Ordering
+
+from core.counts import approximate_count
+
+T = TypeVar("T")
 
 
 @strawberry.input
@@ -10,4 +20,99 @@ class TablePaginationInput:
 @strawberry.input
 class ChildrenPaginationInput:
     limit: int | None = 200
-    offset: int | None = 0
\ No newline at end of file
+    offset: int | None = 0
+
+
+@strawberry.input(description="Keyset pagination on (created_at, id), or on the id alone: pass the nextCursor of a page as after to get the next one")
+class CursorPaginationInput:
+    """Where a cursor page starts and how long it is"""
+
+    first: int = strawberry.field(default=100, description="The maximum number of items of the page")
+    after: str | None = strawberry.field(default=None, description="The cursor after which the page starts")
+
+
+@strawberry.type(description="A page of a keyset paginated listing")
+class CursorPage(Generic[T]):
+    """A page of a keyset paginated listing and the cursor of the next page"""
+
+    items: list[T]
+    next_cursor: str | None = strawberry.field(description="The cursor of the next page, null on the last page")
+    queryset: strawberry.Private[QuerySet | None] = None
+
+    @strawberry.field(description="Estimated number of items of the whole listing (from the database planner), exact for small listings")
+    def approximate_count(self) -> int | None:
+        """The estimated number of items of the whole listing"""
+        return approximate_count(self.queryset) if self.queryset is not None else None
+
+
+# The key of a row in a keyset paginated listing, (timestamp, id) or (None, id)
+Key = tuple[datetime.datetime | None, int]
+
+
+def encode_cursor(position: int, key: Key | None) -> str:
+    """A cursor points after the row with key in the position-th queryset of a listing"""
+    if key is None:
+        raw = f"{position}||"
+    else:
+        raw = f"{position}|{key[0].isoformat() if key[0] else ''}|{key[1]}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, Key | None]:
+    """The position and the key of a cursor, raises ValueError for invalid cursors"""
+    try:
+        position, timestamp, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if not id:
+            return int(position), None
+        return int(position), (datetime.datetime.fromisoformat(timestamp) if timestamp else None, int(id))
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+
+
+def is_descending(order: Any) -> bool:
+    """Whether an order type asks for the newest rows first, the default
+
+    Cursor pages are only ordered by their key, so an order setting any
+    other field than created_at is rejected.
+    """
+    if order is None or order is strawberry.UNSET:
+        return True
+
+    for field in order.__strawberry_definition__.fields:
+        if field.python_name != "created_at" and getattr(order, field.python_name, None) not in (None, strawberry.UNSET):
+            raise ValueError(f"Cursor pages can only be ordered by createdAt, not by {field.name}")
+
+    created_at = getattr(order, "created_at", None)
+    if not isinstance(created_at, Ordering):
+        return True
+    return created_at.name.startswith("DESC")
+
+
+def keyset_page(queryset: QuerySet, key: Key | None, limit: int, descending: bool = True, timestamp: str | None = "created_at") -> list[Any]:
+    """The (at most limit) rows after key, in (timestamp, id) order
+
+    Uses the (timestamp, id) index, so the cost of a page does not depend
+    on how deep it is. Without a timestamp (for models whose timestamps
+    change on update) the rows are keyed on the id alone.
+    """
+    if timestamp is None:
+        if descending:
+            queryset = queryset.order_by("-id")
+            if key is not None:
+                queryset = queryset.filter(id__lt=key[1])
+        else:
+            queryset = queryset.order_by("id")
+            if key is not None:
+                queryset = queryset.filter(id__gt=key[1])
+        return list(queryset[:limit])
+
+    if descending:
+        queryset = queryset.order_by(f"-{timestamp}", "-id")
+        if key is not None:
+            queryset = queryset.filter(Q(**{f"{timestamp}__lt": key[0]}) | Q(**{timestamp: key[0]}, id__lt=key[1]))
+    else:
+        queryset = queryset.order_by(timestamp, "id")
+        if key is not None:
+            queryset = queryset.filter(Q(**{f"{timestamp}__gt": key[0]}) | Q(**{timestamp: key[0]}, id__gt=key[1]))
+
+    return list(queryset[:limit])
@@ -0,0 +1,74 @@
+import time
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+from core.datalayer import clients
+
+presign_hits = metrics.counter("presigned_url_cache_hits", "Presigned urls served from the cache")
+presign_misses = metrics.counter("presigned_url_cache_misses", "Presigned urls that had to be signed")
+
+# (bucket, key, host)
+PresignRequest = tuple[str, str, str | None]
+
+
+def expiry_window(now: float | None = None) -> tuple[int, int, int]:
+    """The current expiry window
+
+    Urls are signed so that they stay valid until the end of the *next*
+    window, and are cached until the end of the current one. Every url
+    that is handed out is therefore valid for at least one full window,
+    and all urls signed within a window can share the same cache entry
+    (across users and requests).
+
+    Returns the index of the window, the ``ExpiresIn`` to sign with and
+    the cache timeout (both in seconds).
+    """
+    now = time.time() if now is None else now
+    window = settings.PRESIGNED_URL_WINDOW
+    index = int(now // window)
+    expires_in = int((index + 2) * window - now)
+    timeout = int((index + 1) * window - now)
+    return index, expires_in, max(timeout, 1)
+
+
+def presign_urls(requests: Iterable[PresignRequest]) -> list[str]:
+    """Get presigned get_object urls for many objects at once
+
+    Looks all urls up with a single ``get_many``, signs the misses in one
+    pass with the shared s3 client and writes them back with a single
+    ``set_many``.
+    """
+    requests = list(requests)
+    index, expires_in, timeout = expiry_window()
+
+    cache_keys = [f"presigned_url:{bucket}:{key}:{host}:{index}" for bucket, key, host in requests]
+    cached = cache.get_many(set(cache_keys))
+
+    s3 = clients.get("s3")
+    signed: dict[str, str] = {}
+    urls = []
+    for cache_key, (bucket, key, host) in zip(cache_keys, requests):
+        url = cached.get(cache_key) or signed.get(cache_key)
+        if url is None:
+            url = s3.generate_presigned_url(
+                ClientMethod="get_object",
+                Params={
+                    "Bucket": bucket,
+                    "Key": key,
+                },
+                ExpiresIn=expires_in,
+            )
+            # Replace the endpoint URL
+            url = url.replace(settings.AWS_S3_ENDPOINT_URL, host or "")
+            signed[cache_key] = url
+        urls.append(url)
+
+    if signed:
+        cache.set_many(signed, timeout=timeout)
+
+    presign_hits.inc(len(requests) - len(signed))
+    presign_misses.inc(len(signed))
+    return urls
@@ -0,0 +1,67 @@
+from typing import Any
+
+from authentikate.vars import get_client
+from django.db import connections
+from django.db.models import CharField, DateTimeField, F, IntegerField, Model, QuerySet, Value
+from django.utils import timezone
+from koherent.vars import get_current_assignation_id
+from simple_history.exceptions import NotHistoricalModelError
+from simple_history.utils import get_history_manager_for_model
+
+
+def is_historic(model: type) -> bool:
+    """Whether the model has a ProvenanceField"""
+    try:
+        get_history_manager_for_model(model)
+    except NotHistoricalModelError:
+        return False
+    return True
+
+
+def record_history(queryset: QuerySet, user: Any, history_type: str = "~") -> None:
+    """Write one history row for every row of the queryset, with a single INSERT ... SELECT
+
+    The set based counterpart of saving every instance: the rows are copied
+    by the database and get the same context (user, client and assignation)
+    that koherent adds to the history of a single save.
+    """
+    history = get_history_manager_for_model(queryset.model).model
+    field_names = {field.name for field in history._meta.concrete_fields}
+
+    columns = {field.column: F(field.attname) for field in history.tracked_fields}
+    columns["history_date"] = Value(timezone.now(), output_field=DateTimeField())
+    columns["history_change_reason"] = Value(None, output_field=CharField())
+    columns["history_type"] = Value(history_type, output_field=CharField())
+    columns["history_user_id"] = Value(user.pk if user is not None else None, output_field=IntegerField())
+    if "history_relation" in field_names:
+        columns["history_relation_id"] = F("pk")
+    if "client" in field_names:
+        client = get_client()
+        columns["client_id"] = Value(client.pk if client is not None else None, output_field=IntegerField())
+    if "assignation_id" in field_names:
+        columns["assignation_id"] = Value(get_current_assignation_id(), output_field=CharField())
+
+    aliases = {f"_history_{i}": expression for i, expression in enumerate(columns.values())}
+    select = queryset.order_by().annotate(**aliases).values_list(*aliases)
+    sql, params = select.query.get_compiler(using=select.db).as_sql()
+
+    connection = connections[select.db]
+    quoted = ", ".join(connection.ops.quote_name(column) for column in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {connection.ops.quote_name(history._meta.db_table)} ({quoted}) {sql}", params)
+
+
+def bulk_create_with_provenance(objs: list[Any], model: type[Model], user: Any, batch_size: int | None = None) -> list[Any]:
+    """Insert the objects with bulk_create and record their creation in the history
+
+    The bulk counterpart of saving every instance: the history rows are
+    written by record_history, so they get the same user, client and
+    assignation as the history of a single save.
+    """
+    created = model._default_manager.bulk_create(objs, batch_size=batch_size)
+    if created and is_historic(model):
+        ids = [obj.pk for obj in created]
+        step = batch_size or len(ids)
+        for start in range(0, len(ids), step):
+            record_history(model._default_manager.filter(pk__in=ids[start : start + step]), user, history_type="+")
+    return created
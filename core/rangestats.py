@@ -0,0 +1,185 @@
+import dataclasses
+import math
+from typing import Any
+
+import numpy as np
+
+from core import metrics
+from core.arrays import ZarrArray
+from core.chunkcache import ChunkCache
+from core.metadata import parse_zarray
+
+range_index_builds = metrics.counter("trace_range_index_builds", "Range aggregate indexes that were (re)built")
+
+# The columns of a node of the index
+COUNT, NAN_COUNT, MIN, MAX, SUM, SUMSQ = range(6)
+
+# The stats of an empty range
+EMPTY = np.array([0, 0, np.inf, -np.inf, 0, 0], dtype="<f8")
+
+
+@dataclasses.dataclass
+class RangeIndex:
+    """A segment tree over the chunks (along the first axis) of an array
+
+    Leaf i holds the count, NaN count, min, max, sum and sum of squares of
+    the chunk row i, every other node combines its two children. The tree
+    is stored in heap order (the root is node 1, the leaves start at
+    ``size``) as an uncompressed zarr v2 array of shape (2 * size, 6).
+    """
+
+    key: str
+    size: int  # the number of leaves, a power of two
+    chunk: int  # the number of nodes per chunk of the stored tree
+    leaf_rows: int  # the number of samples (rows) per leaf, the chunk size of the array
+
+    def open(self, s3: Any, bucket: str, cache: ChunkCache | None = None, etag: str | None = None) -> ZarrArray:
+        """Open the stored tree, etag identifies the version of the index (for the cache)"""
+        document = {
+            "zarr_format": 2,
+            "shape": [2 * self.size, 6],
+            "chunks": [self.chunk, 6],
+            "dtype": "<f8",
+            "compressor": None,
+            "fill_value": None,
+            "filters": None,
+            "order": "C",
+        }
+        return ZarrArray(s3, bucket, parse_zarray(document, f"{self.key}/.zarray", etag), cache)
+
+
+@dataclasses.dataclass
+class RangeStats:
+    """Aggregates over a range of a trace"""
+
+    start: int
+    stop: int
+    count: int  # the number of values that are not NaN
+    nan_count: int
+    min: float | None
+    max: float | None
+    sum: float
+    mean: float | None
+    std: float | None
+
+
+def compute_stats(rows: np.ndarray) -> np.ndarray:
+    """The stats of all values in rows"""
+    values = rows.reshape(-1).astype("<f8")
+    nans = np.isnan(values)
+    values = values[~nans]
+    if not len(values):
+        return np.array([0, nans.sum(), np.inf, -np.inf, 0, 0], dtype="<f8")
+
+    return np.array([len(values), nans.sum(), values.min(), values.max(), values.sum(), np.square(values).sum()], dtype="<f8")
+
+
+def combine(stats: np.ndarray) -> np.ndarray:
+    """Combine the stats of many ranges (one per row) into one"""
+    if not len(stats):
+        return EMPTY.copy()
+
+    return np.array(
+        [
+            stats[:, COUNT].sum(),
+            stats[:, NAN_COUNT].sum(),
+            stats[:, MIN].min(),
+            stats[:, MAX].max(),
+            stats[:, SUM].sum(),
+            stats[:, SUMSQ].sum(),
+        ],
+        dtype="<f8",
+    )
+
+
+class RangeIndexBuilder:
+    """Builds a range index from the rows of an array, fed one chunk row at a time"""
+
+    def __init__(self) -> None:
+        """Start an empty index"""
+        self._leaves: list[np.ndarray] = []
+
+    def feed(self, rows: np.ndarray) -> None:
+        """Add the aggregates of the next leaf (a row of chunks) of the array"""
+        self._leaves.append(compute_stats(rows))
+
+    def write(self, s3: Any, bucket: str, key: str, leaf_rows: int, chunk: int) -> RangeIndex:
+        """Write the segment tree of the leaves as a zarr array under key and describe it"""
+        size = 1 << max(0, math.ceil(math.log2(max(1, len(self._leaves)))))
+        tree = np.tile(EMPTY, (2 * size, 1))
+        if self._leaves:
+            tree[size : size + len(self._leaves)] = np.stack(self._leaves)
+
+        for node in range(size - 1, 0, -1):
+            tree[node] = combine(tree[2 * node : 2 * node + 2])
+
+        index = RangeIndex(key=key, size=size, chunk=min(chunk, 2 * size), leaf_rows=leaf_rows)
+        target = ZarrArray.create(s3, bucket, key, [2 * size, 6], [index.chunk, 6], np.dtype("<f8"))
+        for i, start in enumerate(range(0, 2 * size, index.chunk)):
+            target.write_chunk((i, 0), tree[start : start + index.chunk])
+
+        range_index_builds.inc()
+        return index
+
+
+def _tree_nodes(size: int, first: int, last: int) -> list[int]:
+    """The nodes that exactly cover the leaves first:last"""
+    nodes = []
+    left, right = first + size, last + size
+    while left < right:
+        if left & 1:
+            nodes.append(left)
+            left += 1
+        if right & 1:
+            right -= 1
+            nodes.append(right)
+        left, right = left // 2, right // 2
+    return nodes
+
+
+def read_range_stats(array: ZarrArray, index: RangeIndex | None, start: int, stop: int) -> RangeStats:
+    """Aggregate the samples start:stop
+
+    The chunk rows that are fully inside the range are answered by combining
+    O(log n) precomputed nodes of the index, only the (at most two) partial
+    chunk rows at the boundaries are read. Without an index the whole range
+    is read.
+    """
+    length = array.shape[0]
+    start, stop = max(0, min(start, length)), max(0, min(stop, length))
+
+    if index is None:
+        parts = [compute_stats(array.read(start, stop))]
+    else:
+        rows = index.leaf_rows
+        first = math.ceil(start / rows)
+        last = math.ceil(length / rows) if stop == length else stop // rows
+
+        if first >= last:
+            parts = [compute_stats(array.read(start, stop))]
+        else:
+            parts = [
+                compute_stats(array.read(start, first * rows)),
+                compute_stats(array.read(last * rows, stop)),
+            ]
+
+            nodes = _tree_nodes(index.size, first, last)
+            tree = index.open(array.s3, array.bucket, array.cache, array.metadata.etag)
+            tree_chunks = {c: tree.read_chunk((c, 0)) for c in sorted({node // index.chunk for node in nodes})}
+            parts.extend(tree_chunks[node // index.chunk][node % index.chunk] for node in nodes)
+
+    stats = combine(np.stack(parts))
+    count = int(stats[COUNT])
+    mean = float(stats[SUM] / count) if count else None
+
+    return RangeStats(
+        start=start,
+        stop=stop,
+        count=count,
+        nan_count=int(stats[NAN_COUNT]),
+        min=float(stats[MIN]) if count else None,
+        max=float(stats[MAX]) if count else None,
+        sum=float(stats[SUM]),
+        mean=mean,
+        std=math.sqrt(max(stats[SUMSQ] / count - mean * mean, 0)) if count else None,
+    )
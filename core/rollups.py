@@ -0,0 +1,288 @@
+import dataclasses
+import datetime
+import hashlib
+import time
+from functools import reduce
+from operator import or_
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, FloatField, IntegerField, Max, Min, Model, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from core import metrics, models
+
+GRANULARITIES = ("hour", "day", "week", "month", "quarter", "year")
+MONTHS = {"month": 1, "quarter": 3, "year": 12}
+
+rollup_series = metrics.counter("stats_rollup_series", "Stats series answered from the rollups")
+cached_series_hits = metrics.counter("stats_series_cache_hits", "Stats series answered from the cache")
+
+
+@dataclasses.dataclass
+class RollupSpec:
+    """Which buckets of a model are rolled up, and per which organization field"""
+
+    model: type[Model]
+    scope: str
+    timestamp_fields: list[str]
+    fields: list[str]
+    granularities: list[str]
+
+    @property
+    def label(self) -> str:
+        """The lower case label of the model (e.g. core.block)"""
+        return self.model._meta.label_lower
+
+    @property
+    def scope_attname(self) -> str:
+        """The column of the organization of a row"""
+        return self.model._meta.get_field(self.scope).attname
+
+
+_specs: dict[type[Model], RollupSpec] = {}
+
+
+def is_numeric(model: type[Model], field: str) -> bool:
+    """Whether the field holds numbers (and gets min, max and sum)"""
+    return isinstance(model._meta.get_field(field), (IntegerField, FloatField, DecimalField))
+
+
+def register(model: type[Model], scope: str, timestamp_fields: Iterable[str], fields: Iterable[str], granularities: Iterable[str] = GRANULARITIES) -> RollupSpec:
+    """Maintain rollups of the (numeric) fields of the model, bucketed by its timestamp fields
+
+    Registered models also get their cached series invalidated by their
+    signals, even if none of the fields can be rolled up.
+    """
+    spec = RollupSpec(
+        model=model,
+        scope=scope,
+        timestamp_fields=list(timestamp_fields),
+        fields=[field for field in fields if is_numeric(model, field)],
+        granularities=list(granularities),
+    )
+    _specs[model] = spec
+    return spec
+
+
+def get_spec(model: type[Model]) -> RollupSpec | None:
+    """The rollup spec of the model, None if it is not rolled up"""
+    return _specs.get(model)
+
+
+def bucket_range(value: datetime.datetime, granularity: str) -> tuple[datetime.datetime, datetime.datetime]:
+    """The start and end of the bucket of the value, truncated like Trunc in the current timezone"""
+    aware = timezone.is_aware(value)
+    local = timezone.localtime(value).replace(tzinfo=None) if aware else value
+
+    start = local.replace(minute=0, second=0, microsecond=0)
+    if granularity == "hour":
+        end = start + datetime.timedelta(hours=1)
+    elif granularity == "day":
+        start = start.replace(hour=0)
+        end = start + datetime.timedelta(days=1)
+    elif granularity == "week":
+        start = start.replace(hour=0) - datetime.timedelta(days=start.weekday())
+        end = start + datetime.timedelta(days=7)
+    else:
+        months = MONTHS[granularity]
+        start = start.replace(hour=0, day=1, month=(start.month - 1) // months * months + 1)
+        total = start.month - 1 + months
+        end = start.replace(year=start.year + total // 12, month=total % 12 + 1)
+
+    if aware:
+        return timezone.make_aware(start), timezone.make_aware(end)
+    return start, end
+
+
+def aggregates(fields: list[str]) -> dict[str, Any]:
+    """The aggregates of a bucket, the same ones the series of the stats types compute"""
+    result = {"count": Count("pk")}
+    for i, field in enumerate(fields):
+        result[f"f{i}_count"] = Count(field)
+        result[f"f{i}_distinctCount"] = Count(field, distinct=True)
+        result[f"f{i}_min"] = Min(field)
+        result[f"f{i}_max"] = Max(field)
+        result[f"f{i}_sum"] = Sum(field)
+    return result
+
+
+def to_values(row: dict[str, Any], fields: list[str]) -> dict[str, dict[str, Any]]:
+    """The aggregates of every field of an aggregated row"""
+    def number(value: Any) -> Any:
+        return float(value) if value is not None else None
+
+    return {
+        field: {
+            "count": row[f"f{i}_count"],
+            "distinctCount": row[f"f{i}_distinctCount"],
+            "min": number(row[f"f{i}_min"]),
+            "max": number(row[f"f{i}_max"]),
+            "sum": number(row[f"f{i}_sum"]),
+        }
+        for i, field in enumerate(fields)
+    }
+
+
+def save_rollups(rollups: list[models.StatsRollup]) -> None:
+    """Insert the rollups, replacing existing buckets"""
+    models.StatsRollup.objects.bulk_create(
+        rollups,
+        batch_size=settings.BULK_CREATE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["model", "organization", "timestamp_field", "granularity", "bucket"],
+        update_fields=["count", "values", "updated_at"],
+    )
+
+
+def refresh(spec: RollupSpec, organization_id: int, timestamps: Iterable[tuple[str, datetime.datetime]]) -> None:
+    """Recompute the buckets (of every granularity) that contain the timestamps
+
+    Every bucket is aggregated from its own rows only, so a refresh costs
+    one query per bucket and granularity, independent of the size of the
+    table.
+    """
+    source = spec.model._default_manager.filter(**{spec.scope_attname: organization_id})
+    rollups, empty = [], []
+
+    for timestamp_field, value in set(timestamps):
+        for granularity in spec.granularities:
+            start, end = bucket_range(value, granularity)
+            row = source.filter(**{f"{timestamp_field}__gte": start, f"{timestamp_field}__lt": end}).aggregate(**aggregates(spec.fields))
+            key = dict(model=spec.label, organization_id=organization_id, timestamp_field=timestamp_field, granularity=granularity, bucket=start)
+            if row["count"]:
+                rollups.append(models.StatsRollup(**key, count=row["count"], values=to_values(row, spec.fields)))
+            else:
+                empty.append(Q(**key))
+
+    if rollups:
+        save_rollups(rollups)
+    if empty:
+        models.StatsRollup.objects.filter(reduce(or_, empty)).delete()
+
+
+def rebuild(spec: RollupSpec, organization_id: int | None = None) -> None:
+    """Recompute all rollups of the model (e.g. after bulk changes, which send no signals)"""
+    source = spec.model._default_manager.all()
+    existing = models.StatsRollup.objects.filter(model=spec.label)
+    if organization_id is not None:
+        source = source.filter(**{spec.scope_attname: organization_id})
+        existing = existing.filter(organization_id=organization_id)
+
+    organization_ids = set(existing.values_list("organization_id", flat=True))
+    with transaction.atomic():
+        existing.delete()
+        for timestamp_field in spec.timestamp_fields:
+            for granularity in spec.granularities:
+                rows = (
+                    source.exclude(**{f"{timestamp_field}__isnull": True})
+                    .annotate(bucket=Trunc(timestamp_field, granularity))
+                    .values(spec.scope_attname, "bucket")
+                    .annotate(**aggregates(spec.fields))
+                    .order_by()
+                )
+                save_rollups(
+                    [
+                        models.StatsRollup(
+                            model=spec.label,
+                            organization_id=row[spec.scope_attname],
+                            timestamp_field=timestamp_field,
+                            granularity=granularity,
+                            bucket=row["bucket"],
+                            count=row["count"],
+                            values=to_values(row, spec.fields),
+                        )
+                        for row in rows
+                    ]
+                )
+
+    organization_ids |= set(existing.values_list("organization_id", flat=True))
+    for id in organization_ids:
+        invalidate(spec, id)
+
+
+def read_series(spec: RollupSpec, organization_id: int, field: str, timestamp_field: str, granularity: str) -> list[dict[str, Any]] | None:
+    """The series of the field from the rollups, None if it is not rolled up"""
+    if field not in spec.fields or timestamp_field not in spec.timestamp_fields or granularity not in spec.granularities:
+        return None
+
+    rollup_series.inc()
+    rows = (
+        models.StatsRollup.objects.filter(model=spec.label, organization_id=organization_id, timestamp_field=timestamp_field, granularity=granularity)
+        .order_by("bucket")
+        .values_list("bucket", "count", "values")
+    )
+    series = []
+    for bucket, count, values in rows:
+        stats = values[field]
+        average = stats["sum"] / stats["count"] if stats["count"] else None
+        series.append(dict(ts=bucket, count=count, distinctCount=stats["distinctCount"], max=stats["max"], min=stats["min"], avg=average, sum=stats["sum"]))
+    return series
+
+
+def version_key(spec: RollupSpec, organization_id: int) -> str:
+    """The cache key of the version of the cached series of the model in the organization"""
+    return f"stats_version:{spec.label}:{organization_id}"
+
+
+def invalidate(spec: RollupSpec, organization_id: int) -> None:
+    """Invalidate every cached series of the model in the organization"""
+    # A fresh (time based) version, so an evicted version key never revives old entries
+    cache.set(version_key(spec, organization_id), time.time_ns(), timeout=None)
+
+
+def cached_series(spec: RollupSpec, organization_id: int, query: str, compute: Callable[[], list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """The series for the query (a description of queryset and arguments), cached until the model changes"""
+    version = cache.get_or_set(version_key(spec, organization_id), time.time_ns, timeout=None)
+    key = f"stats_series:{spec.label}:{organization_id}:{version}:{hashlib.sha1(query.encode()).hexdigest()}"
+
+    series = cache.get(key)
+    if series is not None:
+        cached_series_hits.inc()
+        return series
+
+    series = compute()
+    cache.set(key, series, timeout=settings.STATS_SERIES_CACHE_TIMEOUT)
+    return series
+
+
+def buckets_of(spec: RollupSpec, values: dict[str, Any]) -> set[tuple[int, str, datetime.datetime]]:
+    """The (organization, timestamp field, time) buckets the row values fall in"""
+    organization_id = values.get(spec.scope_attname)
+    if organization_id is None:
+        return set()
+    return {(organization_id, field, values[field]) for field in spec.timestamp_fields if values.get(field) is not None}
+
+
+def remember(instance: Model) -> None:
+    """Keep the buckets of a row before it is updated, so the buckets it leaves get refreshed too"""
+    spec = get_spec(type(instance))
+    if spec is None or not spec.fields or instance._state.adding or instance.pk is None:
+        return
+
+    previous = type(instance)._default_manager.filter(pk=instance.pk).values(spec.scope_attname, *spec.timestamp_fields).first()
+    instance._rollup_buckets = buckets_of(spec, previous) if previous else set()
+
+
+def schedule_refresh(instance: Model) -> None:
+    """Refresh the buckets of a saved or deleted row (and invalidate the cached series) once the transaction commits"""
+    spec = get_spec(type(instance))
+    if spec is None:
+        return
+
+    buckets = buckets_of(spec, instance.__dict__) | getattr(instance, "_rollup_buckets", set())
+    organization_ids = {organization_id for organization_id, _, _ in buckets}
+    if getattr(instance, spec.scope_attname, None) is not None:
+        organization_ids.add(getattr(instance, spec.scope_attname))
+
+    def on_commit() -> None:
+        if spec.fields:
+            for organization_id in organization_ids:
+                refresh(spec, organization_id, [(field, value) for id, field, value in buckets if id == organization_id])
+        for organization_id in organization_ids:
+            invalidate(spec, organization_id)
+
+    transaction.on_commit(on_commit, using=instance._state.db)
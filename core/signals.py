@@ -1,6 +1,6 @@
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from core import models, channels
+from core import models, channels, outbox, rollups
 from core import managers
 from core import models
 
@@ -8,21 +8,87 @@ from core import models
 
 @receiver(post_save, sender=models.Trace)
 def my_roi_handler(sender, instance=None, created=None, **kwargs):
-    if created:
-        channels.trace_channel.broadcast(
-            channels.TraceSignal(create=instance.id),
-            ["traces"],
-        )
-    else:
-        channels.trace_channel.broadcast(
-            channels.TraceSignal(update=instance.id),
-            ["traces"],
-        )
-      
+    channels.broadcast_traces(
+        "create" if created else "update",
+        [(instance.id, instance.organization_id, instance.dataset_id)],
+        {instance.id: channels.snapshot(instance)},
+    )
+
 
 @receiver(pre_delete, sender=models.Trace)
 def my_roi_delete_handler(sender, instance=None, **kwargs):
-     channels.trace_channel.broadcast(
-        channels.TraceSignal(delete=instance.id),
-        ["traces"],
+    channels.broadcast_traces(
+        "delete",
+        [(instance.id, instance.organization_id, instance.dataset_id)],
+    )
+
+
+@receiver(post_save, sender=models.ROI)
+def roi_handler(sender, instance=None, created=None, **kwargs):
+    """Publish created and updated ROIs to the group of their trace"""
+    outbox.publish(
+        channels.roi_channel,
+        "create" if created else "update",
+        [(instance.id, ["rois_trace" + str(instance.trace_id)], channels.snapshot(instance))],
     )
+
+
+@receiver(pre_delete, sender=models.ROI)
+def roi_delete_handler(sender, instance=None, **kwargs):
+    """Publish deleted ROIs to the group of their trace"""
+    outbox.publish(channels.roi_channel, "delete", [(instance.id, ["rois_trace" + str(instance.trace_id)], None)])
+
+
+@receiver(post_save, sender=models.File)
+def file_handler(sender, instance=None, created=None, **kwargs):
+    """Publish created and updated files to the groups that follow them"""
+    if instance.dataset_id is not None:
+        channels.broadcast_files(
+            "create" if created else "update",
+            [(instance.id, instance.dataset.organization_id, instance.dataset_id)],
+            {instance.id: channels.snapshot(instance)},
+        )
+
+
+@receiver(pre_delete, sender=models.File)
+def file_delete_handler(sender, instance=None, **kwargs):
+    """Publish deleted files to the groups that follow them"""
+    if instance.dataset_id is not None:
+        channels.broadcast_files("delete", [(instance.id, instance.dataset.organization_id, instance.dataset_id)])
+
+
+@receiver(post_save, sender=models.Dataset)
+def dataset_handler(sender, instance=None, created=None, **kwargs):
+    """Publish created and updated datasets to the group of their parent"""
+    if instance.parent_id is not None:
+        channels.broadcast_datasets(
+            "create" if created else "update",
+            [(instance.id, instance.parent_id)],
+            {instance.id: channels.snapshot(instance)},
+        )
+
+
+@receiver(pre_delete, sender=models.Dataset)
+def dataset_delete_handler(sender, instance=None, **kwargs):
+    """Publish deleted datasets to the group of their parent"""
+    channels.broadcast_datasets("delete", [(instance.id, instance.parent_id)])
+
+
+@receiver(pre_save)
+def stats_rollup_pre_save_handler(sender, instance=None, raw=False, **kwargs):
+    """Remember the buckets of a row before it changes"""
+    if not raw:
+        rollups.remember(instance)
+
+
+@receiver(post_save)
+def stats_rollup_handler(sender, instance=None, raw=False, **kwargs):
+    """Refresh the rollups of the buckets of a saved row"""
+    if not raw:
+        rollups.schedule_refresh(instance)
+
+
+@receiver(pre_delete)
+def stats_rollup_delete_handler(sender, instance=None, **kwargs):
+    """Refresh the rollups of the buckets of a deleted row"""
+    rollups.schedule_refresh(instance)
@@ -0,0 +1,107 @@
+import dataclasses
+import math
+
+import numpy as np
+
+from core.envelope import Envelope
+from core.rangestats import RangeStats
+
+
+@dataclasses.dataclass(frozen=True)
+class RegularTimeAxis:
+    """A regular time axis, t[i] = t0 + i * dt for i in range(n)
+
+    The time points are computed instead of stored. The axis reads like a
+    one dimensional float64 array (shape, chunks, dtype and read), so it can
+    be served wherever a ZarrArray is.
+    """
+
+    t0: float
+    dt: float
+    n: int
+    block: int = 65536  # the number of time points computed at once when streaming
+
+    @classmethod
+    def spanning(cls, duration: float, dt: float, t0: float = 0.0) -> "RegularTimeAxis":
+        """The axis sampled at t0, t0 + dt, ... up to (and including) t0 + duration
+
+        The number of steps is rounded with a tolerance, so that a duration
+        that is a multiple of a non representable dt (e.g. 0.1) keeps its
+        last sample.
+        """
+        return cls(t0=t0, dt=dt, n=math.floor(duration / dt + 1e-9) + 1)
+
+    @property
+    def shape(self) -> list[int]:
+        """The shape of the axis, like an array"""
+        return [self.n]
+
+    @property
+    def chunks(self) -> list[int]:
+        """The (virtual) chunks of the axis, like an array"""
+        return [self.block]
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The time points are float64"""
+        return np.dtype("<f8")
+
+    def time_at(self, index: int) -> float:
+        """The time of the index-th point"""
+        return self.t0 + index * self.dt
+
+    def index_at(self, time: float) -> int:
+        """The index of the time point closest to time"""
+        return max(0, min(self.n - 1, round((time - self.t0) / self.dt)))
+
+    def read(self, start: int, stop: int, step: int = 1, out: np.ndarray | None = None) -> np.ndarray:
+        """Compute the time points start:stop:step, into out if it is given"""
+        start, stop = max(start, 0), min(stop, self.n)
+        values = self.t0 + np.arange(start, stop, step, dtype="<f8") * self.dt
+        if out is None:
+            return values
+        out[...] = values
+        return out
+
+    def _clamp(self, start: int, stop: int) -> tuple[int, int]:
+        start = max(0, min(start, self.n))
+        return start, max(start, min(stop, self.n))
+
+    def envelope(self, start: int, stop: int, max_points: int) -> Envelope:
+        """The envelope of start:stop in at most max_points bins, in O(max_points)"""
+        start, stop = self._clamp(start, stop)
+        group = max(1, math.ceil((stop - start) / max(1, max_points)))
+
+        firsts = np.arange(start, stop, group)
+        lasts = np.minimum(firsts + group, stop) - 1
+        a, b = self.t0 + firsts * self.dt, self.t0 + lasts * self.dt
+
+        return Envelope(
+            start=start,
+            stop=stop,
+            bin_size=group,
+            level=0,
+            min=np.minimum(a, b).tolist(),
+            max=np.maximum(a, b).tolist(),
+        )
+
+    def range_stats(self, start: int, stop: int) -> RangeStats:
+        """The aggregates of start:stop, in closed form"""
+        start, stop = self._clamp(start, stop)
+        count = stop - start
+        if not count:
+            return RangeStats(start=start, stop=stop, count=0, nan_count=0, min=None, max=None, sum=0.0, mean=None, std=None)
+
+        first, last = self.time_at(start), self.time_at(stop - 1)
+        mean = (first + last) / 2
+        return RangeStats(
+            start=start,
+            stop=stop,
+            count=count,
+            nan_count=0,
+            min=min(first, last),
+            max=max(first, last),
+            sum=mean * count,
+            mean=mean,
+            std=abs(self.dt) * math.sqrt((count * count - 1) / 12),
+        )
@@ -1,11 +1,14 @@
 import strawberry
 from enum import Enum
+from django.core.exceptions import EmptyResultSet
 from django.db.models import Model, QuerySet
 from typing import Any, Callable, Optional, Type, Dict, Tuple, List
 from django.db.models import Avg, Max, Min, Sum, Count
 from django.db.models.functions import TruncHour, TruncDay, TruncWeek, TruncMonth, TruncQuarter, TruncYear
 import strawberry_django
 from kante import Info
+from core import rollups
+from core.counts import approximate_count
 import datetime
 
 # ---------- Resolver spec ----------
@@ -45,6 +48,7 @@ def create_stats_type(
     enum_name: Optional[str] = None,
     dt_enum_name: Optional[str] = None,
     prescope: Optional[Callable[[QuerySet, Info], QuerySet]] = None,
+    rollup_scope: Optional[str] = None,  # organization field, enables rollups and the series cache
 ) -> Tuple[Type[Any], Callable[..., Any]]:
     """
     Build a Strawberry GraphQL Stats type for `model`.
@@ -55,6 +59,9 @@ def create_stats_type(
       but under the hood we aggregate ALL of them in ONE query per `field` and memoize.
     - series(field:, timestampField:, by:) returns time buckets with per-bucket stats
       via ONE query (GROUP BY truncated timestamp).
+    - With `rollup_scope`, series are cached until the model changes, and
+      unfiltered series of numeric fields are read from per-organization
+      rollups (see core.rollups) instead of the rows.
     """
 
     filters_type = filters
@@ -77,6 +84,15 @@ def create_stats_type(
         TimestampEnumPy = None
         TimestampEnum = None  # type: ignore
 
+    spec = None
+    if rollup_scope is not None:
+        spec = rollups.register(
+            model,
+            scope=rollup_scope,
+            timestamp_fields=(allowed_datetime_fields or {}).values(),
+            fields=allowed_fields.values(),
+        )
+
     # --------- Helpers ---------
     def _truncate(dt_field: str, by: Granularity) -> Any:
         return {
@@ -123,15 +139,24 @@ def create_stats_type(
         "__annotations__": {
             "_qs": strawberry.Private[QuerySet],
             "_cache": strawberry.Private[Dict[str, Dict[str, Any]]],  # per-field aggregate cache
+            "_organization": strawberry.Private[Optional[int]],  # set if the series can use the rollups
+            "_filtered": strawberry.Private[bool],
             "count": int,
+            "approximateCount": int,
         },
         "__init__": lambda self, **data: setattr(self, "__dict__", data),
         "_qs": None,  # type: ignore
         "_cache": None,  # type: ignore
+        "_organization": None,  # type: ignore
+        "_filtered": False,  # type: ignore
         "count": strawberry_django.field(
             description="Total number of items in the selection",
             resolver=lambda self: self._qs.count(),
         ),
+        "approximateCount": strawberry_django.field(
+            description="Estimated number of items in the selection (from the database planner), exact for small selections",
+            resolver=lambda self: approximate_count(self._qs),
+        ),
         "_get_field_summary": lambda self, mf: self._cache.setdefault(
             mf,
             _all_stats_for_field(self._qs, mf),
@@ -162,14 +187,10 @@ def create_stats_type(
     # Optional: time-bucketed series
     if TimestampEnum is not None:
 
-        def _series(self, field: FieldEnumPy, timestampField: TimestampEnumPy, by: Granularity) -> List[TimeBucket]:
-            mf = field.value
-            tf = timestampField.value
-            trunc = _truncate(tf, by)
-
+        def _query_series(qs: QuerySet, mf: str, tf: str, by: Granularity) -> List[Dict[str, Any]]:
             # ONE query with GROUP BY bucket
-            qs = (
-                self._qs.annotate(bucket=trunc)
+            rows = (
+                qs.annotate(bucket=_truncate(tf, by))
                 .values("bucket")
                 .annotate(
                     count=Count("pk"),
@@ -181,21 +202,27 @@ def create_stats_type(
                 )
                 .order_by("bucket")
             )
+            return [{"ts": row.pop("bucket"), **row} for row in rows]
 
-            out: List[TimeBucket] = []
-            for row in qs:
-                out.append(
-                    TimeBucket(
-                        ts=row["bucket"],
-                        count=row["count"],
-                        distinctCount=row["distinctCount"],
-                        max=row["max"],
-                        min=row["min"],
-                        avg=row["avg"],
-                        sum=row["sum"],
-                    )
-                )
-            return out
+        def _series(self, field: FieldEnumPy, timestampField: TimestampEnumPy, by: Granularity) -> List[TimeBucket]:
+            mf = field.value
+            tf = timestampField.value
+
+            if spec is None or self._organization is None:
+                rows = _query_series(self._qs, mf, tf, by)
+            else:
+                try:
+                    query = f"{self._qs.query}|{mf}|{tf}|{by.value}"
+                except EmptyResultSet:
+                    return []
+
+                def compute() -> List[Dict[str, Any]]:
+                    rows = None if self._filtered else rollups.read_series(spec, self._organization, mf, tf, by.value)
+                    return rows if rows is not None else _query_series(self._qs, mf, tf, by)
+
+                rows = rollups.cached_series(spec, self._organization, query, compute)
+
+            return [TimeBucket(**row) for row in rows]
 
         body["__annotations__"]["series"] = List[TimeBucket]
         body["series"] = strawberry_django.field(
@@ -219,7 +246,13 @@ def create_stats_type(
             # `filters` is an instance or dict per strawberry_django usage
             qs = strawberry_django.filters.apply(filters, qs, info)
         # instance with caches
-        return new_type(_qs=qs, _cache={})
+        organization = getattr(info.context.request, "organization", None) if spec is not None else None
+        return new_type(
+            _qs=qs,
+            _cache={},
+            _organization=organization.id if organization is not None else None,
+            _filtered=filters is not None,
+        )
 
     # Expose argument types nicely on the callable (optional)
     if filters_type is not None:
@@ -9,10 +9,12 @@ from core import models, scalars, filters, enums
 from django.contrib.auth import get_user_model
 from kante.types import Info
 import datetime
+import dataclasses
 from asgiref.sync import sync_to_async
 from itertools import chain
 from enum import Enum
 from core.datalayer import get_current_datalayer
+from core.loaders import get_current_loaders
 from core.render.objects import models as rmodels
 from strawberry.experimental import pydantic
 from typing import Union
@@ -83,6 +85,33 @@ class AccessCredentials:
     path: str
 
 
+@strawberry.type(description="The min/max envelope of a range of a trace, e.g. to plot an overview")
+class TraceEnvelope:
+    """The min/max envelope of a range of a trace"""
+
+    start: int = strawberry.field(description="The first sample covered by the envelope")
+    stop: int = strawberry.field(description="The sample after the last one covered by the envelope")
+    bin_size: int = strawberry.field(description="The number of samples per bin")
+    level: int = strawberry.field(description="The pyramid level the envelope was read from (0 is the raw data)")
+    min: list[float | None] = strawberry.field(description="The minimum of every bin")
+    max: list[float | None] = strawberry.field(description="The maximum of every bin")
+
+
+@strawberry.type(description="Aggregates over a range of a trace")
+class RangeStats:
+    """Aggregates over a range of a trace"""
+
+    start: int = strawberry.field(description="The first sample of the range")
+    stop: int = strawberry.field(description="The sample after the last one of the range")
+    count: int = strawberry.field(description="The number of values that are not NaN")
+    nan_count: int = strawberry.field(description="The number of NaN values")
+    min: float | None = strawberry.field(description="The minimum value")
+    max: float | None = strawberry.field(description="The maximum value")
+    sum: float = strawberry.field(description="The sum of all values")
+    mean: float | None = strawberry.field(description="The mean of all values")
+    std: float | None = strawberry.field(description="The (population) standard deviation of all values")
+
+
 @strawberry_django.type(
     models.ViewCollection,
     filters=filters.TraceFilter,
@@ -146,6 +175,7 @@ class ZarrStore:
     key: str = strawberry.field(description="The key where the data is stored.")
     chunks: List[int] | None = strawberry.field(description="The chunks of the data.")
     populated: bool = strawberry.field(description="Whether the zarr store was populated (e.g. was a dataset created).")
+    content_hash: str | None = strawberry.field(description="The hash of the content of the store, computed by the server once it is filled. Stores with the same content share it.")
 
 
 @strawberry_django.type(models.ParquetStore)
@@ -164,9 +194,9 @@ class BigFileStore:
     key: str
 
     @strawberry.field()
-    def presigned_url(self, info: Info) -> str:
-        datalayer = get_current_datalayer()
-        return cast(models.BigFileStore, self).get_presigned_url(info, datalayer=datalayer)
+    async def presigned_url(self, info: Info) -> str:
+        """A presigned url of the store, batched with the other stores of the request"""
+        return await get_current_datalayer().presigned_urls.load((self.bucket, self.key, None))
 
 
 @strawberry_django.type(models.MediaStore)
@@ -177,9 +207,9 @@ class MediaStore:
     key: str
 
     @strawberry_django.field()
-    def presigned_url(self, info: Info, host: str | None = None) -> str:
-        datalayer = get_current_datalayer()
-        return cast(models.MediaStore, self).get_presigned_url(info, datalayer=datalayer, host=host)
+    async def presigned_url(self, info: Info, host: str | None = None) -> str:
+        """A presigned url of the store (signed for host), batched with the other stores of the request"""
+        return await get_current_datalayer().presigned_urls.load((self.bucket, self.key, host))
 
 
 @strawberry_django.type(models.File, filters=filters.FileFilter, pagination=True)
@@ -290,14 +320,11 @@ class NeuronModel:
         changes = compare_models(self.json_model, to_model.json_model)
         return changes
 
-    @strawberry_django.field()
-    def comparisons(self, info: Info) -> List["Comparison"]:
+    @strawberry_django.field(only=["json_model"])
+    async def comparisons(self, info: Info) -> List["Comparison"]:
         """Gets the changes"""
-        comparisons = []
-        for col in self.model_collections.all():
-            changes = compare_models(self.json_model, col.models.first().json_model)
-            comparisons.append(Comparison(collection=col, changes=changes))
-        return comparisons
+        collections = await get_current_loaders().collections().load(self.id)
+        return [Comparison(collection=col, changes=compare_models(self.json_model, first)) for col, first in collections]
 
 
 @strawberry_django.type(models.Experiment, filters=filters.ExperimentFilter, order=filters.ExperimentOrder, pagination=True)
@@ -339,7 +366,7 @@ class Recording:
     position: float
     cell: str
 
-    @strawberry_django.field()
+    @strawberry_django.field(only=["label", "cell", "location", "position"])
     def label(self, info: Info) -> str:
         return self.label or f"{self.cell}: {self.location}({self.position})"
 
@@ -354,7 +381,7 @@ class Stimulus:
     position: float
     cell: str
 
-    @strawberry_django.field()
+    @strawberry_django.field(only=["label", "cell", "location", "position"])
     def label(self, info: Info) -> str:
         return self.label or f"{self.cell}: {self.location}({self.position})"
 
@@ -400,6 +427,7 @@ BlockStats, BlockStatsResolver = create_stats_type(
     },
     allowed_datetime_fields={"created_at": "created_at"},
     prescope=build_prescoper(field="organization"),
+    rollup_scope="organization",
 )
 
 
@@ -489,19 +517,49 @@ class Trace:
 
     id: auto
     name: auto = strawberry_django.field(description="The name of the image")
-    store: ZarrStore = strawberry_django.field(description="The store where the image data is stored.")
+    store: ZarrStore | None = strawberry_django.field(description="The store where the image data is stored. Regular time axes have no store.")
+    kind: enums.TraceKind = strawberry_django.field(description="The kind of the trace")
+    t0: float | None = strawberry_django.field(description="The first time point of a regular time axis")
+    dt: float | None = strawberry_django.field(description="The interval between the time points of a regular time axis")
+    n: int | None = strawberry_django.field(description="The number of time points of a regular time axis")
     dataset: Optional["Dataset"] = strawberry_django.field(description="The dataset this image belongs to")
     provenance_entries: List["ProvenanceEntry"] = strawberry_django.field()
     creator: User | None = strawberry_django.field(description="Who created this image")
     rois: List["ROI"] = strawberry_django.field(description="The rois of this image")
 
     @strawberry_django.field(description="Is this image pinned by the current user")
-    def pinned(self, info: Info) -> bool:
-        return cast(models.Image, self).pinned_by.filter(id=info.context.request.user.id).exists()
+    async def pinned(self, info: Info) -> bool:
+        """Whether the current user pinned the trace, batched per request"""
+        return await get_current_loaders().pinned(models.Trace, info.context.request.user.id).load(self.id)
 
     @strawberry_django.field(description="The tags of this image")
-    def tags(self, info: Info) -> list[str]:
-        return cast(models.Image, self).tags.slugs()
+    async def tags(self, info: Info) -> list[str]:
+        """The tags of the trace, batched per request"""
+        return await get_current_loaders().tags(models.Trace).load(self.id)
+
+    @strawberry_django.field(description="The min/max envelope of the samples start:stop (along the first axis), in at most maxPoints bins")
+    def envelope(self, info: Info, start: int = 0, stop: int | None = None, max_points: int = 1000) -> TraceEnvelope:
+        """The min/max envelope of start:stop, from the coarsest pyramid level that keeps max_points bins"""
+        envelope = cast(models.Trace, self).get_envelope(get_current_datalayer(), start=start, stop=stop, max_points=max_points)
+        return TraceEnvelope(**dataclasses.asdict(envelope))
+
+    @strawberry_django.field(description="The time of the sample at index (only for regular time axes)")
+    def time_at(self, info: Info, index: int) -> float | None:
+        """The time of the sample at index, None without a regular time axis"""
+        axis = cast(models.Trace, self).time_axis
+        return axis.time_at(index) if axis is not None else None
+
+    @strawberry_django.field(description="The index of the sample closest to time (only for regular time axes)")
+    def index_at(self, info: Info, time: float) -> int | None:
+        """The index of the sample closest to time, None without a regular time axis"""
+        axis = cast(models.Trace, self).time_axis
+        return axis.index_at(time) if axis is not None else None
+
+    @strawberry_django.field(description="Aggregates (min, max, mean, ...) over the samples start:stop (along the first axis)")
+    def range_stats(self, info: Info, start: int = 0, stop: int | None = None) -> RangeStats:
+        """The aggregates of start:stop, read from the range index where possible"""
+        stats = cast(models.Trace, self).get_range_stats(get_current_datalayer(), start=start, stop=stop)
+        return RangeStats(**dataclasses.asdict(stats))
 
     @strawberry_django.field()
     def events(
@@ -532,12 +590,14 @@ class Dataset:
     creator: User | None
 
     @strawberry_django.field()
-    def pinned(self, info: Info) -> bool:
-        return cast(models.Dataset, self).pinned_by.filter(id=info.context.request.user.id).exists()
+    async def pinned(self, info: Info) -> bool:
+        """Whether the current user pinned the dataset, batched per request"""
+        return await get_current_loaders().pinned(models.Dataset, info.context.request.user.id).load(self.id)
 
     @strawberry_django.field()
-    def tags(self, info: Info) -> list[str]:
-        return cast(models.Image, self).tags.slugs()
+    async def tags(self, info: Info) -> list[str]:
+        """The tags of the dataset, batched per request"""
+        return await get_current_loaders().tags(models.Dataset).load(self.id)
 
 
 class Slice:
@@ -596,7 +656,7 @@ class TimelineView(View):
     id: auto
     trace: Trace
 
-    @strawberry_django.field()
+    @strawberry_django.field(only=["label"])
     def label(self, info: Info) -> str:
         return self.label or "No Label"
 
@@ -614,13 +674,14 @@ class ROI:
     provenance_entries: List["ProvenanceEntry"] = strawberry_django.field()
 
     @strawberry_django.field()
-    def pinned(self, info: Info) -> bool:
-        return self.pinned_by.filter(id=info.context.request.user.id).exists()
+    async def pinned(self, info: Info) -> bool:
+        """Whether the current user pinned the ROI, batched per request"""
+        return await get_current_loaders().pinned(models.ROI, info.context.request.user.id).load(self.id)
 
     @strawberry_django.field()
     def name(self, info: Info) -> str:
         return self.kind
 
-    @strawberry_django.field()
+    @strawberry_django.field(only=["label"])
     def label(self, info: Info) -> str | None:
         return self.label
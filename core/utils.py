@@ -1,36 +1,32 @@
-from itertools import chain
-import strawberry
-from typing import Optional, List, Any
-
-# Factor out pagination logic into a separate function
-def paginate_querysets(*querysets: Any, offset: int = 0, limit: int = 100,):
-
-    items = []
-    remaining_limit = limit  # How many more items we need to fetch
-    current_offset = offset  # Start at the initial offset
-
-    # Loop through each queryset
-    for qs in querysets:
-        qs_count = qs.count()  # Get the total number of items in the current queryset
-
-        # If the current offset is greater than the queryset size, skip this queryset
-        if current_offset >= qs_count:
-            current_offset -= qs_count
-            continue
-
-        # Calculate how many items to fetch from this queryset
-        qs_items = qs[current_offset:current_offset + remaining_limit]
-        current_offset = 0  # After processing the first queryset, reset offset for the next one
-
-        # Append the fetched items to the results
-        items.extend(qs_items)
-
-        # Update the remaining limit after fetching from this queryset
-        remaining_limit -= len(qs_items)
-
-        # If we've filled the required limit, break the loop
-        if remaining_limit <= 0:
-            break
-
-    # Return the paginated items and the total count
-    return items
+from typing import Any
+from django.db.models import QuerySet
+from core.pagination import decode_cursor, encode_cursor, keyset_page
+
+
+def paginate_querysets(
+    *querysets: QuerySet, after: str | None = None, limit: int = 100, descending: bool = True, timestamp: str | None = "created_at"
+) -> tuple[list[Any], str | None]:
+    """Walk several querysets (one after the other) by cursor
+
+    Every queryset is paginated by its (timestamp, id) key, or by its id
+    alone without a timestamp, none of them is counted. Returns the items and the cursor of the next page (None when
+    all querysets are exhausted).
+    """
+    position, key = decode_cursor(after) if after else (0, None)
+
+    items: list[Any] = []
+    for index in range(position, len(querysets)):
+        remaining = limit - len(items)
+        # One more row than needed tells whether the queryset continues
+        page = keyset_page(querysets[index], key if index == position else None, remaining + 1, descending, timestamp)
+
+        if len(page) > remaining:
+            items.extend(page[:remaining])
+            last = items[-1] if items else None
+            return items, encode_cursor(index, (getattr(last, timestamp) if timestamp else None, last.id) if last is not None else key)
+
+        items.extend(page)
+        if len(items) == limit:
+            return items, encode_cursor(index + 1, None) if index + 1 < len(querysets) else None
+
+    return items, None
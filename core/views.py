@@ -0,0 +1,141 @@
+import math
+from typing import Any, AsyncIterator, Iterator
+
+import numpy as np
+import pyarrow as pa
+from asgiref.sync import sync_to_async
+from authentikate.expand import aexpand_membership, aexpand_organization_from_token, aexpand_user_from_token
+from authentikate.utils import authenticate_header
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+
+from core import metrics, models
+from core.arrays import ZarrArray
+from core.datalayer import get_current_datalayer
+from core.metadata import get_zarr_metadata
+
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+RAW_CONTENT_TYPE = "application/octet-stream"
+
+
+async def authenticate(request: HttpRequest) -> tuple[Any, Any] | JsonResponse:
+    """The user and organization of the request (authenticated like the GraphQL view), or an error response"""
+    try:
+        token = authenticate_header(request.headers)
+    except Exception as e:
+        return JsonResponse({"error": f"Not authenticated: {e}"}, status=401)
+
+    user = await aexpand_user_from_token(token)
+    organization = await aexpand_organization_from_token(token)
+    try:
+        await aexpand_membership(user, organization, token)
+    except AssertionError as e:
+        return JsonResponse({"error": str(e)}, status=403)
+    return user, organization
+
+
+async def metrics_view(request: HttpRequest) -> JsonResponse:
+    """The current value of the process wide counters (caches, pools, ...), for authenticated requests"""
+    authenticated = await authenticate(request)
+    if isinstance(authenticated, JsonResponse):
+        return authenticated
+    return JsonResponse(metrics.snapshot())
+
+
+def slice_blocks(start: int, stop: int, step: int, rows: int) -> Iterator[tuple[int, int]]:
+    """Split start:stop:step into ranges that lie within one chunk row and keep the step grid"""
+    lo = start
+    while lo < stop:
+        hi = min(stop, (lo // rows + 1) * rows)
+        yield lo, hi
+        lo += math.ceil((hi - lo) / step) * step
+
+
+def arrow_schema(array: ZarrArray, dtype: np.dtype) -> pa.Schema:
+    """One 'data' column, samples with more than one value are fixed size lists"""
+    width = math.prod(array.shape[1:])
+    field = pa.from_numpy_dtype(dtype)
+    return pa.schema([("data", field if array.shape[1:] == [] else pa.list_(field, width))])
+
+
+def arrow_batch(schema: pa.Schema, block: np.ndarray) -> bytes:
+    """Serialize a block of samples as one Arrow record batch of the schema"""
+    values = pa.array(block.reshape(-1))  # zero copy for a contiguous block
+    if pa.types.is_fixed_size_list(schema.field("data").type):
+        values = pa.FixedSizeListArray.from_arrays(values, schema.field("data").type.list_size)
+    return pa.RecordBatch.from_arrays([values], schema=schema).serialize().to_pybytes()
+
+
+def arrow_header(schema: pa.Schema) -> bytes:
+    """Serialize the schema as the header of an Arrow IPC stream"""
+    return schema.serialize().to_pybytes()
+
+
+async def trace_slice_view(request: HttpRequest, id: str) -> HttpResponse:
+    """Stream the samples start:stop:step (along the first axis) of a trace
+
+    The request is authenticated like the GraphQL view. Depending on the
+    format parameter (or the Accept header) the samples are returned as an
+    Arrow IPC stream or as a raw little endian buffer in C order. Shape and
+    dtype are sent in the X-Shape and X-Dtype headers.
+    """
+    authenticated = await authenticate(request)
+    if isinstance(authenticated, JsonResponse):
+        return authenticated
+    _, organization = authenticated
+
+    try:
+        trace = await models.Trace.objects.select_related("store").aget(id=id, organization=organization)
+    except (models.Trace.DoesNotExist, ValueError):
+        return JsonResponse({"error": f"Trace {id} does not exist"}, status=404)
+    if trace.store is None and trace.time_axis is None:
+        return JsonResponse({"error": f"Trace {id} has no data"}, status=404)
+
+    try:
+        start = int(request.GET.get("start", 0))
+        stop = int(request.GET["stop"]) if request.GET.get("stop") else None
+        step = int(request.GET.get("step", 1))
+    except ValueError:
+        return JsonResponse({"error": "start, stop and step must be integers"}, status=400)
+    if step < 1:
+        return JsonResponse({"error": "step must be positive"}, status=400)
+
+    format = request.GET.get("format") or ("arrow" if ARROW_CONTENT_TYPE in request.headers.get("Accept", "") else "raw")
+    if format not in ("arrow", "raw"):
+        return JsonResponse({"error": f"Unknown format {format}, use 'arrow' or 'raw'"}, status=400)
+
+    if trace.time_axis is not None:
+        # Regular time axes are computed block by block
+        array = trace.time_axis
+        dtype = array.dtype
+    else:
+        datalayer = get_current_datalayer()
+        bucket_name, prefix = trace.store.location
+        metadata = await sync_to_async(get_zarr_metadata)(datalayer.s3v4, bucket_name, prefix)
+        array = ZarrArray(datalayer.s3v4, bucket_name, metadata, datalayer.chunk_cache)
+        dtype = np.dtype(trace.store.dtype or array.dtype).newbyteorder("<")
+
+    start = max(0, min(start, array.shape[0]))
+    stop = array.shape[0] if stop is None else max(start, min(stop, array.shape[0]))
+
+    schema = arrow_schema(array, dtype) if format == "arrow" else None
+
+    async def stream() -> AsyncIterator[bytes]:
+        if schema is not None:
+            yield arrow_header(schema)
+
+        for lo, hi in slice_blocks(start, stop, step, array.chunks[0]):
+            out = np.empty([len(range(lo, hi, step)), *array.shape[1:]], dtype=dtype)
+            block = await sync_to_async(array.read)(lo, hi, step, out)
+            yield arrow_batch(schema, block) if schema is not None else block.data.cast("B")
+
+        if schema is not None:
+            # The end of stream marker
+            yield b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+    response = StreamingHttpResponse(stream(), content_type=ARROW_CONTENT_TYPE if schema is not None else RAW_CONTENT_TYPE)
+    response["X-Dtype"] = dtype.str
+    response["X-Shape"] = ",".join(str(s) for s in [len(range(start, stop, step)), *array.shape[1:]])
+    response["X-Start"] = str(start)
+    response["X-Stop"] = str(stop)
+    response["X-Step"] = str(step)
+    return response
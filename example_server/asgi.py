@@ -9,6 +9,10 @@ django_asgi_app = get_asgi_application()
 
 from .schema import schema  # noqa: E402
 from kante.router import router # noqa: E402
+from core.duck import duck_pool # noqa: E402
+
+# Set up the duckdb connections once, instead of on the first requests
+duck_pool.warm()
 
 
 application = router(
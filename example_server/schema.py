@@ -3,6 +3,7 @@ from typing import AsyncGenerator, List
 import strawberry
 
 from core.datalayer import DatalayerExtension
+from core.loaders import LoadersExtension
 from strawberry import ID as StrawberryID
 from typing import Any, Type
 from core import types, models
@@ -29,6 +30,9 @@ class Query:
     """The root query type"""
     
     test: str = kante.field(resolver=queries.test, description="A simple test query that returns a string")
+    traces_page = kante.field(resolver=queries.traces_page, description="The traces, paginated by a (created_at, id) cursor")
+    rois_page = kante.field(resolver=queries.rois_page, description="The rois, paginated by an id cursor (their created_at changes on update)")
+    simulations_page = kante.field(resolver=queries.simulations_page, description="The simulations, paginated by a (created_at, id) cursor")
     
     
 @strawberry.type
@@ -39,6 +43,10 @@ class Mutation:
         resolver=mutations.create_test_model,
         description="Create a test model instance",
     )
+    create_simulations: list[types.Simulation] = kante.field(
+        resolver=mutations.create_simulations,
+        description="Create many simulations (e.g. of a parameter sweep) in one transaction",
+    )
     
     
 @strawberry.type
@@ -48,6 +56,7 @@ class Subscription:
     rois = strawberry.subscription(resolver=subscriptions.rois, description="Subscribe to real-time ROI updates")
     traces = strawberry.subscription(resolver=subscriptions.traces, description="Subscribe to real-time image updates")
     files = strawberry.subscription(resolver=subscriptions.files, description="Subscribe to real-time file updates")
+    datasets = strawberry.subscription(resolver=subscriptions.datasets, description="Subscribe to real-time updates of the datasets in a dataset")
 
 
 schema = strawberry.Schema(
@@ -59,6 +68,7 @@ schema = strawberry.Schema(
         AuthentikateExtension,
         DjangoOptimizerExtension,
         DatalayerExtension,
+        LoadersExtension,
         DuckExtension,
     ],
     types=[SynapticConnection, Exp2Synapse],
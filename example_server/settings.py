@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from omegaconf import OmegaConf
 
 
@@ -76,6 +77,85 @@ AWS_S3_FILE_OVERWRITE = False
 AWS_QUERYSTRING_EXPIRE = 3600
 AWS_S3_REGION_NAME = conf.s3.get("region", "us-east-1")
 
+# The boto3 clients are shared by the whole process, these configure their
+# connection pool (keep-alive, pool size) and timeouts
+AWS_S3_MAX_POOL_CONNECTIONS = conf.s3.get("max_pool_connections", 50)
+AWS_S3_CONNECT_TIMEOUT = conf.s3.get("connect_timeout", 5)
+AWS_S3_READ_TIMEOUT = conf.s3.get("read_timeout", 60)
+AWS_S3_TCP_KEEPALIVE = conf.s3.get("tcp_keepalive", True)
+AWS_S3_MAX_ATTEMPTS = conf.s3.get("max_attempts", 3)
+
+# Presigned urls are signed per window (in seconds) and cached for the window,
+# every url handed out stays valid for at least one window
+PRESIGNED_URL_WINDOW = conf.s3.get("presigned_url_window", 3600)
+
+# Temporary STS credentials are reused per scope until this many seconds
+# before they expire, and only while this fraction of the requested duration
+# is left
+STS_CREDENTIAL_MARGIN = conf.s3.get("credential_margin", 900)
+STS_CREDENTIAL_MIN_REMAINING = conf.s3.get("credential_min_remaining", 0.5)
+
+# DuckDB connections are pooled and configured once at startup
+DUCKDB_POOL_SIZE = conf.get("duckdb", {}).get("pool_size", 4)
+DUCKDB_CHECKOUT_TIMEOUT = conf.get("duckdb", {}).get("checkout_timeout", 30)
+DUCKDB_MEMORY_LIMIT = conf.get("duckdb", {}).get("memory_limit", "1GB")
+DUCKDB_THREADS = conf.get("duckdb", {}).get("threads", 2)
+DUCKDB_HTTP_KEEP_ALIVE = conf.get("duckdb", {}).get("http_keep_alive", True)
+DUCKDB_HTTP_TIMEOUT = conf.get("duckdb", {}).get("http_timeout", 30)  # seconds
+DUCKDB_HTTP_RETRIES = conf.get("duckdb", {}).get("http_retries", 3)
+DUCKDB_S3_ENDPOINT = f"{conf.s3.host}:{conf.s3.port}"
+DUCKDB_S3_USE_SSL = conf.s3.protocol == "https"
+
+# How many zarr stores are probed concurrently when filling their metadata
+ZARR_PROBE_CONCURRENCY = conf.s3.get("probe_concurrency", 10)
+
+# The number of rows inserted per query by the bulk mutations (e.g. createSimulations)
+BULK_CREATE_BATCH_SIZE = conf.get("bulk", {}).get("batch_size", 1000)
+
+# approximateCount uses the postgres planner estimate, unless it is below this
+# number of rows (then it counts exactly)
+APPROXIMATE_COUNT_THRESHOLD = conf.get("counts", {}).get("approximate_threshold", 100_000)
+
+# Time series of the stats types are cached (in the django cache) until a
+# signal of the model invalidates them, or for this many seconds
+STATS_SERIES_CACHE_TIMEOUT = conf.get("stats", {}).get("series_cache_timeout", 60 * 60)
+
+# Change events carry a snapshot of the changed rows (so subscribers need not
+# read them again), unless one message would carry more than this many rows
+CHANNEL_MAX_SNAPSHOTS = conf.get("channels", {}).get("max_snapshots", 100)
+
+# Every subscription buffers at most this many change events for a slow client,
+# then stops reading from the channel layer
+SUBSCRIPTION_QUEUE_SIZE = conf.get("channels", {}).get("subscription_queue_size", 1000)
+
+# Parsed zarr metadata is cached per store (in process and in the django cache)
+# and revalidated against the ETag of the metadata document after a while
+ZARR_METADATA_CACHE_SIZE = conf.s3.get("metadata_cache_size", 4096)
+ZARR_METADATA_CACHE_TIMEOUT = conf.s3.get("metadata_cache_timeout", 60 * 60 * 24)
+ZARR_METADATA_REVALIDATE = conf.s3.get("metadata_revalidate", 300)
+
+# Min/max pyramids of traces: every level combines FACTOR bins of the previous
+# one, until a level has at most MIN_BINS bins. Levels are chunked in CHUNK bins.
+TRACE_PYRAMID_FACTOR = conf.get("pyramid", {}).get("factor", 16)
+TRACE_PYRAMID_MIN_BINS = conf.get("pyramid", {}).get("min_bins", 1024)
+TRACE_PYRAMID_CHUNK = conf.get("pyramid", {}).get("chunk", 16384)
+TRACE_PYRAMID_WORKERS = conf.get("pyramid", {}).get("workers", 2)
+
+# Server side chunk reads go through a memory (LRU) and a disk (memory mapped)
+# cache, with these byte budgets. A disk budget of 0 disables the disk tier.
+CHUNK_CACHE_MEMORY_BYTES = conf.get("chunk_cache", {}).get("memory_bytes", 256 * 1024 * 1024)
+CHUNK_CACHE_DISK_BYTES = conf.get("chunk_cache", {}).get("disk_bytes", 2 * 1024 * 1024 * 1024)
+CHUNK_CACHE_DISK_PATH = conf.get("chunk_cache", {}).get("disk_path", os.path.join(tempfile.gettempdir(), "chunk-cache"))
+# Chunks that do not exist (sparse arrays) are remembered for this many seconds
+CHUNK_CACHE_MISSING_TIMEOUT = conf.get("chunk_cache", {}).get("missing_timeout", 60)
+
+# The range aggregate index of a trace is stored in chunks of this many tree nodes
+TRACE_RANGE_INDEX_CHUNK = conf.get("pyramid", {}).get("range_index_chunk", 4096)
+
+# Pyramids and range indexes are stored under this prefix of the bucket of the
+# store (per store id), outside of the prefixes the users upload to
+ZARR_DERIVED_PREFIX = conf.get("pyramid", {}).get("derived_prefix", "_derived")
+
 ZARR_BUCKET = conf.s3.buckets.zarr
 PARQUET_BUCKET = conf.s3.buckets.zarr
 FILE_BUCKET = conf.s3.buckets.media
@@ -21,9 +21,12 @@ from kante.path import dynamicpath
 
 from health_check.views import MainView
 from django.views.decorators.csrf import csrf_exempt
+from core.views import metrics_view, trace_slice_view
 
 
 urlpatterns = [
     dynamicpath("admin/", admin.site.urls),
     dynamicpath("ht",  csrf_exempt(MainView.as_view()), name="health_check"),
+    dynamicpath("metrics", metrics_view, name="metrics"),
+    dynamicpath("traces/<str:id>/slice", trace_slice_view, name="trace_slice"),
 ]
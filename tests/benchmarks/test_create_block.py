@@ -0,0 +1,60 @@
+"""Benchmark of create_block with an NWB sized block (10 segments x 128 channels)
+
+Run with ``BENCHMARK=1 pytest tests/benchmarks -s``
+"""
+import json
+import os
+import time
+from types import SimpleNamespace
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core import models
+from core.datalayer import datalayer
+from core.graphql.mutations.block import AnalogSignalChannelInput, AnalogSignalInput, BlockSegmentInput, CreateBlockInput, create_block
+from tests.test_envelope import MockDatalayer
+
+pytestmark = pytest.mark.skipif(not os.environ.get("BENCHMARK"), reason="Set BENCHMARK=1 to run the benchmarks")
+
+SEGMENTS = 10
+CHANNELS = 128
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_block(s3, authenticated_context):
+    s3.create_bucket(Bucket="zarr")
+    zarray = {"zarr_format": 2, "shape": [30000], "chunks": [30000], "dtype": "<f4", "compressor": None}
+    stores = []
+    for i in range(CHANNELS):
+        s3.put_object(Bucket="zarr", Key=f"channel{i}/data/.zarray", Body=json.dumps(zarray))
+        stores.append(models.ZarrStore.objects.create(path=f"s3://zarr/channel{i}", key=f"channel{i}", bucket="zarr"))
+
+    input = CreateBlockInput(
+        name="benchmark",
+        segments=[
+            BlockSegmentInput(
+                analog_signals=[
+                    AnalogSignalInput(
+                        sampling_rate=30000.0,
+                        t_start=float(segment),
+                        channels=[AnalogSignalChannelInput(name=f"channel{i}", index=i, trace=str(store.id)) for i, store in enumerate(stores)],
+                    )
+                ]
+            )
+            for segment in range(SEGMENTS)
+        ],
+    )
+
+    token = datalayer.set(MockDatalayer(s3))
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            block = create_block(SimpleNamespace(context=authenticated_context), input)
+            elapsed = time.perf_counter() - start
+    finally:
+        datalayer.reset(token)
+
+    print(f"\n{SEGMENTS} x {CHANNELS} channels: {elapsed * 1000:.0f} ms, {len(queries)} queries")
+    assert models.AnalogSignalChannel.objects.filter(signal__recording_segment__session=block).count() == SEGMENTS * CHANNELS
+    # The number of queries does not grow with the number of rows
+    assert len(queries) < 50
@@ -0,0 +1,44 @@
+"""Benchmark of the per operation overhead of the datalayer
+
+Run with ``BENCHMARK=1 pytest tests/benchmarks -s``
+"""
+import os
+import time
+import pytest
+from core.datalayer import Datalayer, clients, create_s3_client, create_s3v4_client, create_sts_client
+
+pytestmark = pytest.mark.skipif(not os.environ.get("BENCHMARK"), reason="Set BENCHMARK=1 to run the benchmarks")
+
+OPERATIONS = 50
+
+
+def operation(datalayer: Datalayer) -> None:
+    """What a typical operation touches: signing a url and the sts client"""
+    datalayer.s3.generate_presigned_url(ClientMethod="get_object", Params={"Bucket": "zarr", "Key": "key"})
+    datalayer.s3v4.generate_presigned_url(ClientMethod="get_object", Params={"Bucket": "zarr", "Key": "key"})
+    assert datalayer.sts is not None
+
+
+class UnpooledDatalayer:
+    """The previous behaviour: fresh clients for every operation"""
+
+    def __init__(self) -> None:
+        self.s3 = create_s3_client()
+        self.s3v4 = create_s3v4_client()
+        self.sts = create_sts_client()
+
+
+def test_operation_overhead(aws_credentials):
+    start = time.perf_counter()
+    for _ in range(OPERATIONS):
+        operation(UnpooledDatalayer())
+    before = (time.perf_counter() - start) / OPERATIONS
+
+    clients.reset()
+    start = time.perf_counter()
+    for _ in range(OPERATIONS):
+        operation(Datalayer())
+    after = (time.perf_counter() - start) / OPERATIONS
+
+    print(f"\nper operation: {before * 1000:.2f} ms unpooled, {after * 1000:.2f} ms pooled")
+    assert after < before
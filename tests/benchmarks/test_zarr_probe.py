@@ -0,0 +1,45 @@
+"""Benchmark of the zarr metadata probe against a store with many chunks
+
+Run with ``BENCHMARK=1 pytest tests/benchmarks -s``
+"""
+import json
+import os
+import time
+import pytest
+from core.metadata import probe_zarr_metadata
+
+pytestmark = pytest.mark.skipif(not os.environ.get("BENCHMARK"), reason="Set BENCHMARK=1 to run the benchmarks")
+
+N_CHUNKS = int(os.environ.get("BENCHMARK_CHUNKS", 100_000))
+ROUNDS = 20
+
+
+def list_probe(s3, bucket: str, prefix: str) -> dict:
+    """The previous strategy: list the prefix, then get the metadata"""
+    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
+    for obj in response.get("Contents", []):
+        if obj["Key"].endswith(".zarray"):
+            return json.loads(s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read())
+    raise AssertionError("No metadata found")
+
+
+def test_probe_with_many_chunks(s3):
+    s3.create_bucket(Bucket="zarr")
+    zarray = {"zarr_format": 2, "shape": [N_CHUNKS * 1000], "chunks": [1000], "dtype": "<f4", "compressor": None}
+    s3.put_object(Bucket="zarr", Key="big/data/.zarray", Body=json.dumps(zarray))
+    for i in range(N_CHUNKS):
+        s3.put_object(Bucket="zarr", Key=f"big/data/{i}", Body=b"")
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        list_probe(s3, "zarr", "big")
+    listing = (time.perf_counter() - start) / ROUNDS
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        metadata = probe_zarr_metadata(s3, "zarr", "big")
+    direct = (time.perf_counter() - start) / ROUNDS
+
+    print(f"\n{N_CHUNKS} chunks: listing {listing * 1000:.2f} ms, direct {direct * 1000:.2f} ms per probe")
+    assert metadata.shape == [N_CHUNKS * 1000]
+    assert direct < listing
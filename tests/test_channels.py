@@ -0,0 +1,55 @@
+import json
+
+import pytest
+from authentikate.models import Organization, User
+from core import channels
+from core.models import Trace
+
+
+def test_broadcast_traces_partitions_by_group(monkeypatch):
+    sent = []
+    monkeypatch.setattr(channels.trace_channel, "broadcast", lambda signal, groups: sent.append((groups, signal)))
+
+    channels.broadcast_traces("create", [(1, 10, None), (2, 10, 7), (3, 10, 7), (4, 11, 8)])
+
+    assert sent == [
+        (["organization_traces_10"], channels.TraceSignal(create_many=[1, 2, 3])),
+        (["dataset_images_7"], channels.TraceSignal(create_many=[2, 3])),
+        (["organization_traces_11"], channels.TraceSignal(create=4)),
+        (["dataset_images_8"], channels.TraceSignal(create=4)),
+    ]
+
+
+@pytest.mark.django_db
+def test_snapshot_round_trip():
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    trace = Trace.objects.create(name="trace", kind="REGULAR", t0=1.5, dt=0.1, n=100, creator=user, organization=organization)
+
+    snapshot = channels.snapshot(trace)
+    assert json.loads(json.dumps(snapshot)) == snapshot
+
+    restored = channels.restore(Trace, snapshot)
+    assert (restored.id, restored.name, restored.t0, restored.created_at, restored.organization_id) == (trace.id, "trace", 1.5, trace.created_at, organization.id)
+    assert not restored._state.adding
+
+    # Fields that are not in the snapshot are read from the database
+    partial = channels.restore(Trace, {"id": trace.id, "name": "trace"})
+    assert partial.get_deferred_fields() and partial.n == 100
+
+
+def test_broadcast_files_and_datasets_skip_unfollowed_rows(monkeypatch):
+    sent = []
+    monkeypatch.setattr(channels.file_channel, "broadcast", lambda signal, groups: sent.append((groups, signal)))
+    monkeypatch.setattr(channels.dataset_channel, "broadcast", lambda signal, groups: sent.append((groups, signal)))
+
+    # A move: the old and the new dataset each get one message
+    channels.broadcast_files("update", [(1, 4, 5), (2, 4, 5), (1, 4, 6), (2, 4, 6), (3, None, None)])
+    channels.broadcast_datasets("update", [(8, None), (8, 9)])
+
+    assert sent == [
+        (["organization_files_4"], channels.FileSignal(update_many=[1, 2])),
+        (["dataset_files_5"], channels.FileSignal(update_many=[1, 2])),
+        (["dataset_files_6"], channels.FileSignal(update_many=[1, 2])),
+        (["dataset_children_9"], channels.DatasetSignal(update=8)),
+    ]
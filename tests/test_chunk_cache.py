@@ -0,0 +1,109 @@
+import threading
+import time
+import numpy as np
+import pytest
+from core.arrays import ZarrArray
+from core.chunkcache import ChunkCache, misses, memory_hits, disk_hits
+from core.metadata import get_zarr_metadata, metadata_cache
+from tests.test_envelope import put_trace
+
+
+def test_memory_tier_evicts_to_disk(tmp_path):
+    cache = ChunkCache(memory_bytes=200, disk_bytes=150, disk_path=str(tmp_path))
+
+    for i in range(4):
+        cache.get(("bucket", f"chunk{i}", "etag"), lambda i=i: bytes([i]) * 100)
+
+    # chunk0 and chunk1 were moved to disk, chunk0 was dropped from there again
+    hits = disk_hits.value
+    value = cache.get(("bucket", "chunk1", "etag"), lambda: b"refetched")
+    assert isinstance(value, memoryview)
+    assert bytes(value) == bytes([1]) * 100
+    assert disk_hits.value == hits + 1
+
+    fetched = misses.value
+    assert cache.get(("bucket", "chunk0", "etag"), lambda: b"refetched") == b"refetched"
+    assert misses.value == fetched + 1
+
+    hits = memory_hits.value
+    assert cache.get(("bucket", "chunk3", "etag"), lambda: b"refetched") == bytes([3]) * 100
+    assert memory_hits.value == hits + 1
+
+
+def test_concurrent_reads_fetch_once(tmp_path):
+    cache = ChunkCache(memory_bytes=1000, disk_bytes=0, disk_path=None)
+    fetches = []
+
+    def fetch() -> bytes:
+        fetches.append(1)
+        time.sleep(0.05)
+        return b"chunk"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(("bucket", "chunk", "etag"), fetch))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    assert results == [b"chunk"] * 10
+
+
+def test_array_reads_through_cache(s3, tmp_path):
+    metadata_cache.clear()
+    s3.create_bucket(Bucket="zarr")
+    data = np.arange(1000, dtype="<f4")
+    put_trace(s3, "zarr", "trace", data, chunk=100)
+    cache = ChunkCache(memory_bytes=10_000, disk_bytes=100_000, disk_path=str(tmp_path))
+    array = ZarrArray(s3, "zarr", get_zarr_metadata(s3, "zarr", "trace"), cache)
+
+    np.testing.assert_array_equal(array.read(0, 1000), data)
+
+    reads = []
+    s3.meta.events.register("before-call.s3.GetObject", lambda **kwargs: reads.append(1))
+    np.testing.assert_array_equal(array.read(0, 1000), data)
+    assert reads == []
+
+
+def test_failed_fetches_release_their_flight():
+    cache = ChunkCache(memory_bytes=1000, disk_bytes=0, disk_path=None)
+
+    def fail() -> bytes:
+        raise RuntimeError("unavailable")
+
+    with pytest.raises(RuntimeError):
+        cache.get(("bucket", "chunk", "etag"), fail)
+
+    assert cache._flights == {}
+    assert cache.get(("bucket", "chunk", "etag"), lambda: b"chunk") == b"chunk"
+
+
+def test_missing_chunks_are_remembered():
+    cache = ChunkCache(memory_bytes=1000, disk_bytes=0, disk_path=None, missing_timeout=60)
+    fetches = []
+
+    def fetch() -> None:
+        fetches.append(1)
+        return None
+
+    assert cache.get(("bucket", "chunk", "etag"), fetch) is None
+    assert cache.get(("bucket", "chunk", "etag"), fetch) is None
+    assert len(fetches) == 1
+
+    cache.missing_timeout = 0
+    cache.clear()
+    assert cache.get(("bucket", "chunk", "etag"), fetch) is None
+    assert cache.get(("bucket", "chunk", "etag"), fetch) is None
+    assert len(fetches) == 3
+
+
+def test_disk_directory_is_created_on_first_write(tmp_path):
+    cache = ChunkCache(memory_bytes=10, disk_bytes=1000, disk_path=str(tmp_path))
+    assert not cache.disk_path.exists()
+
+    cache.get(("bucket", "chunk", "etag"), lambda: b"x" * 100)
+    assert cache.disk_path.exists()
+
+    cache.close()
+    assert not cache.disk_path.exists()
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from core import channels
+from core.coalesce import listen_changes
+
+
+class FakeChannel:
+    """Yields the signals put into its queue, and counts how many were taken"""
+
+    def __init__(self) -> None:
+        self.signals: asyncio.Queue = asyncio.Queue()
+        self.taken = 0
+
+    async def listen(self, context, groups):
+        while True:
+            signal = await self.signals.get()
+            self.taken += 1
+            yield signal
+
+
+@pytest.mark.asyncio
+async def test_changes_are_coalesced_within_the_window():
+    channel = FakeChannel()
+    for signal in [
+        channels.TraceSignal(update=1, snapshot={"id": 1, "name": "a"}),
+        channels.TraceSignal(create_many=[2, 3]),
+        channels.TraceSignal(update=1, snapshot={"id": 1, "name": "b"}),
+        channels.TraceSignal(delete=2),
+        channels.TraceSignal(update=3),
+    ]:
+        channel.signals.put_nowait(signal)
+
+    changes = listen_changes(channel, None, ["traces"], coalesce_ms=50)
+    assert await anext(changes) == [("update", 1, {"id": 1, "name": "b"}), ("create", 3, None)]
+
+    channel.signals.put_nowait(channels.TraceSignal(delete=1))
+    assert await anext(changes) == [("delete", 1, None)]
+    await changes.aclose()
+
+
+@pytest.mark.asyncio
+async def test_every_event_is_a_batch_without_window():
+    channel = FakeChannel()
+    channel.signals.put_nowait(channels.TraceSignal(update_many=[1, 2], snapshots=[{"id": 1}, {"id": 2}]))
+    channel.signals.put_nowait(channels.TraceSignal(update=1))
+
+    changes = listen_changes(channel, None, ["traces"])
+    assert await anext(changes) == [("update", 1, {"id": 1}), ("update", 2, {"id": 2})]
+    assert await anext(changes) == [("update", 1, None)]
+    await changes.aclose()
+
+
+@pytest.mark.asyncio
+async def test_slow_consumers_are_not_buffered_without_limit(settings):
+    settings.SUBSCRIPTION_QUEUE_SIZE = 4
+    channel = FakeChannel()
+    for id in range(100):
+        channel.signals.put_nowait(channels.TraceSignal(update=id))
+
+    changes = listen_changes(channel, None, ["traces"])
+    assert await anext(changes) == [("update", 0, None)]
+    await asyncio.sleep(0.05)
+
+    # One handed out, a full queue and one waiting to be put
+    assert channel.taken <= 6
+    await changes.aclose()
@@ -0,0 +1,25 @@
+import pytest
+from authentikate.models import Organization, User
+from core.counts import approximate_count, estimate_count, exact_counts, is_unfiltered
+from core.models import Trace
+
+
+@pytest.mark.django_db
+def test_approximate_count_falls_back_to_exact_count():
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    Trace.objects.bulk_create([Trace(name=f"trace{i}", creator=user, organization=organization) for i in range(12)])
+
+    exact = exact_counts.value
+    assert approximate_count(Trace.objects.all()) == 12
+    assert approximate_count(Trace.objects.filter(name__in=["trace1", "trace2"]), threshold=0) == 2
+    # Without planner estimates (not postgres) the count is exact
+    assert estimate_count(Trace.objects.all()) is None
+    assert exact_counts.value == exact + 2
+
+
+def test_is_unfiltered():
+    assert is_unfiltered(Trace.objects.all())
+    assert is_unfiltered(Trace.objects.order_by("name"))
+    assert not is_unfiltered(Trace.objects.filter(name="trace"))
+    assert not is_unfiltered(Trace.objects.all()[10:20])
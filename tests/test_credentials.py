@@ -0,0 +1,103 @@
+import dataclasses
+import datetime
+import threading
+import boto3
+from moto import mock_aws
+import pytest
+from core.credentials import CredentialCache, CredentialScope
+
+
+@pytest.fixture
+def sts(aws_credentials):
+    with mock_aws():
+        yield boto3.client("sts", region_name="us-east-1")
+
+
+class CountingSTS:
+    def __init__(self, sts):
+        self.sts = sts
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def assume_role(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+        return self.sts.assume_role(**kwargs)
+
+
+def test_credentials_are_reused_per_scope(sts):
+    counting = CountingSTS(sts)
+    cache = CredentialCache(margin=60)
+    scope = CredentialScope(organization="1", user="1", bucket="zarr")
+
+    first = cache.get(counting, scope, duration=3600)
+    second = cache.get(counting, scope, duration=3600)
+    other = cache.get(counting, CredentialScope(organization="2", user="1", bucket="zarr"), duration=3600)
+
+    assert first == second
+    assert other != first
+    assert counting.calls == 2
+
+
+def test_expiring_credentials_are_renewed(sts):
+    counting = CountingSTS(sts)
+    cache = CredentialCache(margin=7200)
+    scope = CredentialScope(organization="1", user="1", bucket="zarr")
+
+    cache.get(counting, scope, duration=3600)
+    cache.get(counting, scope, duration=3600)
+
+    assert counting.calls == 2
+
+
+def test_credentials_are_renewed_when_less_than_half_of_the_duration_is_left(sts):
+    counting = CountingSTS(sts)
+    cache = CredentialCache(margin=60, min_remaining=0.5)
+    scope = CredentialScope(organization="1", user="1", bucket="zarr")
+
+    first = cache.get(counting, scope, duration=3600)
+    assert cache.get(counting, scope, duration=3600) == first
+
+    # Well before the margin, but with less than half of the hour left
+    for key in cache._entries:
+        cache._entries[key] = dataclasses.replace(first, expiration=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=1500))
+    cache.get(counting, scope, duration=3600)
+
+    assert counting.calls == 2
+
+
+def test_concurrent_requests_are_deduplicated(sts):
+    counting = CountingSTS(sts)
+    cache = CredentialCache(margin=60)
+    scope = CredentialScope(organization="1", user="1", bucket="zarr")
+
+    threads = [threading.Thread(target=cache.get, args=(counting, scope, 3600)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counting.calls == 1
+
+
+def test_credentials_are_cached_per_duration(sts):
+    counting = CountingSTS(sts)
+    cache = CredentialCache(margin=60)
+    scope = CredentialScope(organization="1", user="1", bucket="zarr")
+
+    short = cache.get(counting, scope, duration=900)
+    long = cache.get(counting, scope, duration=3600)
+
+    assert short != long
+    assert long.expiration > short.expiration
+    assert counting.calls == 2
+
+
+def test_flights_are_dropped_when_unused(sts):
+    cache = CredentialCache(margin=60)
+    scope = CredentialScope(organization="1", user="1", bucket="zarr")
+
+    cache.get(sts, scope, duration=3600)
+
+    assert cache._flights == {}
+    assert cache._waiting == {}
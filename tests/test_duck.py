@@ -0,0 +1,47 @@
+import duckdb
+import pytest
+from core.duck import DuckLayer, DuckPool
+
+
+def test_pool_reuses_connections():
+    created = []
+
+    def connect():
+        connection = duckdb.connect()
+        created.append(connection)
+        return connection
+
+    pool = DuckPool(size=2, connect=connect, timeout=0.1)
+
+    for _ in range(5):
+        layer = DuckLayer(pool)
+        assert layer.connection.execute("SELECT 42").fetchone() == (42,)
+        layer.close()
+
+    assert len(created) == 1
+
+
+def test_pool_is_bounded():
+    pool = DuckPool(size=1, connect=duckdb.connect, timeout=0.1)
+
+    first = DuckLayer(pool)
+    first.connection
+
+    with pytest.raises(TimeoutError):
+        DuckLayer(pool).connection
+
+    first.close()
+    DuckLayer(pool).connection
+
+
+def test_operations_are_isolated():
+    pool = DuckPool(size=1, connect=duckdb.connect)
+    pool.warm()
+
+    first = DuckLayer(pool)
+    first.with_table(None, "table1")
+    first.close()
+
+    second = DuckLayer(pool)
+    second.with_table(None, "table1")  # would fail if the table leaked
+    second.close()
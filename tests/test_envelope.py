@@ -0,0 +1,153 @@
+import json
+import numcodecs
+import numpy as np
+import pytest
+from django.core.cache import cache
+from core.arrays import ZarrArray
+from core.envelope import build_pyramid, read_envelope
+from core.metadata import get_zarr_metadata, metadata_cache
+from core.models import ZarrStore, ZarrPyramid
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    metadata_cache.clear()
+    cache.clear()
+
+
+class MockDatalayer:
+    def __init__(self, s3):
+        self.s3 = s3
+        self.s3v4 = s3
+        self.chunk_cache = None
+
+
+def put_trace(s3, bucket: str, key: str, data: np.ndarray, chunk: int) -> None:
+    compressor = numcodecs.Zlib(level=1)
+    zarray = {
+        "zarr_format": 2,
+        "shape": list(data.shape),
+        "chunks": [chunk, *data.shape[1:]],
+        "dtype": data.dtype.str,
+        "compressor": compressor.get_config(),
+        "fill_value": 0,
+        "filters": None,
+        "order": "C",
+    }
+    s3.put_object(Bucket=bucket, Key=f"{key}/data/.zarray", Body=json.dumps(zarray))
+    for i, start in enumerate(range(0, len(data), chunk)):
+        block = np.zeros([chunk, *data.shape[1:]], dtype=data.dtype)
+        part = data[start : start + chunk]
+        block[: len(part)] = part
+        index = ".".join(str(j) for j in (i, *[0] * (data.ndim - 1)))
+        s3.put_object(Bucket=bucket, Key=f"{key}/data/{index}", Body=compressor.encode(block))
+
+
+def expected_bounds(data: np.ndarray, start: int, bin_size: int, bins: int) -> tuple[list, list]:
+    values = data.reshape(len(data), -1)
+    mins = [values[start + i * bin_size : start + (i + 1) * bin_size].min() for i in range(bins)]
+    maxs = [values[start + i * bin_size : start + (i + 1) * bin_size].max() for i in range(bins)]
+    return mins, maxs
+
+
+def open_array(s3, bucket: str, key: str) -> ZarrArray:
+    return ZarrArray(s3, bucket, get_zarr_metadata(s3, bucket, key))
+
+
+def test_read_array(s3):
+    s3.create_bucket(Bucket="zarr")
+    data = np.random.default_rng(0).normal(size=(2500, 3)).astype("<f4")
+    put_trace(s3, "zarr", "trace", data, chunk=1000)
+
+    array = open_array(s3, "zarr", "trace")
+
+    np.testing.assert_array_equal(array.read(0, 2500), data)
+    np.testing.assert_array_equal(array.read(950, 2100), data[950:2100])
+
+
+def test_envelope_matches_raw_data(s3):
+    s3.create_bucket(Bucket="zarr")
+    data = np.random.default_rng(1).normal(size=100_003).astype("<f4")
+    put_trace(s3, "zarr", "trace", data, chunk=10_000)
+    array = open_array(s3, "zarr", "trace")
+
+    levels = build_pyramid(array, "trace/pyramid", factor=16, min_bins=64, chunk=1024)
+
+    assert [level.bin_size for level in levels] == [16, 256, 4096]
+    assert levels[-1].bins <= 64
+
+    envelope = read_envelope(array, levels, 0, len(data), max_points=100)
+    assert envelope.level == 2
+    assert len(envelope.min) <= 100
+    assert envelope.min[0] == data[: envelope.bin_size].min()
+    assert min(envelope.min) == data.min()
+    assert max(envelope.max) == data.max()
+
+    envelope = read_envelope(array, levels, 5000, 9000, max_points=50)
+    mins, maxs = expected_bounds(data, envelope.start, envelope.bin_size, len(envelope.min) - 1)
+    assert envelope.start <= 5000 and envelope.stop == 9000
+    np.testing.assert_allclose(envelope.min[:-1], mins)
+    np.testing.assert_allclose(envelope.max[:-1], maxs)
+
+
+def test_short_ranges_read_raw_data(s3):
+    s3.create_bucket(Bucket="zarr")
+    data = np.arange(20_000, dtype="<i2").reshape(10_000, 2)
+    put_trace(s3, "zarr", "trace", data, chunk=4096)
+    array = open_array(s3, "zarr", "trace")
+    levels = build_pyramid(array, "trace/pyramid", factor=16, min_bins=64, chunk=1024)
+
+    envelope = read_envelope(array, levels, 100, 110, max_points=1000)
+
+    assert envelope.level == 0
+    assert envelope.bin_size == 1
+    assert envelope.min == [200 + 2 * i for i in range(10)]
+    assert envelope.max == [201 + 2 * i for i in range(10)]
+
+
+def test_partial_last_bin_stops_at_the_requested_stop(s3):
+    s3.create_bucket(Bucket="zarr")
+    data = np.arange(10_000, dtype="<f4")
+    put_trace(s3, "zarr", "trace", data, chunk=4096)
+    array = open_array(s3, "zarr", "trace")
+    levels = build_pyramid(array, "trace/pyramid", factor=16, min_bins=64, chunk=1024)
+
+    envelope = read_envelope(array, levels, 1000, 2000, max_points=10)
+
+    assert envelope.stop == 2000
+    assert envelope.max[-1] <= 1999
+
+
+def test_envelope_without_pyramid_is_streamed_into_bins(s3):
+    s3.create_bucket(Bucket="zarr")
+    data = np.random.default_rng(2).normal(size=10_000).astype("<f4")
+    put_trace(s3, "zarr", "trace", data, chunk=1000)
+    array = open_array(s3, "zarr", "trace")
+
+    envelope = read_envelope(array, [], 500, 9500, max_points=100)
+
+    assert envelope.level == 0
+    assert envelope.bin_size == 90
+    assert len(envelope.min) == 100
+    mins, maxs = expected_bounds(data, 500, 90, 100)
+    np.testing.assert_allclose(envelope.min, mins)
+    np.testing.assert_allclose(envelope.max, maxs)
+
+
+@pytest.mark.django_db
+def test_store_indexes_are_reused(s3):
+    s3.create_bucket(Bucket="zarr")
+    put_trace(s3, "zarr", "trace", np.ones(5000, dtype="<f8"), chunk=1000)
+    store = ZarrStore.objects.create(path="s3://zarr/trace", key="trace", bucket="zarr")
+    datalayer = MockDatalayer(s3)
+
+    store.build_indexes(datalayer)
+    pyramid = ZarrPyramid.objects.get(store=store)
+    assert pyramid.levels
+    # Derived objects are kept out of the store
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket="zarr", Prefix="trace/")["Contents"]]
+    assert not [key for key in keys if "pyramid" in key or "stats" in key]
+    assert all(level["key"].startswith(f"{store.derived_prefix}/pyramid") for level in pyramid.levels)
+
+    store.build_indexes(datalayer)
+    assert ZarrPyramid.objects.get(store=store).updated_at == pyramid.updated_at
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from authentikate.models import Organization, User
+from core.loaders import Loaders
+from core.models import Trace
+
+
+class CountingLoaders(Loaders):
+    def __init__(self) -> None:
+        super().__init__()
+        self.batches: list[list] = []
+
+    def get(self, key, load):
+        def counting_load(keys):
+            self.batches.append(keys)
+            return load(keys)
+
+        return super().get(key, counting_load)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_pinned_and_tags_are_batched():
+    user = await User.objects.acreate(username="user", sub="1", iss="issuer")
+    organization = await Organization.objects.acreate(slug="org")
+    traces = await Trace.objects.abulk_create([Trace(name=f"trace{i}", creator=user, organization=organization) for i in range(10)])
+    await traces[2].pinned_by.aadd(user)
+    await asyncio.to_thread(traces[5].tags.add, "spiking", "noisy")
+
+    loaders = CountingLoaders()
+    assert loaders.pinned(Trace, user.id) is loaders.pinned(Trace, user.id)
+
+    pinned = await asyncio.gather(*(loaders.pinned(Trace, user.id).load(trace.id) for trace in traces))
+    tags = await asyncio.gather(*(loaders.tags(Trace).load(trace.id) for trace in traces))
+
+    assert pinned == [i == 2 for i in range(10)]
+    assert sorted(tags[5]) == ["noisy", "spiking"] and tags[0] == []
+    assert len(loaders.batches) == 2
@@ -0,0 +1,42 @@
+import asyncio
+import datetime
+
+import pytest
+from authentikate.models import Organization, User
+from strawberry_django.filters import FilterLookup
+from core import enums
+from core.filters import ROIFilter, TraceFilter
+from core.matching import afilter_changes, filter_matches
+from core.models import ROI, Trace
+
+NOW = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+ROW = {"id": 7, "name": "Membrane Potential", "kind": "VOLTAGE", "created_at": NOW, "trace_id": 3}
+
+
+def test_filters_are_matched_in_memory():
+    assert filter_matches(TraceFilter(search="Potential", kind=enums.TraceKindChoices.VOLTAGE), Trace, ROW) is True
+    assert filter_matches(TraceFilter(name=FilterLookup(i_starts_with="membrane"), ids=["7", "8"]), Trace, ROW) is True
+    assert filter_matches(TraceFilter(created_after=NOW + datetime.timedelta(days=1)), Trace, ROW) is False
+    assert filter_matches(TraceFilter(kind=enums.TraceKindChoices.CURRENT), Trace, ROW) is False
+    assert filter_matches(ROIFilter(trace="3", NOT=ROIFilter(ids=["7"])), ROI, ROW) is False
+
+
+def test_filters_spanning_relations_are_undecided():
+    assert filter_matches(TraceFilter(tags=["spiking"]), Trace, ROW) is None
+    assert filter_matches(TraceFilter(kind=enums.TraceKindChoices.VOLTAGE), Trace, {"id": 7}) is None
+    # A field that does not match decides, even if others are undecided
+    assert filter_matches(TraceFilter(tags=["spiking"], search="Current"), Trace, ROW) is False
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_undecided_changes_are_matched_with_one_query():
+    user = await User.objects.acreate(username="user", sub="1", iss="issuer")
+    organization = await Organization.objects.acreate(slug="org")
+    tagged = await Trace.objects.acreate(name="tagged", creator=user, organization=organization)
+    other = await Trace.objects.acreate(name="other", creator=user, organization=organization)
+    await asyncio.to_thread(tagged.tags.add, "spiking")
+
+    changes = [("update", tagged.id, tagged), ("update", other.id, other), ("delete", 99, None)]
+    matched = [(action, id) async for action, id, _ in afilter_changes(TraceFilter(tags=["spiking"]), Trace, changes, None)]
+    assert matched == [("update", tagged.id), ("delete", 99)]
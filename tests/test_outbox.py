@@ -0,0 +1,52 @@
+import pytest
+from authentikate.models import Organization, User
+from django.db import transaction
+from core import channels
+from core.models import Trace
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(channels.trace_channel, "broadcast", lambda signal, groups: sent.append((groups, signal)))
+    return sent
+
+
+@pytest.mark.django_db
+def test_changes_are_published_once_on_commit(sent, django_capture_on_commit_callbacks):
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            traces = [Trace.objects.create(name=f"trace{i}", creator=user, organization=organization) for i in range(500)]
+            traces[0].name = "renamed"
+            traces[0].save()
+            traces[1].delete()
+            assert sent == []
+
+    assert len(sent) == 1
+    groups, signal = sent[0]
+    assert groups == [channels.organization_traces_group(organization.id)]
+    assert signal.create_many == [trace.id for trace in traces if trace.name != "trace1"]
+    assert signal.snapshots is None  # more than CHANNEL_MAX_SNAPSHOTS
+
+
+@pytest.mark.django_db
+def test_rolled_back_changes_are_not_published(sent, django_capture_on_commit_callbacks):
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    Trace.objects.create(name="lost", creator=user, organization=organization)
+                    raise ValueError()
+            except ValueError:
+                pass
+            kept = Trace.objects.create(name="kept", creator=user, organization=organization)
+            kept.name = "renamed"
+            kept.save()
+
+    assert [(signal.create, signal.snapshot["name"]) for _, signal in sent] == [(kept.id, "renamed")]
@@ -0,0 +1,82 @@
+import datetime
+import pytest
+import strawberry
+from authentikate.models import Organization, User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from strawberry_django.ordering import Ordering
+from core.models import ROI, Trace
+from core.pagination import is_descending
+from core.utils import paginate_querysets
+
+
+@pytest.fixture
+def traces(db):
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    traces = Trace.objects.bulk_create([Trace(name=f"trace{i}", creator=user, organization=organization) for i in range(25)])
+    # Some rows share a created_at, the id breaks the tie
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    for i, trace in enumerate(traces):
+        Trace.objects.filter(id=trace.id).update(created_at=start + datetime.timedelta(minutes=i // 3))
+    return list(Trace.objects.order_by("-created_at", "-id"))
+
+
+def walk(*querysets, limit: int, descending: bool = True, timestamp: str | None = "created_at") -> list[list[int]]:
+    pages, cursor = [], None
+    while True:
+        items, cursor = paginate_querysets(*querysets, after=cursor, limit=limit, descending=descending, timestamp=timestamp)
+        pages.append([item.id for item in items])
+        if cursor is None:
+            return pages
+
+
+def test_walk_by_cursor(traces):
+    pages = walk(Trace.objects.all(), limit=10)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == [trace.id for trace in traces]
+    assert sum(walk(Trace.objects.all(), limit=7, descending=False), []) == [trace.id for trace in reversed(traces)]
+
+
+def test_walk_several_querysets_without_counting(traces):
+    first, second = Trace.objects.filter(name__in=["trace0", "trace1", "trace2"]), Trace.objects.exclude(name__in=["trace0", "trace1", "trace2"])
+
+    with CaptureQueriesContext(connection) as queries:
+        pages = walk(first, second, limit=4)
+
+    assert sum(pages, []) == [trace.id for trace in traces if trace.name in ("trace0", "trace1", "trace2")] + [
+        trace.id for trace in traces if trace.name not in ("trace0", "trace1", "trace2")
+    ]
+    assert not any("COUNT(" in query["sql"] for query in queries)
+
+
+def test_invalid_cursor(traces):
+    with pytest.raises(ValueError):
+        paginate_querysets(Trace.objects.all(), after="not a cursor")
+
+
+def test_rois_keyed_on_id_survive_updates(traces):
+    rois = ROI.objects.bulk_create([ROI(trace=traces[0], creator=traces[0].creator) for _ in range(9)])
+    ids = sorted((roi.id for roi in rois), reverse=True)
+
+    items, cursor = paginate_querysets(ROI.objects.all(), limit=4, timestamp=None)
+    # Updating a ROI moves its created_at (auto_now), not its place in the listing
+    ROI.objects.get(id=ids[-1]).save()
+    rest, _ = paginate_querysets(ROI.objects.all(), after=cursor, limit=10, timestamp=None)
+
+    assert [roi.id for roi in items + rest] == ids
+
+
+@strawberry.input
+class Order:
+    created_at: Ordering | None = strawberry.UNSET
+    name: Ordering | None = strawberry.UNSET
+
+
+def test_cursor_pages_are_only_ordered_by_created_at():
+    assert is_descending(None)
+    assert not is_descending(Order(created_at=Ordering.ASC))
+
+    with pytest.raises(ValueError):
+        is_descending(Order(name=Ordering.ASC))
@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from django.core.cache import cache
+from core.datalayer import Datalayer
+from core.presign import presign_urls, expiry_window, presign_hits, presign_misses
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+def test_expiry_window(settings):
+    settings.PRESIGNED_URL_WINDOW = 3600
+
+    index, expires_in, timeout = expiry_window(now=3600 * 10 + 600)
+
+    assert index == 10
+    assert timeout == 3000
+    assert expires_in == 3000 + 3600
+
+
+def test_presign_urls_are_cached(s3):
+    s3.create_bucket(Bucket="media")
+    requests = [("media", f"file{i}", None) for i in range(5)]
+
+    hits, misses = presign_hits.value, presign_misses.value
+    urls = presign_urls(requests + requests[:1])
+    assert len(urls) == 6
+    assert urls[0] == urls[5]
+    assert presign_misses.value == misses + 5
+
+    assert presign_urls(requests) == urls[:5]
+    assert presign_hits.value == hits + 1 + 5
+
+
+def test_loader_batches_requests(s3, monkeypatch):
+    s3.create_bucket(Bucket="media")
+    batches = []
+
+    def record(requests):
+        batches.append(list(requests))
+        return [f"{bucket}/{key}" for bucket, key, host in requests]
+
+    monkeypatch.setattr("core.presign.presign_urls", record)
+    loader = Datalayer().presigned_urls
+
+    async def resolve():
+        return await asyncio.gather(*[loader.load(("media", f"file{i}", None)) for i in range(10)])
+
+    urls = asyncio.run(resolve())
+
+    assert urls == [f"media/file{i}" for i in range(10)]
+    assert len(batches) == 1
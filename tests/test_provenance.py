@@ -0,0 +1,36 @@
+import pytest
+from authentikate.models import Organization, User
+from core.models import Dataset, Trace
+from core.provenance import bulk_create_with_provenance, is_historic, record_history
+from koherent.vars import current_assignation_id
+
+
+@pytest.mark.django_db
+def test_record_history_copies_the_rows():
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    traces = Trace.objects.bulk_create([Trace(name=f"trace{i}", creator=user, organization=organization) for i in range(5)])
+
+    Trace.objects.filter(id__in=[trace.id for trace in traces[:3]]).update(name="renamed")
+    record_history(Trace.objects.filter(name="renamed"), user)
+
+    entries = Trace.provenance.model.objects.filter(history_type="~").order_by("history_relation_id")
+    assert [entry.history_relation_id for entry in entries] == [trace.id for trace in traces[:3]]
+    assert all(entry.name == "renamed" and entry.history_user_id == user.id for entry in entries)
+    assert is_historic(Trace) and is_historic(Dataset)
+
+
+@pytest.mark.django_db
+def test_bulk_created_rows_get_the_assignation_context():
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+
+    token = current_assignation_id.set("assignation-1")
+    try:
+        traces = bulk_create_with_provenance([Trace(name=f"trace{i}", creator=user, organization=organization) for i in range(5)], Trace, user, batch_size=2)
+    finally:
+        current_assignation_id.reset(token)
+
+    entries = Trace.provenance.model.objects.filter(history_type="+").order_by("history_relation_id")
+    assert [entry.history_relation_id for entry in entries] == [trace.id for trace in traces]
+    assert all(entry.history_user_id == user.id and entry.assignation_id == "assignation-1" for entry in entries)
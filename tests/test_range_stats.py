@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from django.core.cache import cache
+from core.metadata import metadata_cache
+from core.models import ZarrStore, ZarrRangeIndex
+from core.rangestats import read_range_stats
+from tests.test_envelope import MockDatalayer, put_trace, open_array
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    metadata_cache.clear()
+    cache.clear()
+
+
+def count_chunk_reads(s3) -> list[str]:
+    keys: list[str] = []
+    s3.meta.events.register("provide-client-params.s3.GetObject", lambda params, **kwargs: keys.append(params["Key"]))
+    return keys
+
+
+@pytest.mark.django_db
+def test_range_stats_match_raw_data(s3):
+    s3.create_bucket(Bucket="zarr")
+    data = np.random.default_rng(2).normal(size=(10_050, 2)).astype("<f4")
+    data[123, 1] = np.nan
+    put_trace(s3, "zarr", "trace", data, chunk=100)
+    store = ZarrStore.objects.create(path="s3://zarr/trace", key="trace", bucket="zarr")
+    store.build_indexes(MockDatalayer(s3))
+
+    array = open_array(s3, "zarr", "trace")
+    index = ZarrRangeIndex.objects.get(store=store).get_index()
+
+    for start, stop in [(0, 10_050), (1234, 4821), (5, 95), (99, 201), (7000, 10_050)]:
+        stats = read_range_stats(array, index, start, stop)
+        values = data[start:stop].astype("<f8")
+
+        assert stats.count == np.count_nonzero(~np.isnan(values))
+        assert stats.nan_count == np.count_nonzero(np.isnan(values))
+        assert stats.min == pytest.approx(np.nanmin(values))
+        assert stats.max == pytest.approx(np.nanmax(values))
+        assert stats.mean == pytest.approx(np.nanmean(values))
+        assert stats.std == pytest.approx(np.nanstd(values), rel=1e-6)
+
+
+@pytest.mark.django_db
+def test_range_stats_only_read_boundary_chunks(s3):
+    s3.create_bucket(Bucket="zarr")
+    put_trace(s3, "zarr", "trace", np.arange(20_000, dtype="<f8"), chunk=100)
+    store = ZarrStore.objects.create(path="s3://zarr/trace", key="trace", bucket="zarr")
+    store.build_indexes(MockDatalayer(s3))
+
+    array = open_array(s3, "zarr", "trace")
+    index = ZarrRangeIndex.objects.get(store=store).get_index()
+
+    reads = count_chunk_reads(s3)
+    stats = read_range_stats(array, index, 1_250, 18_750)
+
+    assert stats.min == 1_250
+    assert stats.max == 18_749
+    assert len([key for key in reads if key.startswith("trace/data/")]) == 2
+    assert len([key for key in reads if key.startswith("trace/stats/")]) <= 2
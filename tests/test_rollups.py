@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+from authentikate.models import Organization, User
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+from core import rollups
+from core.models import StatsRollup, Trace
+
+
+@pytest.fixture
+def spec():
+    spec = rollups.register(Trace, scope="organization", timestamp_fields=["created_at"], fields=["n", "dt", "name"], granularities=["day", "month"])
+    yield spec
+    rollups._specs.pop(Trace)
+
+
+def day_series(queryset):
+    rows = (
+        queryset.annotate(bucket=TruncDay("created_at"))
+        .values("bucket")
+        .annotate(count=Count("pk"), distinctCount=Count("n", distinct=True), max=Max("n"), min=Min("n"), avg=Avg("n"), sum=Sum("n"))
+        .order_by("bucket")
+    )
+    return [{"ts": row.pop("bucket"), **row} for row in rows]
+
+
+def test_bucket_range():
+    value = timezone.make_aware(datetime.datetime(2024, 11, 14, 17, 30))
+    assert bucket_dates(value, "hour") == ("2024-11-14T17", "2024-11-14T18")
+    assert bucket_dates(value, "week") == ("2024-11-11T00", "2024-11-18T00")
+    assert bucket_dates(value, "quarter") == ("2024-10-01T00", "2025-01-01T00")
+    assert bucket_dates(value, "year") == ("2024-01-01T00", "2025-01-01T00")
+
+
+def bucket_dates(value, granularity):
+    return tuple(dt.strftime("%Y-%m-%dT%H") for dt in rollups.bucket_range(value, granularity))
+
+
+@pytest.mark.django_db
+def test_rollups_follow_saves_and_deletes(spec, django_capture_on_commit_callbacks):
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    assert spec.fields == ["n", "dt"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        traces = [Trace.objects.create(name=f"trace{i}", n=i % 4, dt=0.5, creator=user, organization=organization) for i in range(10)]
+    for day, trace in zip([1, 1, 1, 2, 2, 3, 3, 3, 3, 5], traces):
+        Trace.objects.filter(id=trace.id).update(created_at=timezone.make_aware(datetime.datetime(2024, 3, day, 12)))
+    rollups.rebuild(spec)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        moved = Trace.objects.get(id=traces[0].id)
+        moved.created_at = timezone.make_aware(datetime.datetime(2024, 4, 1, 8))
+        moved.save()
+        Trace.objects.get(id=traces[5].id).delete()
+
+    series = rollups.read_series(spec, organization.id, "n", "created_at", "day")
+    assert series == day_series(Trace.objects.filter(organization=organization))
+    assert [row["count"] for row in rollups.read_series(spec, organization.id, "dt", "created_at", "month")] == [8, 1]
+    assert rollups.read_series(spec, organization.id, "n", "created_at", "hour") is None
+    assert StatsRollup.objects.filter(granularity="day").count() == 5
+
+
+@pytest.mark.django_db
+def test_cached_series_is_invalidated_by_signals(spec, django_capture_on_commit_callbacks):
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    queryset = Trace.objects.filter(organization=organization)
+
+    def series():
+        return rollups.cached_series(spec, organization.id, str(queryset.query), lambda: day_series(queryset))
+
+    assert series() == []
+    with django_capture_on_commit_callbacks(execute=True):
+        Trace.objects.create(name="trace", n=3, creator=user, organization=organization)
+    assert series() == series() == day_series(queryset)
+    assert series()[0]["count"] == 1
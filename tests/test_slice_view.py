@@ -0,0 +1,89 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+from asgiref.sync import sync_to_async
+from authentikate.models import Organization, User
+from django.core.cache import cache
+from django.test import AsyncRequestFactory
+from core.datalayer import datalayer
+from core.metadata import metadata_cache
+from core.models import Trace, ZarrStore
+from core.views import metrics_view, trace_slice_view
+from tests.test_envelope import MockDatalayer, put_trace
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    metadata_cache.clear()
+    cache.clear()
+
+
+@pytest.fixture
+def trace_data(s3, db):
+    s3.create_bucket(Bucket="zarr")
+    data = np.arange(3000, dtype="<f4").reshape(1000, 3)
+    put_trace(s3, "zarr", "trace", data, chunk=128)
+
+    user = User.objects.create(username="static_user", sub="1", iss="static_issuer")
+    organization = Organization.objects.create(slug="static_org")
+    store = ZarrStore.objects.create(path="s3://zarr/trace", key="trace", bucket="zarr", dtype="<f4", shape=[1000, 3])
+    trace = Trace.objects.create(store=store, creator=user, organization=organization)
+
+    token = datalayer.set(MockDatalayer(s3))
+    yield trace, data
+    datalayer.reset(token)
+
+
+async def get_slice(trace_id: str, **params) -> tuple:
+    request = AsyncRequestFactory().get(f"/traces/{trace_id}/slice", params, headers={"Authorization": "Bearer test"})
+    response = await trace_slice_view(request, id=trace_id)
+    if response.status_code != 200:
+        return response, None
+    return response, b"".join([chunk async for chunk in response.streaming_content])
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_raw_slice(trace_data):
+    trace, data = trace_data
+
+    response, body = await get_slice(str(trace.id), start=100, stop=900, step=3)
+
+    assert response["X-Dtype"] == "<f4"
+    assert response["X-Shape"] == "267,3"
+    np.testing.assert_array_equal(np.frombuffer(body, dtype="<f4").reshape(-1, 3), data[100:900:3])
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_arrow_slice(trace_data):
+    trace, data = trace_data
+
+    response, body = await get_slice(str(trace.id), start=0, stop=1000, format="arrow")
+
+    table = pa.ipc.open_stream(body).read_all()
+    assert response["Content-Type"] == "application/vnd.apache.arrow.stream"
+    np.testing.assert_array_equal(np.stack(table.column("data").to_numpy(zero_copy_only=False)), data)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slice_requires_authentication(trace_data):
+    trace, _ = trace_data
+
+    request = AsyncRequestFactory().get(f"/traces/{trace.id}/slice")
+    response = await trace_slice_view(request, id=str(trace.id))
+    assert response.status_code == 401
+
+    response, _ = await get_slice("999999")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_metrics_require_authentication(trace_data):
+    response = await metrics_view(AsyncRequestFactory().get("/metrics"))
+    assert response.status_code == 401
+
+    response = await metrics_view(AsyncRequestFactory().get("/metrics", headers={"Authorization": "Bearer test"}))
+    assert response.status_code == 200
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from authentikate.models import Organization, User
+from core import enums
+from core.models import Trace
+from core.timeaxis import RegularTimeAxis
+from tests.test_slice_view import get_slice
+
+
+def test_read_matches_stored_axis():
+    axis = RegularTimeAxis(t0=5.0, dt=0.1, n=1000)
+    expected = 5.0 + np.arange(1000) * 0.1
+
+    np.testing.assert_allclose(axis.read(100, 900, 3), expected[100:900:3])
+    assert axis.time_at(10) == pytest.approx(6.0)
+    assert axis.index_at(6.04) == 10
+    assert axis.index_at(-100) == 0
+    assert axis.index_at(1e9) == 999
+
+
+@pytest.mark.parametrize("duration, dt, n", [(1.0, 0.1, 11), (100.0, 0.025, 4001), (0.3, 0.1, 4), (1.05, 0.1, 11), (10.0, 1.0, 11)])
+def test_spanning_axis_keeps_the_last_sample(duration, dt, n):
+    axis = RegularTimeAxis.spanning(duration, dt)
+
+    assert axis.n == n
+    assert axis.time_at(axis.n - 1) <= duration + 1e-9
+
+
+def test_envelope_and_range_stats():
+    axis = RegularTimeAxis(t0=-2.0, dt=-0.5, n=10001)
+    expected = -2.0 - np.arange(10001) * 0.5
+
+    envelope = axis.envelope(0, 10001, 100)
+    bins = [expected[i : i + envelope.bin_size] for i in range(0, 10001, envelope.bin_size)]
+    assert len(envelope.min) <= 100
+    np.testing.assert_allclose(envelope.min, [b.min() for b in bins])
+    np.testing.assert_allclose(envelope.max, [b.max() for b in bins])
+
+    stats = axis.range_stats(17, 9000)
+    values = expected[17:9000]
+    assert stats.count == len(values)
+    assert stats.min == pytest.approx(values.min())
+    assert stats.max == pytest.approx(values.max())
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.std == pytest.approx(values.std())
+
+    assert axis.range_stats(20, 10).count == 0
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_slice_regular_trace():
+    user = await User.objects.acreate(username="static_user", sub="1", iss="static_issuer")
+    organization = await Organization.objects.acreate(slug="static_org")
+    trace = await Trace.objects.acreate(kind=enums.TraceKindChoices.REGULAR, t0=1.0, dt=0.25, n=200000, creator=user, organization=organization)
+
+    response, body = await get_slice(str(trace.id), start=10, stop=150000, step=7)
+
+    assert response["X-Dtype"] == "<f8"
+    np.testing.assert_allclose(np.frombuffer(body, dtype="<f8"), 1.0 + np.arange(10, 150000, 7) * 0.25)
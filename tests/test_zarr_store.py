@@ -0,0 +1,230 @@
+import json
+import pytest
+from authentikate.models import Organization, User
+from core.models import Trace, ZarrStore
+from core.metadata import probe_zarr_metadata, ZarrMetadataNotFound, metadata_cache, cache_hits
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    metadata_cache.clear()
+    cache.clear()
+
+
+class MockDatalayer:
+    def __init__(self, s3):
+        self.s3 = s3
+        self.s3v4 = s3
+
+
+def create_zarr_v2(s3, bucket: str, key: str, shape: list[int], chunks: list[int]) -> ZarrStore:
+    zarray = {
+        "zarr_format": 2,
+        "shape": shape,
+        "chunks": chunks,
+        "dtype": "<f4",
+        "compressor": None,
+        "fill_value": 0,
+        "filters": None,
+        "order": "C",
+    }
+    s3.put_object(Bucket=bucket, Key=f"{key}/data/.zarray", Body=json.dumps(zarray))
+    return ZarrStore.objects.create(path=f"s3://{bucket}/{key}", key=key, bucket=bucket)
+
+
+@pytest.mark.django_db
+def test_fill_info_many(s3):
+    s3.create_bucket(Bucket="zarr")
+
+    stores = [create_zarr_v2(s3, "zarr", f"store{i}", [100 * (i + 1)], [100]) for i in range(20)]
+
+    ZarrStore.fill_info_many(stores + stores[:2], MockDatalayer(s3))
+
+    for i, store in enumerate(stores):
+        store.refresh_from_db()
+        assert store.populated
+        assert store.shape == [100 * (i + 1)]
+        assert store.chunks == [100]
+        assert store.dtype == "<f4"
+
+
+@pytest.mark.django_db
+def test_get_filled_raises_for_missing_store(s3):
+    s3.create_bucket(Bucket="zarr")
+    store = create_zarr_v2(s3, "zarr", "store", [10], [10])
+
+    with pytest.raises(ZarrStore.DoesNotExist):
+        ZarrStore.objects.get_filled([str(store.id), "999999"], MockDatalayer(s3))
+
+    filled = ZarrStore.objects.get_filled([str(store.id)], MockDatalayer(s3))
+    assert filled[str(store.id)].shape == [10]
+
+
+def count_calls(s3) -> dict[str, int]:
+    calls: dict[str, int] = {}
+
+    def count(event_name: str, **kwargs) -> None:
+        operation = event_name.split(".")[-1]
+        calls[operation] = calls.get(operation, 0) + 1
+
+    s3.meta.events.register("before-call.s3.*", count)
+    return calls
+
+
+def test_probe_reads_metadata_without_listing(s3):
+    s3.create_bucket(Bucket="zarr")
+    zarr_json = {
+        "zarr_format": 3,
+        "node_type": "array",
+        "shape": [1000],
+        "data_type": "float32",
+        "chunk_grid": {"name": "regular", "configuration": {"chunk_shape": [100]}},
+    }
+    s3.put_object(Bucket="zarr", Key="v3/zarr.json", Body=json.dumps(zarr_json))
+    for i in range(10):
+        s3.put_object(Bucket="zarr", Key=f"v3/c/{i}", Body=b"chunk")
+
+    calls = count_calls(s3)
+    metadata = probe_zarr_metadata(s3, "zarr", "v3")
+
+    assert metadata.version == "3"
+    assert metadata.shape == [1000]
+    assert metadata.chunks == [100]
+    assert "ListObjectsV2" not in calls
+
+
+def test_probe_reads_consolidated_metadata(s3):
+    s3.create_bucket(Bucket="zarr")
+    zmetadata = {
+        "zarr_consolidated_format": 1,
+        "metadata": {
+            ".zgroup": {"zarr_format": 2},
+            "data/.zarray": {"zarr_format": 2, "shape": [50], "chunks": [10], "dtype": "<i2"},
+        },
+    }
+    s3.put_object(Bucket="zarr", Key="consolidated/.zmetadata", Body=json.dumps(zmetadata))
+
+    metadata = probe_zarr_metadata(s3, "zarr", "consolidated")
+
+    assert metadata.version == "2"
+    assert metadata.shape == [50]
+    assert metadata.dtype == "<i2"
+
+
+def test_probe_falls_back_to_listing(s3):
+    s3.create_bucket(Bucket="zarr")
+    zarr_json = {"zarr_format": 3, "node_type": "array", "shape": [7], "data_type": "int8"}
+    s3.put_object(Bucket="zarr", Key="nested/group/zarr.json", Body=json.dumps(zarr_json))
+
+    assert probe_zarr_metadata(s3, "zarr", "nested").shape == [7]
+
+    with pytest.raises(ZarrMetadataNotFound):
+        probe_zarr_metadata(s3, "zarr", "missing")
+
+
+@pytest.mark.django_db
+def test_repeated_fill_info_uses_cache(s3):
+    s3.create_bucket(Bucket="zarr")
+    store = create_zarr_v2(s3, "zarr", "cached", [30], [10])
+    datalayer = MockDatalayer(s3)
+
+    store.fill_info(datalayer)
+
+    calls = count_calls(s3)
+    hits = cache_hits.value
+    store.fill_info(datalayer)
+
+    assert calls == {}
+    assert cache_hits.value == hits + 1
+
+
+@pytest.mark.django_db
+def test_stale_cache_entry_is_revalidated(s3, settings):
+    settings.ZARR_METADATA_REVALIDATE = 0
+    s3.create_bucket(Bucket="zarr")
+    store = create_zarr_v2(s3, "zarr", "stale", [30], [10])
+    datalayer = MockDatalayer(s3)
+
+    store.fill_info(datalayer)
+
+    calls = count_calls(s3)
+    store.fill_info(datalayer)
+    assert calls == {"HeadObject": 1}
+    assert store.shape == [30]
+
+    s3.put_object(Bucket="zarr", Key="stale/data/.zarray", Body=json.dumps({"shape": [60], "chunks": [10], "dtype": "<f4"}))
+    store.fill_info(datalayer)
+    assert store.shape == [60]
+
+
+@pytest.mark.django_db
+def test_fill_info_does_not_list_the_store(s3):
+    s3.create_bucket(Bucket="zarr")
+    store = create_zarr_v2(s3, "zarr", "unlisted", [30], [10])
+    s3.put_object(Bucket="zarr", Key="unlisted/data/0", Body=b"chunk")
+
+    calls = count_calls(s3)
+    store.read_info(s3)
+
+    assert "ListObjectsV2" not in calls
+    assert store.content_hash is None
+
+
+@pytest.mark.django_db
+def test_duplicates_become_aliases_of_the_older_store(s3):
+    s3.create_bucket(Bucket="zarr")
+    first, second, other = (create_zarr_v2(s3, "zarr", key, [30], [10]) for key in ("first", "second", "other"))
+    for store in (first, second):
+        s3.put_object(Bucket="zarr", Key=f"{store.key}/data/0", Body=b"chunk")
+    s3.put_object(Bucket="zarr", Key="other/data/0", Body=b"other")
+
+    datalayer = MockDatalayer(s3)
+    ZarrStore.fill_info_many([first, second, other], datalayer)
+
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    for store in (first, second, other):
+        Trace.objects.create(store=store, creator=user, organization=organization)
+
+    assert first.deduplicate(datalayer).id == first.id
+    assert other.deduplicate(datalayer).id == other.id
+    assert second.deduplicate(datalayer).id == first.id
+
+    assert first.content_hash.startswith("etags-sha256:") and first.content_hash != other.content_hash
+    assert ZarrStore.objects.get(id=second.id).canonical_id == first.id
+    assert Trace.objects.filter(store=first).count() == 2
+    # Objects are only removed by an explicit collection
+    assert "Contents" in s3.list_objects_v2(Bucket="zarr", Prefix="second/")
+
+    filled = ZarrStore.objects.get_filled([str(first.id), str(second.id), str(other.id)], datalayer, organization)
+    assert filled[str(first.id)].id == first.id
+    assert filled[str(second.id)].id == first.id
+    assert filled[str(other.id)].id == other.id
+
+    assert [store.id for store in ZarrStore.objects.collect_aliases(datalayer)] == [second.id]
+    assert "Contents" not in s3.list_objects_v2(Bucket="zarr", Prefix="second/")
+    assert ZarrStore.objects.get_filled([str(second.id)], datalayer)[str(second.id)].id == first.id
+
+    assert ZarrStore.objects.find_duplicate(first.content_hash, organization).id == first.id
+    assert ZarrStore.objects.find_duplicate(first.content_hash, Organization.objects.create(slug="another")) is None
+
+
+@pytest.mark.django_db
+def test_only_computed_hashes_are_matched(s3):
+    s3.create_bucket(Bucket="zarr")
+    first, second = (create_zarr_v2(s3, "zarr", key, [30], [10]) for key in ("first", "second"))
+    s3.put_object(Bucket="zarr", Key="second/data/0", Body=b"different")
+
+    datalayer = MockDatalayer(s3)
+    user = User.objects.create(username="user", sub="1", iss="issuer")
+    organization = Organization.objects.create(slug="org")
+    for store in (first, second):
+        Trace.objects.create(store=store, creator=user, organization=organization)
+
+    ZarrStore.fill_info_many([first, second], datalayer)
+    first.deduplicate(datalayer)
+
+    assert second.deduplicate(datalayer).id == second.id
+    # Hashes in other namespaces (e.g. computed by a client) never match
+    assert ZarrStore.objects.find_duplicate("sha256:claimed", organization) is None